@@ -1,11 +1,13 @@
+import threading
+import time
+from collections import deque
 from datetime import UTC, datetime
 
 from bson.objectid import ObjectId
 from pymongo import DESCENDING
-from pymongo.errors import OperationFailure
+from pymongo.errors import BulkWriteError, OperationFailure, PyMongoError
 from vtjson import ValidationError, validate
 
-from fishtest.lru_cache import lru_cache
 from fishtest.schemas import ACTION_MESSAGE_SIZE, action_schema
 from fishtest.util import hex_print, worker_name
 
@@ -16,14 +18,123 @@ def run_name(run):
     return run[:23] + "-" + hex_print(run_id)[0:7]
 
 
+# Once the writer is started, actions are queued and written in batches
+# by a background thread. When the queue is full new actions are dropped.
+ACTION_QUEUE_SIZE = 20000
+ACTION_BATCH_SIZE = 1000
+ACTION_FLUSH_INTERVAL = 1.0
+
+# The set of usernames is maintained incrementally, but it is reloaded
+# from time to time to pick up the actions written by other instances.
+ACTION_USERNAMES_EXPIRATION = 600.0
+
+
 class ActionDb:
     def __init__(self, db):
         self.db = db
         self.actions = self.db["actions"]
 
-    @lru_cache(maxsize=1, expiration=30, refresh=False)
+        self.queue = deque()
+        self.queue_lock = threading.Lock()
+        # Serializes the writes, so that actions are written in order.
+        self.flush_lock = threading.Lock()
+        self.queue_event = threading.Event()
+        self.writer = None
+        self.writer_stopped = False
+        self.written_actions = 0
+        self.dropped_actions = 0
+
+        self.usernames_lock = threading.Lock()
+        self.usernames = None
+        self.sorted_usernames = None
+        self.usernames_time = 0.0
+
+    def start_writer(self):
+        if self.writer is not None:
+            return
+        self.writer_stopped = False
+        self.writer = threading.Thread(
+            target=self.__write_actions, name="ActionDb.writer", daemon=True
+        )
+        self.writer.start()
+
+    def stop_writer(self):
+        writer = self.writer
+        if writer is None:
+            return
+        self.writer_stopped = True
+        self.queue_event.set()
+        writer.join()
+        self.writer = None
+        # Actions inserted while the writer was stopping.
+        self.flush()
+
+    def __write_actions(self):
+        while not self.writer_stopped:
+            self.queue_event.wait(ACTION_FLUSH_INTERVAL)
+            self.queue_event.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"ActionDb.writer: unexpected exception: {e}", flush=True)
+        self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            while True:
+                with self.queue_lock:
+                    count = min(len(self.queue), ACTION_BATCH_SIZE)
+                    batch = [self.queue.popleft() for _ in range(count)]
+                if not batch:
+                    return
+                try:
+                    self.actions.insert_many(batch, ordered=False)
+                    written = len(batch)
+                except BulkWriteError as e:
+                    written = e.details.get("nInserted", 0)
+                    print(f"ActionDb.flush: insert_many failed: {e}", flush=True)
+                except PyMongoError as e:
+                    written = 0
+                    print(f"ActionDb.flush: insert_many failed: {e}", flush=True)
+                with self.queue_lock:
+                    self.written_actions += written
+                    self.dropped_actions += len(batch) - written
+
+    def queue_stats(self):
+        with self.queue_lock:
+            return {
+                "queued": len(self.queue),
+                "written": self.written_actions,
+                "dropped": self.dropped_actions,
+            }
+
+    def refresh_action_usernames(self):
+        usernames = set(self.actions.distinct("username"))
+        with self.queue_lock:
+            usernames.update(action["username"] for action in self.queue)
+        with self.usernames_lock:
+            self.usernames = usernames
+            self.sorted_usernames = None
+            self.usernames_time = time.monotonic()
+
     def get_action_usernames(self):
-        return sorted(self.actions.distinct("username"), key=str.lower)
+        with self.usernames_lock:
+            expired = (
+                self.usernames is None
+                or time.monotonic() - self.usernames_time > ACTION_USERNAMES_EXPIRATION
+            )
+        if expired:
+            self.refresh_action_usernames()
+        with self.usernames_lock:
+            if self.sorted_usernames is None:
+                self.sorted_usernames = sorted(self.usernames, key=str.lower)
+            return self.sorted_usernames
+
+    def __add_username(self, username):
+        with self.usernames_lock:
+            if self.usernames is not None and username not in self.usernames:
+                self.usernames.add(username)
+                self.sorted_usernames = None
 
     def get_actions(
         self,
@@ -37,6 +148,10 @@ class ActionDb:
         run_id=None,
         max_count=None,
     ):
+        # Make the queued actions visible.
+        if self.queue:
+            self.flush()
+
         q = {}
         if action:
             # update_stats is no longer used, but included for backward compatibility
@@ -317,5 +432,22 @@ class ActionDb:
                 message=message,
             )
             return
-        self.actions.insert_one(action)
-        self.get_action_usernames.cache_clear()
+        self.__add_username(action["username"])
+        if self.writer is None:
+            self.actions.insert_one(action)
+            return
+        with self.queue_lock:
+            if len(self.queue) >= ACTION_QUEUE_SIZE:
+                self.dropped_actions += 1
+                dropped = self.dropped_actions
+            else:
+                self.queue.append(action)
+                dropped = 0
+                if len(self.queue) >= ACTION_BATCH_SIZE:
+                    self.queue_event.set()
+        # Do not flood the log when the database cannot keep up.
+        if dropped > 0 and dropped & (dropped - 1) == 0:
+            print(
+                f"ActionDb.insert_action: queue full, {dropped} actions dropped",
+                flush=True,
+            )
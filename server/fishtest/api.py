@@ -13,12 +13,23 @@ from starlette.responses import JSONResponse, RedirectResponse, StreamingRespons
 from vtjson import ValidationError, validate
 
 import fishtest.github_api as gh
-from fishtest.http.boundary import ApiRequestShim, get_request_shim
-from fishtest.schemas import api_access_schema, api_schema, gzip_data
-from fishtest.stats.stat_util import SPRT_elo, get_elo
+from fishtest.api_validation import validate_api_access, validate_api_request
+from fishtest.http.boundary import (
+    ApiRequestShim,
+    get_header_request_shim,
+    get_request_shim,
+    read_gzip_body,
+)
+from fishtest.http.conditional import conditional_get_stats
+from fishtest.http.settings import (
+    PGN_UPLOAD_MAX_BYTES,
+    PGN_UPLOAD_MAX_DECOMPRESSED_BYTES,
+)
+from fishtest.schemas import gzip_data
+from fishtest.stats.stat_util import SPRT_elo_cached, get_elo
 from fishtest.util import strip_run, worker_name
 
-WORKER_VERSION = 325
+WORKER_VERSION = 332
 
 WORKER_API_PATHS = {
     "/api/request_version",
@@ -29,12 +40,16 @@ WORKER_API_PATHS = {
     "/api/failed_task",
     "/api/stop_run",
     "/api/upload_pgn",
+    "/api/upload_pgn_stream",
     "/api/worker_log",
 }
 
-# Primary-only worker endpoints exclude upload_pgn, which is routed to a
-# non-primary backend for single-instance handling.
-PRIMARY_ONLY_WORKER_API_PATHS = WORKER_API_PATHS - {"/api/upload_pgn"}
+# Primary-only worker endpoints exclude the pgn uploads, which are routed to
+# a non-primary backend for single-instance handling.
+PRIMARY_ONLY_WORKER_API_PATHS = WORKER_API_PATHS - {
+    "/api/upload_pgn",
+    "/api/upload_pgn_stream",
+}
 
 router = APIRouter(tags=["api"])
 
@@ -89,7 +104,7 @@ class WorkerApi(GenericApi):
     def validate_username_password(self):
         # Is the request syntactically correct?
         try:
-            validate(api_access_schema, self.request_body, "request")
+            validate_api_access(self.request_body, "request")
         except ValidationError as e:
             self.handle_error(str(e))
 
@@ -116,7 +131,7 @@ class WorkerApi(GenericApi):
 
         # Is the request syntactically correct?
         try:
-            validate(api_schema, self.request_body, "request")
+            validate_api_request(self.request_body, "request")
         except ValidationError as e:
             self.handle_error(str(e))
 
@@ -223,7 +238,7 @@ class WorkerApi(GenericApi):
         task = run["tasks"][result["task_id"]]
         min_task = {"num_games": task["num_games"], "start": task["start"]}
         if "stats" in task:
-            min_task["stats"] = task["stats"]
+            min_task["stats"] = dict(task["stats"])
 
         # Add book checksum
         args = copy.copy(run["args"])
@@ -284,6 +299,15 @@ class WorkerApi(GenericApi):
         )
         return self.add_time(result)
 
+    def upload_pgn_stream(self, pgn_zip):
+        # The request has been validated before the body was read, and
+        # pgn_zip has been checked to be a complete gzip stream.
+        result = self.request.rundb.upload_pgn(
+            run_id=f"{self.run_id()}-{self.task_id()}",
+            pgn_zip=pgn_zip,
+        )
+        return self.add_time(result)
+
     def stop_run(self):
         self.validate_request()
         error = ""
@@ -325,7 +349,10 @@ class WorkerApi(GenericApi):
         with self.request.rundb.active_run_lock(self.run_id()):
             if task["active"]:
                 task["last_updated"] = datetime.now(UTC)
-                self.request.rundb.buffer(run)
+                self.request.rundb.task_deadlines.refresh(
+                    self.run_id(), self.task_id(), task["last_updated"]
+                )
+                self.request.rundb.buffer(run, task_ids=(self.task_id(),))
             return self.add_time({"task_alive": task["active"]})
 
     def request_spsa(self):
@@ -341,6 +368,13 @@ class UserApi(GenericApi):
     def rate_limit(self):
         return gh.rate_limit()
 
+    def server_stats(self):
+        # The counters of the instance which serves the request.
+        return {
+            "conditional_gets": conditional_get_stats.snapshot(),
+            "action_log": self.request.rundb.actiondb.queue_stats(),
+        }
+
     def active_runs(self):
         runs = self.request.rundb.runs.find(
             {"finished": False},
@@ -471,7 +505,7 @@ class UserApi(GenericApi):
         elo0 = sprt["elo0"]
         elo1 = sprt["elo1"]
         sprt["elo_model"] = elo_model
-        a = SPRT_elo(
+        a = SPRT_elo_cached(
             results,
             alpha=alpha,
             beta=beta,
@@ -576,7 +610,7 @@ class UserApi(GenericApi):
         elo1 = float(elo1)
         alpha = 0.05
         beta = 0.05
-        return SPRT_elo(
+        return SPRT_elo_cached(
             results,
             alpha=alpha,
             beta=beta,
@@ -609,15 +643,17 @@ class UserApi(GenericApi):
         if not match:
             self.handle_error(f"Invalid filename format for {pgns_name}")
         run_id = match.group(1)
-        pgns_reader, total_size = self.request.rundb.get_run_pgns(run_id)
-        if pgns_reader is None:
+        pgns, total_size = self.request.rundb.get_run_pgns(run_id)
+        if pgns is None:
             self.handle_error(f"No data found for {pgns_name}", status_code=404)
         headers = {
             "Content-Disposition": f'attachment; filename="{pgns_name}"',
             "Content-Length": str(total_size),
         }
+        # The pgn.gz files are sent as they are: concatenated gzip
+        # members form a valid gzip file.
         return StreamingResponse(
-            iterate_in_threadpool(_iter_filelike(pgns_reader)),
+            iterate_in_threadpool(pgns),
             media_type="application/gzip",
             headers=headers,
         )
@@ -690,12 +726,36 @@ async def api_upload_pgn(request: Request):
     return await run_in_threadpool(api.upload_pgn)
 
 
+@router.post("/api/upload_pgn_stream")
+async def api_upload_pgn_stream(request: Request):
+    # The body is the gzip compressed pgn, the json request is in the
+    # X-Fishtest-Request header. The credentials are checked before the
+    # body is read.
+    api = WorkerApi(get_header_request_shim(request))
+    await run_in_threadpool(api.validate_request)
+    try:
+        pgn_zip = await read_gzip_body(
+            request,
+            max_bytes=PGN_UPLOAD_MAX_BYTES,
+            max_decompressed_bytes=PGN_UPLOAD_MAX_DECOMPRESSED_BYTES,
+        )
+    except ValueError as e:
+        api.handle_error(f"pgn: {e}")
+    return await run_in_threadpool(api.upload_pgn_stream, pgn_zip)
+
+
 @router.get("/api/rate_limit")
 async def api_rate_limit(request: Request):
     api = UserApi(ApiRequestShim(request))
     return await run_in_threadpool(api.rate_limit)
 
 
+@router.get("/api/server_stats")
+async def api_server_stats(request: Request):
+    api = UserApi(ApiRequestShim(request))
+    return await run_in_threadpool(api.server_stats)
+
+
 @router.get("/api/active_runs")
 async def api_active_runs(request: Request):
     api = UserApi(ApiRequestShim(request))
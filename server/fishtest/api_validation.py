@@ -0,0 +1,197 @@
+"""
+Fast path validation of the worker API requests.
+
+WorkerApi validates every request against api_access_schema and
+api_schema. vtjson.validate() compiles the schema at each call, which is a
+measurable part of the cost of a request on the primary. The validators
+below are built once from small specialised closures and accept the same
+valid requests, at a fraction of the cost.
+
+They are conservative: a request which they do not accept is validated
+with the vtjson schemas (compiled once), which raise the usual
+ValidationError, or accept the request, e.g. for a legacy username.
+Hence the error messages are those of the schemas, and a fast validator
+must never accept a request which the schema rejects. This is checked by
+tests/test_api_validation.py.
+"""
+
+import re
+
+from bson.objectid import ObjectId
+from vtjson import compile as compile_schema
+from vtjson import validate
+
+from fishtest.constants import (
+    VALID_USERNAME_PATTERN,
+    supported_arches,
+    supported_compilers,
+)
+from fishtest.schemas import (
+    UUID_PATTERN,
+    api_access_schema,
+    api_schema,
+    valid_results,
+    valid_spsa_results,
+)
+
+
+def _type(type_):
+    return lambda x: type(x) is type_
+
+
+def _uint(x):
+    return type(x) is int and x >= 0
+
+
+def _suint(x):
+    return type(x) is int and x > 0
+
+
+def _unumber(x):
+    return type(x) is float and x >= 0
+
+
+def _even_uint(x):
+    return type(x) is int and x >= 0 and x % 2 == 0
+
+
+def _run_id(x):
+    return type(x) is str and ObjectId.is_valid(x)
+
+
+def _regex(pattern):
+    fullmatch = re.compile(pattern).fullmatch
+    return lambda x: type(x) is str and fullmatch(x) is not None
+
+
+def _one_of(*values):
+    values = frozenset(values)
+    return lambda x: type(x) is str and x in values
+
+
+def _list(*items):
+    length = len(items)
+
+    def check(x):
+        return (
+            type(x) is list
+            and len(x) == length
+            and all(item(value) for item, value in zip(items, x))
+        )
+
+    return check
+
+
+def _dict(fields, strict=True):
+    # As in vtjson, keys ending with "?" are optional and a strict dict
+    # has no other keys.
+    required = tuple((k, v) for k, v in fields.items() if not k.endswith("?"))
+    optional = tuple((k[:-1], v) for k, v in fields.items() if k.endswith("?"))
+
+    def check(x):
+        if type(x) is not dict:
+            return False
+        for key, item in required:
+            if key not in x or not item(x[key]):
+                return False
+        count = len(required)
+        for key, item in optional:
+            if key in x:
+                if not item(x[key]):
+                    return False
+                count += 1
+        return not strict or len(x) == count
+
+    return check
+
+
+def _all(*checks):
+    return lambda x: all(check(x) for check in checks)
+
+
+_str = _type(str)
+_bool = _type(bool)
+_username = _regex(VALID_USERNAME_PATTERN)
+
+_worker_info = _dict(
+    {
+        "uname": _str,
+        "architecture": _list(_str, _str),
+        "concurrency": _suint,
+        "max_memory": _uint,
+        "min_threads": _suint,
+        "username": _username,
+        "version": _uint,
+        "python_version": _list(_uint, _uint, _uint),
+        "gcc_version": _list(_uint, _uint, _uint),
+        "compiler": _one_of(*supported_compilers),
+        "unique_key": _regex(UUID_PATTERN),
+        "modified": _bool,
+        "worker_arch": _one_of(*supported_arches, "unknown"),
+        "ARCH": _str,
+        "nps": _unumber,
+        "near_github_api_limit": _bool,
+    }
+)
+
+_results = _all(
+    _dict(
+        {
+            "wins": _uint,
+            "losses": _uint,
+            "draws": _uint,
+            "crashes": _uint,
+            "time_losses": _uint,
+            "pentanomial": _list(_uint, _uint, _uint, _uint, _uint),
+        }
+    ),
+    valid_results,
+)
+
+_spsa_results = _all(
+    _dict(
+        {
+            "wins": _uint,
+            "losses": _uint,
+            "draws": _uint,
+            "num_games": _even_uint,
+            "sig": _uint,
+        }
+    ),
+    valid_spsa_results,
+)
+
+is_valid_api_access = _dict(
+    {"password": _str, "worker_info": _dict({"username": _username}, strict=False)},
+    strict=False,
+)
+
+is_valid_api_request = _all(
+    _dict(
+        {
+            "password": _str,
+            "run_id?": _run_id,
+            "task_id?": _uint,
+            "pgn?": _str,
+            "message?": _str,
+            "worker_info": _worker_info,
+            "spsa?": _spsa_results,
+            "stats?": _results,
+        }
+    ),
+    lambda x: "task_id" not in x or "run_id" in x,
+)
+
+
+_api_access_schema = compile_schema(api_access_schema)
+_api_schema = compile_schema(api_schema)
+
+
+def validate_api_access(request_body, name):
+    if not is_valid_api_access(request_body):
+        validate(_api_access_schema, request_body, name)
+
+
+def validate_api_request(request_body, name):
+    if not is_valid_api_request(request_body):
+        validate(_api_schema, request_body, name)
@@ -29,6 +29,7 @@ from starlette.staticfiles import StaticFiles
 import fishtest.github_api as gh
 from fishtest import schemas
 from fishtest.api import router as api_router
+from fishtest.http.conditional import conditional_get_stats
 from fishtest.http.cookie_session import (
     DEFAULT_SAMESITE,
     SESSION_COOKIE_NAME,
@@ -102,6 +103,14 @@ async def _shutdown_rundb(rundb: RunDb) -> None:
     except Exception:
         logger.exception("Shutdown: error writing system_event")
 
+    try:
+        await run_in_threadpool(rundb.actiondb.stop_writer)
+        logger.info("Shutdown: action log %s", rundb.actiondb.queue_stats())
+    except Exception:
+        logger.exception("Shutdown: error flushing the action log")
+
+    logger.info("Shutdown: conditional GETs %s", conditional_get_stats.snapshot())
+
     try:
         await run_in_threadpool(rundb.conn.close)
     except Exception:
@@ -152,6 +161,8 @@ def create_app() -> FastAPI:
             is_primary_instance=settings.is_primary_instance,
         )
 
+        rundb.actiondb.start_writer()
+
         app.state.rundb = rundb
         app.state.userdb = rundb.userdb
         app.state.actiondb = rundb.actiondb
@@ -0,0 +1,196 @@
+import threading
+
+import numpy as np
+import scipy.stats
+
+"""
+The chi2 test on the stats of the workers of a run (see get_chi2() in
+util.py) only depends on a small matrix with one row of frequencies per
+worker. Chi2State maintains this matrix incrementally, so that the test
+can be redone without going through the task list of the run, which may
+contain tens of thousands of tasks.
+
+For every worker (identified by unique_key) we keep both the trinomial
+frequencies (w, l, d) and the frequencies derived from the pentanomial
+stats. Which of the two is used is decided at evaluation time, as it
+depends on the first task that takes part in the test. The state is
+updated by remove(task) and add(task) around every change of the stats
+of a task, or of its "bad" flag.
+"""
+
+
+def _default_results():
+    return {
+        "chi2": float("nan"),
+        "dof": 0,
+        "p": float("nan"),
+        "residual": {},
+        "z_95": float("nan"),
+        "z_99": float("nan"),
+    }
+
+
+def _task_frequencies(task):
+    """Return the unique_key of the worker of the task and its trinomial
+    and (combined) pentanomial frequencies, or None if the task does not
+    take part in the chi2 test."""
+    if "bad" in task:
+        return None
+    if "worker_info" not in task:
+        return None
+    stats = task.get("stats", {})
+    # There was a small window in time where we could have both
+    # trinomial and pentanomial workers.
+    p = stats.get("pentanomial", 5 * [0])
+    frequencies = (
+        float(stats.get("wins", 0)),
+        float(stats.get("losses", 0)),
+        float(stats.get("draws", 0)),
+        # The ww and ll frequencies will typically be too small for
+        # the full pentanomial chi2 test to be valid. See e.g. the last page of
+        # https://www.open.ac.uk/socialsciences/spsstutorial/files/tutorials/chi-square.pdf.
+        # So we combine the ww and ll frequencies with the wd and ld frequencies,
+        # this is equivalent to use the frequencies for the pair of games.
+        float(p[4] + p[3]),
+        float(p[0] + p[1]),
+        float(p[2]),
+    )
+    return task["worker_info"]["unique_key"], frequencies
+
+
+def has_pentanomial(tasks, exclude_workers=()):
+    """The first task taking part in the test decides whether we use the
+    pentanomial frequencies."""
+    for task in tasks:
+        if "bad" in task or "worker_info" not in task:
+            continue
+        if task["worker_info"]["unique_key"] in exclude_workers:
+            continue
+        return "pentanomial" in task.get("stats", {})
+    return None
+
+
+def chi2_from_frequencies(keys, observed):
+    """Perform the chi2 test on a matrix with the frequencies of each
+    worker in keys, one row per worker."""
+    if len(keys) <= 1:
+        return _default_results()
+    observed = np.asarray(observed, dtype=float)
+    row_sums = np.sum(observed, axis=1)
+    column_sums = np.sum(observed, axis=0)
+    # We filter out the workers whose expected frequences are <= 5 as
+    # they break the chi2 test. The column sums are downdated, the
+    # frequencies are integers so this is exact.
+    while True:
+        # Whenever less than two qualifying workers are left,
+        # we bail out and just return "something".
+        if len(keys) <= 1:
+            return _default_results()
+        grand_total = np.sum(column_sums)
+        # if no games have been received, we cannot continue
+        if grand_total == 0:
+            return _default_results()
+        expected = np.outer(row_sums, column_sums) / grand_total
+        keep = np.min(expected, axis=1) > 5
+        if keep.all():
+            break
+        column_sums = column_sums - np.sum(observed[~keep], axis=0)
+        observed = observed[keep]
+        row_sums = row_sums[keep]
+        keys = [key for key, kept in zip(keys, keep) if kept]
+
+    # Now we do the basic chi2 computation.
+    rows, columns = observed.shape
+    df = (rows - 1) * (columns - 1)
+    raw_residual = observed - expected
+    ratio = raw_residual**2 / expected
+    row_chi2 = np.sum(ratio, axis=1)
+    chi2 = np.sum(row_chi2)
+    p_value = 1 - scipy.stats.chi2.cdf(chi2, df)
+
+    # Finally we also compute for each qualifying worker a "residual"
+    # indicating how badly it deviates from the average worker.
+
+    # The entries of adj_row_chi2 below associate with each row the
+    # chi2 value of the 2xcolumns table obtained by collapsing
+    # all other rows. This can be checked by a simple algebraic
+    # manipulation.
+    # As such, under the null hypothesis that all rows are drawn
+    # from the same distribution, these "adjusted chi2 values"
+    # follow a chi2 distribution with columns-1 degrees of freedom.
+    adj_row_chi2 = row_chi2 / (1 - row_sums / grand_total)
+
+    # Most people will not be familiar with the chi2 distribution,
+    # so we convert the adjusted chi2 values to standard normal
+    # values. As a cosmetic tweak we use isf/sf rather than ppf/cdf
+    # in order to be able to deal accurately with very low p-values.
+    res_z = scipy.stats.norm.isf(scipy.stats.chi2.sf(adj_row_chi2, columns - 1))
+
+    # We cap the standard normal "residuals" at zero since negative values
+    # do not look very nice and moreover they do not convey any
+    # information.
+    residual = {key: max(0, res_z[idx]) for idx, key in enumerate(keys)}
+
+    # We compute 95% and 99% thresholds using the Bonferroni correction.
+    # Under the null hypothesis, yellow and red residuals should appear
+    # in approximately 4% and 1% of the tests.
+    z_95, z_99 = [scipy.stats.norm.ppf(1 - p / rows) for p in (0.05, 0.01)]
+
+    return {
+        "chi2": chi2,
+        "dof": df,
+        "p": p_value,
+        "residual": residual,
+        "z_95": z_95,
+        "z_99": z_99,
+    }
+
+
+class Chi2State:
+    def __init__(self, tasks=()):
+        self.lock = threading.Lock()
+        # unique_key -> [number of tasks, frequencies]
+        self.workers = {}
+        # The number of tasks of the run that have been accounted for,
+        # used by the owner to detect a state that went out of sync.
+        self.task_count = 0
+        for task in tasks:
+            self.append(task)
+
+    def append(self, task):
+        """Account for a new task of the run."""
+        with self.lock:
+            self.task_count += 1
+            self.__update(task, 1)
+
+    def add(self, task):
+        with self.lock:
+            self.__update(task, 1)
+
+    def remove(self, task):
+        with self.lock:
+            self.__update(task, -1)
+
+    def __update(self, task, sign):
+        frequencies = _task_frequencies(task)
+        if frequencies is None:
+            return
+        key, frequencies = frequencies
+        worker = self.workers.get(key)
+        if worker is None:
+            worker = self.workers[key] = [0, np.zeros(6)]
+        worker[0] += sign
+        worker[1] += sign * np.array(frequencies)
+        if worker[0] <= 0:
+            del self.workers[key]
+
+    def get_chi2(self, tasks, exclude_workers=()):
+        """Perform the chi2 test. The tasks are only used to decide
+        between trinomial and pentanomial frequencies, which normally
+        only requires looking at the first task."""
+        pentanomial = has_pentanomial(tasks, exclude_workers)
+        columns = slice(3, 6) if pentanomial else slice(0, 3)
+        with self.lock:
+            keys = [key for key in self.workers if key not in exclude_workers]
+            observed = [self.workers[key][1][columns] for key in keys]
+        return chi2_from_frequencies(keys, observed)
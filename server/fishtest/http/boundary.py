@@ -6,6 +6,9 @@ wiring for the UI and API layers.
 
 from __future__ import annotations
 
+import base64
+import json
+import zlib
 from dataclasses import dataclass
 from json import JSONDecodeError
 from types import SimpleNamespace
@@ -29,7 +32,10 @@ from fishtest.http.dependencies import (
 )
 from fishtest.http.jinja import static_url
 from fishtest.http.open_graph import default_open_graph
-from fishtest.http.settings import SESSION_REMEMBER_ME_MAX_AGE_SECONDS
+from fishtest.http.settings import (
+    API_GZIP_MAX_DECOMPRESSED_BYTES,
+    SESSION_REMEMBER_ME_MAX_AGE_SECONDS,
+)
 
 if TYPE_CHECKING:
     from collections.abc import Mapping
@@ -116,15 +122,90 @@ class JsonBodyResult:
     error: bool
 
 
+def _gunzip_body(data: bytes) -> bytes:
+    """Decompress a gzip request body, bounding the decompressed size."""
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    body = decompressor.decompress(data, API_GZIP_MAX_DECOMPRESSED_BYTES)
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        message = "gzip body is truncated or too large"
+        raise ValueError(message)
+    return body
+
+
 async def get_json_body(request: Request) -> JsonBodyResult:
-    """Parse JSON body, preserving legacy error behavior."""
+    """Parse JSON body, preserving legacy error behavior.
+
+    Bodies sent with ``Content-Encoding: gzip`` are decompressed first.
+    """
     try:
-        body = await request.json()
-    except JSONDecodeError, TypeError, ValueError:
+        if request.headers.get("content-encoding", "").lower() == "gzip":
+            body = json.loads(_gunzip_body(await request.body()))
+        else:
+            body = await request.json()
+    except JSONDecodeError, TypeError, ValueError, zlib.error:
         return JsonBodyResult(body=None, error=True)
     return JsonBodyResult(body=body, error=False)
 
 
+async def read_gzip_body(
+    request: Request,
+    *,
+    max_bytes: int,
+    max_decompressed_bytes: int,
+) -> bytes:
+    """Read a streamed gzip body, validating it while it arrives.
+
+    Raise ``ValueError`` if the body exceeds ``max_bytes``, is not a single
+    complete gzip stream, or decompresses to more than
+    ``max_decompressed_bytes``. The decompressed data is discarded.
+    """
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes:
+        message = "gzip body is too large"
+        raise ValueError(message)
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    body = bytearray()
+    decompressed_bytes = 0
+    try:
+        async for chunk in request.stream():
+            body += chunk
+            if len(body) > max_bytes:
+                message = "gzip body is too large"
+                raise ValueError(message)
+            data = chunk
+            while data and not decompressor.eof:
+                decompressed_bytes += len(decompressor.decompress(data, 1 << 16))
+                if decompressed_bytes > max_decompressed_bytes:
+                    message = "gzip body decompresses to too much data"
+                    raise ValueError(message)
+                data = decompressor.unconsumed_tail
+            if decompressor.unused_data or (data and decompressor.eof):
+                message = "gzip body has trailing data"
+                raise ValueError(message)
+    except zlib.error as e:
+        message = f"gzip body is invalid: {e}"
+        raise ValueError(message) from e
+    if not decompressor.eof:
+        message = "gzip body is truncated"
+        raise ValueError(message)
+    return bytes(body)
+
+
+def get_header_request_shim(request: Request) -> ApiRequestShim:
+    """Build the API request shim from the ``X-Fishtest-Request`` header.
+
+    Used by endpoints whose body is not the JSON request, e.g. streamed
+    uploads. The header holds the base64 encoded JSON request.
+    """
+    try:
+        body = json.loads(
+            base64.b64decode(request.headers["x-fishtest-request"], validate=True),
+        )
+    except KeyError, ValueError:
+        return ApiRequestShim(request, json_error=True)
+    return ApiRequestShim(request, json_body=body)
+
+
 async def get_request_shim(
     request: Request,
     matchdict: dict[str, str] | None = None,
@@ -0,0 +1,108 @@
+"""Answer conditional GETs of the htmx polling fragments.
+
+The run pages poll fragments that only change when the run changes. The
+primary instance, which serves them, versions the runs (``RunCache.buffer``
+bumps a counter per run), so a view can name the version of the data it is
+about to render. The ETag is a digest of that version and of everything
+else the fragment depends on: the URL, the user and the UI cookies. A poll
+whose ``If-None-Match`` matches it is answered with ``304 Not Modified``
+before any template work.
+
+The run tables of ``/tests`` and ``/tests/user`` are served by the
+secondary instances, which do not see the updates of the runs, so they are
+not versioned.
+
+The fragments are sent with ``Cache-Control: no-cache``, so browsers
+revalidate them on every poll and hand the cached body to htmx on a 304.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import secrets
+import threading
+from typing import TYPE_CHECKING
+
+from fishtest.http.cookie_session import SESSION_COOKIE_NAME, authenticated_user
+
+if TYPE_CHECKING:
+    from collections.abc import Hashable
+
+    from starlette.requests import Request
+
+    from fishtest.http.cookie_session import CookieSession
+
+# ETags do not survive a restart: the versions start again from zero.
+_EPOCH = secrets.token_hex(8)
+
+_FLASH_QUEUES = ("error", "warning", None)
+
+
+class ConditionalGetStats:
+    """Count the versioned fragment requests, for monitoring."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self) -> None:
+        with self._lock:
+            self.hits += 1
+
+    def miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+conditional_get_stats = ConditionalGetStats()
+
+
+def build_etag(
+    request: Request,
+    session: CookieSession,
+    version: Hashable,
+) -> str | None:
+    """Return the ETag of a fragment rendered from data at ``version``.
+
+    Returns None when the response must not be versioned, e.g. when it would
+    consume flash messages.
+    """
+    if any(session.peek_flash(queue) for queue in _FLASH_QUEUES):
+        return None
+    cookies = sorted(
+        (name, value)
+        for name, value in request.cookies.items()
+        if name != SESSION_COOKIE_NAME
+    )
+    key = repr(
+        (
+            _EPOCH,
+            version,
+            request.url.path,
+            request.url.query,
+            request.headers.get("HX-Request", ""),
+            authenticated_user(session),
+            session.get_csrf_token(),
+            cookies,
+        )
+    )
+    digest = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Weak comparison of ``etag`` with the ``If-None-Match`` header."""
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
@@ -125,6 +125,7 @@ def default_environment() -> Environment:
         "format_group": helpers.format_group,
         "format_results": helpers.format_results,
         "format_time_ago": helpers.format_time_ago,
+        "get_results_info": helpers.get_results_info,
         "get_tc_ratio": _get_tc_ratio,
         "gh": gh,
         "is_active_sprt_ltc": helpers.is_active_sprt_ltc,
@@ -20,6 +20,15 @@ from pathlib import Path
 THREADPOOL_TOKENS: int = 200
 TASK_SEMAPHORE_SIZE: int = 5
 
+# Workers may send their API requests with "Content-Encoding: gzip".
+# Bound the size of the decompressed body (guards against gzip bombs).
+API_GZIP_MAX_DECOMPRESSED_BYTES: int = 64 * 1024 * 1024
+
+# Bounds for the streamed PGN uploads (/api/upload_pgn_stream). The
+# compressed size must fit in a MongoDB document (16 MB).
+PGN_UPLOAD_MAX_BYTES: int = 15 * 1024 * 1024
+PGN_UPLOAD_MAX_DECOMPRESSED_BYTES: int = 512 * 1024 * 1024
+
 # htmx polling intervals (seconds), used via Jinja2 global `poll`.
 POLL_MACHINES_HOMEPAGE_S: int = 60
 POLL_TESTS_RUN_TABLES_S: int = 20
@@ -55,6 +64,10 @@ ACTIONS_PAGE_SIZE: int = 25
 CONTRIBUTORS_PAGE_SIZE: int = 100
 CONTRIBUTORS_MAX_ALL: int = 5000
 MACHINES_PAGE_SIZE: int = 500
+# Age of the shared machine rows (views_machines.py).
+MACHINE_ROWS_MAX_AGE_S: float = 5.0
+# Cached rows of finished runs (http/template_helpers.py).
+FINISHED_RUN_ROWS_CACHE_SIZE: int = 5000
 FINISHED_FILTER_MAX_COUNT_AUTH: int = 10000
 FINISHED_FILTER_MAX_COUNT_ANON: int = 1000
 
@@ -12,6 +12,9 @@ from urllib.parse import quote_plus
 
 from markupsafe import Markup
 
+import fishtest.github_api as gh
+from fishtest.http.settings import FINISHED_RUN_ROWS_CACHE_SIZE
+from fishtest.lru_cache import LRUCache
 from fishtest.stats import LLRcalc, stat_util
 from fishtest.stats import sprt as sprt_module
 from fishtest.util import (
@@ -22,6 +25,7 @@ from fishtest.util import (
     format_group,
     format_results,
     format_time_ago,
+    get_results_info,
     is_active_sprt_ltc,
     tests_repo,
     worker_name,
@@ -1180,7 +1184,7 @@ def build_tasks_rows(
     show_pentanomial = "pentanomial" in run.get("results", {})
     show_residual = "spsa" not in run.get("args", {})
     tasks = []
-    all_tasks = run.get("tasks", []) + run.get("bad_tasks", [])
+    all_tasks = [*run.get("tasks", []), *run.get("bad_tasks", [])]
 
     for idx, task in enumerate(all_tasks):
         if "bad" in task and idx < len(run.get("tasks", [])):
@@ -1259,70 +1263,118 @@ def build_tasks_rows(
     return tasks, show_pentanomial, show_residual
 
 
+def _build_run_table_row(run: dict, *, allow_github_api_calls: bool) -> dict:
+    args = run.get("args", {})
+    run_id = str(run.get("_id", ""))
+    start_time = run.get("start_time")
+    start_date_label = (
+        start_time.strftime("%y-%m-%d") if hasattr(start_time, "strftime") else ""
+    )
+    username = args.get("username", "")
+    user_short = username[:3]
+    user_url = f"/tests/user/{username}" if username else ""
+    run_url = f"/tests/view/{run_id}" if run_id else ""
+    new_tag = args.get("new_tag", "")
+    new_tag_short = new_tag[:23]
+    is_finished = bool(run.get("finished"))
+    is_sprt = "sprt" in args
+    live_label = "sprt" if is_sprt else str(args.get("num_games", ""))
+    live_url = f"/tests/live_elo/{run_id}" if is_sprt else ""
+    tc_label = args.get("tc", "")
+    threads = args.get("threads", 1)
+    cores = run.get("cores", "")
+    workers = run.get("workers", "")
+    cores_label = ""
+    if not is_finished:
+        cores_label = f"cores: {cores} ({workers})"
+    info = args.get("info", "")
+    info_html = (
+        Markup(html.escape(info).replace("\n", "<br>"))  # noqa: S704
+        if info
+        else Markup("")
+    )
+
+    return {
+        "run": run,
+        "run_id": run_id,
+        "active_filter_index": run.get("_active_filter_index"),
+        "start_date_label": start_date_label,
+        "user_short": user_short,
+        "user_name": username,
+        "user_url": user_url,
+        "is_finished": is_finished,
+        "is_sprt": is_sprt,
+        "new_tag_short": new_tag_short,
+        "run_url": run_url,
+        "diff_url": diff_url(
+            run,
+            master_check=allow_github_api_calls,
+        ),
+        "live_label": live_label,
+        "live_url": live_url,
+        "tc_label": tc_label,
+        "threads": threads,
+        "cores_label": cores_label,
+        "info_html": info_html,
+    }
+
+
+# The rows of the finished runs, which the homepage, the user pages and
+# /tests/finished render over and over. Besides the row fields they hold
+# the results summaries of elo_results.html.j2. A run may still change
+# after it finished (e.g. it is purged), so the key includes its
+# last_updated and its results. The rows are built without master check:
+# whether a sha is in master may change at any time (see gh.is_master),
+# so that part of the diff url is computed on each request.
+_finished_run_rows = LRUCache(maxsize=FINISHED_RUN_ROWS_CACHE_SIZE)
+
+
+def _finished_run_row_key(run: dict) -> tuple:
+    args = run.get("args", {})
+    results = run.get("results", {})
+    return (
+        str(run.get("_id", "")),
+        run.get("last_updated"),
+        results.get("wins"),
+        results.get("losses"),
+        results.get("draws"),
+        tuple(results.get("pentanomial", ())),
+        run.get("results_info", {}).get("style"),
+        # The diff of an SPSA run is against the current master.
+        gh.official_master_sha if "spsa" in args else None,
+    )
+
+
+def _finished_run_row(run: dict, *, allow_github_api_calls: bool) -> dict:
+    key = _finished_run_row_key(run)
+    row = _finished_run_rows.get(key)
+    if row is None:
+        row = _build_run_table_row(run, allow_github_api_calls=False)
+        row["results_info"] = get_results_info(run)
+        row["nelo_summary"] = nelo_pentanomial_summary(run)
+        _finished_run_rows[key] = row
+    # The cached row is shared, give the template the run at hand.
+    row = {**row, "run": run}
+    if allow_github_api_calls:
+        row["diff_url"] = diff_url(run, master_check=True)
+    return row
+
+
 def build_run_table_rows(
     runs: list[dict],
     *,
     allow_github_api_calls: bool,
 ) -> list[dict]:
-    """Build template-ready run rows for run tables."""
-    rows = []
-    for run in runs:
-        args = run.get("args", {})
-        run_id = str(run.get("_id", ""))
-        start_time = run.get("start_time")
-        start_date_label = (
-            start_time.strftime("%y-%m-%d") if hasattr(start_time, "strftime") else ""
-        )
-        username = args.get("username", "")
-        user_short = username[:3]
-        user_url = f"/tests/user/{username}" if username else ""
-        run_url = f"/tests/view/{run_id}" if run_id else ""
-        new_tag = args.get("new_tag", "")
-        new_tag_short = new_tag[:23]
-        is_finished = bool(run.get("finished"))
-        is_sprt = "sprt" in args
-        live_label = "sprt" if is_sprt else str(args.get("num_games", ""))
-        live_url = f"/tests/live_elo/{run_id}" if is_sprt else ""
-        tc_label = args.get("tc", "")
-        threads = args.get("threads", 1)
-        cores = run.get("cores", "")
-        workers = run.get("workers", "")
-        cores_label = ""
-        if not is_finished:
-            cores_label = f"cores: {cores} ({workers})"
-        info = args.get("info", "")
-        info_html = (
-            Markup(html.escape(info).replace("\n", "<br>"))  # noqa: S704
-            if info
-            else Markup("")
-        )
+    """Build template-ready run rows for run tables.
 
-        rows.append(
-            {
-                "run": run,
-                "run_id": run_id,
-                "active_filter_index": run.get("_active_filter_index"),
-                "start_date_label": start_date_label,
-                "user_short": user_short,
-                "user_name": username,
-                "user_url": user_url,
-                "is_finished": is_finished,
-                "is_sprt": is_sprt,
-                "new_tag_short": new_tag_short,
-                "run_url": run_url,
-                "diff_url": diff_url(
-                    run,
-                    master_check=allow_github_api_calls,
-                ),
-                "live_label": live_label,
-                "live_url": live_url,
-                "tc_label": tc_label,
-                "threads": threads,
-                "cores_label": cores_label,
-                "info_html": info_html,
-            },
-        )
-    return rows
+    The rows of finished runs are cached, see _finished_run_rows.
+    """
+    return [
+        _finished_run_row(run, allow_github_api_calls=allow_github_api_calls)
+        if run.get("finished")
+        else _build_run_table_row(run, allow_github_api_calls=allow_github_api_calls)
+        for run in runs
+    ]
 
 
 __all__ = [
@@ -1338,6 +1390,7 @@ __all__ = [
     "format_group",
     "format_results",
     "format_time_ago",
+    "get_results_info",
     "is_active_sprt_ltc",
     "is_elo_pentanomial_run",
     "list_to_string",
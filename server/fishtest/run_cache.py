@@ -1,14 +1,19 @@
+import hashlib
 import threading
 import time
 from enum import IntEnum
 
+import bson
 from bson.errors import InvalidId
 from bson.objectid import ObjectId
+from bson.raw_bson import RawBSONDocument
+from pymongo import ReplaceOne, UpdateOne
 from vtjson import validate
 
 from fishtest.lru_cache import lru_cache
 from fishtest.schemas import cache_schema
 from fishtest.schemas import run_id as run_id_schema
+from fishtest.task_store import TaskList, plain_run, task_type_registry
 
 
 class Prio(IntEnum):
@@ -18,12 +23,55 @@ class Prio(IntEnum):
     SAVE_NOW = 1000
 
 
+def _field_digest(value, codec_options):
+    return hashlib.blake2b(
+        bson.encode({"v": value}, codec_options=codec_options), digest_size=16
+    ).digest()
+
+
 class RunCache:
-    def __init__(self, runs):
+    """
+    Write-behind cache for the runs collection
+    ==========================================
+    Dirty runs are written back by flush_buffers() in a single bulk_write.
+    Instead of replacing the full document, which includes the potentially
+    very large "tasks" array, only the parts that changed are written:
+
+    - the tasks whose ids were passed to buffer() through "task_ids",
+      as $set operations on "tasks.N";
+    - the other top-level fields whose BSON encoding changed since the
+      last write (their digests are kept in the cache entry).
+
+    When buffer() is called without "task_ids" we do not know which tasks
+    were modified and the full document is replaced.
+
+    With columnar_tasks=True the "tasks" of the cached runs are stored
+    in a TaskList (see task_store.py) rather than in a list of dicts.
+    """
+
+    # Maximum number of runs written by one call of flush_buffers().
+    flush_batch_size = 100
+
+    def __init__(self, runs, columnar_tasks=False):
         # For documentation of the cache format see "cache_schema" in schemas.py.
         self.runs = runs
+        self.columnar_tasks = columnar_tasks
+        self.codec_options = runs.codec_options
+        if columnar_tasks:
+            self.codec_options = self.codec_options.with_options(
+                type_registry=task_type_registry
+            )
         self.run_cache_lock = threading.Lock()
         self.run_cache = {}
+        # Serializes the database writes of flush_buffers() and buffer().
+        self.write_lock = threading.Lock()
+        self.last_flush = {"runs": 0, "bytes": 0, "time": 0.0}
+        # Bumped by every call of buffer(), respectively by the calls with
+        # Prio.SAVE_NOW, see runs_snapshot.py. The versions of the single
+        # runs are used by the conditional GETs, see http/conditional.py.
+        self.version = 0
+        self.major_version = 0
+        self.run_versions = {}
 
     def active_run_lock(self, run_id):
         run_id = str(run_id)
@@ -35,7 +83,7 @@ class RunCache:
         validate(run_id_schema, run_id)
         return threading.RLock()
 
-    def buffer(self, run, *, priority=Prio.NORMAL, create=False):
+    def buffer(self, run, *, priority=Prio.NORMAL, create=False, task_ids=None):
         """
         Guidelines for priority
         =======================
@@ -44,6 +92,11 @@ class RunCache:
         Prio.SAVE_NOW: new run (combined with create=True),
                        finished run, modify/approve/purge run
         Prio.NORMAL: all other uses
+
+        task_ids
+        ========
+        The ids of the tasks that were created or modified, () if no task
+        was touched. The default None means that any task may have changed.
         """
         if create and priority != Prio.SAVE_NOW:
             print(
@@ -55,33 +108,79 @@ class RunCache:
 
         flush = priority == Prio.SAVE_NOW
         run_id = str(run["_id"])
+        now = time.time()
+        if self.columnar_tasks and not isinstance(run["tasks"], TaskList):
+            run["tasks"] = TaskList(run["tasks"])
         with self.run_cache_lock:
+            if not flush:
+                self.__bump_versions(run_id, major=False)
+            entry = self.run_cache.get(run_id)
             if flush:
-                self.run_cache[run_id] = {
+                entry = self.run_cache[run_id] = {
                     "is_changed": False,
-                    "last_access_time": time.time(),
-                    "last_sync_time": time.time(),
+                    "last_access_time": now,
+                    "last_sync_time": now,
                     "priority": 0,
                     "run": run,
+                    "changed_since": None,
+                    "changed_tasks": set(),
+                    "full_write": False,
+                    "digests": None,
                 }
             else:
-                if run_id in self.run_cache:
-                    last_sync_time = self.run_cache[run_id]["last_sync_time"]
-                    priority = max(priority, self.run_cache[run_id]["priority"])
+                if entry is not None and entry["run"] is run:
+                    priority = max(priority, entry["priority"])
+                    entry["last_access_time"] = now
                 else:
-                    last_sync_time = time.time()
-                self.run_cache[run_id] = {
-                    "is_changed": True,
-                    "last_access_time": time.time(),
-                    "last_sync_time": last_sync_time,
-                    "priority": priority,
-                    "run": run,
-                }
+                    entry = self.run_cache[run_id] = {
+                        "last_sync_time": entry["last_sync_time"] if entry else now,
+                        "last_access_time": now,
+                        "priority": priority,
+                        "run": run,
+                        "is_changed": False,
+                        "changed_since": None,
+                        "changed_tasks": set(),
+                        "full_write": True,
+                        "digests": None,
+                    }
+                if not entry["is_changed"]:
+                    entry["is_changed"] = True
+                    entry["changed_since"] = now
+                entry["priority"] = priority
+                if task_ids is None:
+                    entry["full_write"] = True
+                else:
+                    entry["changed_tasks"].update(task_ids)
         if flush:
-            with self.active_run_lock(run_id):
-                r = self.runs.replace_one({"_id": ObjectId(run_id)}, run, upsert=create)
-                if not create and r.matched_count == 0:
-                    print(f"Buffer: update of {run_id} failed", flush=True)
+            try:
+                with self.active_run_lock(run_id), self.write_lock:
+                    doc = RawBSONDocument(
+                        bson.encode(run, codec_options=self.codec_options)
+                    )
+                    r = self.runs.replace_one(
+                        {"_id": ObjectId(run_id)}, doc, upsert=create
+                    )
+                    if not create and r.matched_count == 0:
+                        print(f"Buffer: update of {run_id} failed", flush=True)
+                    else:
+                        entry["digests"] = self.__digests(run)
+            finally:
+                # Only now, so that the readers of the database (e.g. the
+                # finished runs of the run tables) see the new version.
+                with self.run_cache_lock:
+                    self.__bump_versions(run_id, major=True)
+
+    def __bump_versions(self, run_id, *, major):
+        """Must be called with run_cache_lock held."""
+        self.version += 1
+        if major:
+            self.major_version += 1
+        self.run_versions[run_id] = self.run_versions.get(run_id, 0) + 1
+
+    def run_version(self, run_id):
+        """The number of calls of buffer() for the run since the start."""
+        with self.run_cache_lock:
+            return self.run_versions.get(str(run_id), 0)
 
     def get_run(self, run_id):
         run_id = str(run_id)
@@ -96,50 +195,143 @@ class RunCache:
                 return self.run_cache[run_id]["run"]
             run = self.runs.find_one({"_id": run_id_obj})
             if run is not None:
+                if self.columnar_tasks:
+                    run["tasks"] = TaskList(run["tasks"])
                 self.run_cache[run_id] = {
                     "last_access_time": time.time(),
                     "last_sync_time": time.time(),
                     "priority": 0,
                     "run": run,
                     "is_changed": False,
+                    "changed_since": None,
+                    "changed_tasks": set(),
+                    "full_write": False,
+                    "digests": None,
                 }
                 return run
         return None
 
-    def flush_buffers(self):
-        oldest_entry = None
-        old = float("inf")
-        with self.run_cache_lock:
-            for cache_entry in self.run_cache.values():
-                # Make sure that every run will be saved to disk eventually,
-                # even if there are always cache entries with priority 1.
-                t = -60 * cache_entry["priority"] + cache_entry["last_sync_time"]
-                if cache_entry["is_changed"] and t < old:
-                    old = t
-                    oldest_entry = cache_entry
-            if oldest_entry is not None:
-                oldest_run = oldest_entry["run"]
-                oldest_run_id = oldest_run["_id"]
-                oldest_entry["is_changed"] = False
-                oldest_entry["last_sync_time"] = time.time()
-                oldest_entry["priority"] = 0
-
-        if oldest_entry is not None:
-            with self.active_run_lock(str(oldest_run_id)):
-                self.runs.replace_one({"_id": oldest_run_id}, oldest_run)
+    def __digests(self, run):
+        codec_options = self.codec_options
+        return {
+            key: _field_digest(value, codec_options)
+            for key, value in run.items()
+            if key not in ("_id", "tasks")
+        }
 
-    def flush_all(self):
-        flush_list = []
+    def __write_op(self, entry, changed_tasks, full_write):
+        # Must be called with the run lock held. Without digests we
+        # do not know what is in the db, so we replace the document.
+        run = entry["run"]
+        run_id = run["_id"]
+        codec_options = self.codec_options
+        digests = self.__digests(run)
+        if full_write or entry["digests"] is None:
+            doc = RawBSONDocument(bson.encode(run, codec_options=codec_options))
+            op = ReplaceOne({"_id": run_id}, doc)
+        else:
+            old_digests = entry["digests"]
+            update = {"$set": {}}
+            for key, digest in digests.items():
+                if old_digests.get(key) != digest:
+                    update["$set"][key] = run[key]
+            tasks = run["tasks"]
+            for task_id in sorted(changed_tasks):
+                if task_id < len(tasks):
+                    update["$set"][f"tasks.{task_id}"] = tasks[task_id]
+            unset = {key: "" for key in old_digests if key not in digests}
+            if unset:
+                update["$unset"] = unset
+            if not update["$set"]:
+                del update["$set"]
+                if not unset:
+                    entry["digests"] = digests
+                    return None, 0
+            doc = RawBSONDocument(bson.encode(update, codec_options=codec_options))
+            op = UpdateOne({"_id": run_id}, doc)
+        entry["digests"] = digests
+        return op, len(doc.raw)
+
+    def __flush(self, batch_size=None):
+        now = time.time()
+        batch = []
         with self.run_cache_lock:
             for run_id, entry in self.run_cache.items():
                 if entry["is_changed"]:
-                    entry["is_changed"] = False
-                    entry["last_sync_time"] = time.time()
-                    entry["priority"] = 0
-                    flush_list.append((run_id, entry))
-        for run_id, entry in flush_list:
+                    # Make sure that every run will be saved to disk eventually,
+                    # even if there are always cache entries with priority 1.
+                    t = -60 * entry["priority"] + entry["last_sync_time"]
+                    batch.append((t, run_id, entry))
+            batch.sort(key=lambda item: item[0])
+            if batch_size is not None:
+                batch = batch[:batch_size]
+            for index, (_, run_id, entry) in enumerate(batch):
+                batch[index] = (
+                    run_id,
+                    entry,
+                    entry["changed_tasks"],
+                    entry["full_write"],
+                )
+                entry["is_changed"] = False
+                entry["last_sync_time"] = now
+                entry["priority"] = 0
+                entry["changed_since"] = None
+                entry["changed_tasks"] = set()
+                entry["full_write"] = False
+
+        # The documents are encoded while holding the run lock, but
+        # the lock is released before the database round trip.
+        ops = []
+        for run_id, entry, changed_tasks, full_write in batch:
             with self.active_run_lock(run_id):
-                self.runs.replace_one({"_id": ObjectId(run_id)}, entry["run"])
+                op, size = self.__write_op(entry, changed_tasks, full_write)
+                if op is not None:
+                    ops.append((run_id, entry, op, size))
+
+        with self.write_lock:
+            # Skip the runs that were saved by buffer() with Prio.SAVE_NOW,
+            # or replaced by another copy, since we released the run lock.
+            with self.run_cache_lock:
+                ops = [item for item in ops if self.run_cache.get(item[0]) is item[1]]
+            if ops:
+                try:
+                    self.runs.bulk_write([item[2] for item in ops], ordered=False)
+                except Exception:
+                    # Try again with a full write on the next flush.
+                    with self.run_cache_lock:
+                        for _, entry, _, _ in ops:
+                            entry["is_changed"] = True
+                            entry["full_write"] = True
+                            entry["changed_since"] = entry["changed_since"] or now
+                    raise
+        self.last_flush = {
+            "runs": len(ops),
+            "bytes": sum(item[3] for item in ops),
+            "time": time.time() - now,
+        }
+
+    def flush_buffers(self):
+        self.__flush(batch_size=self.flush_batch_size)
+
+    def flush_all(self):
+        self.__flush()
+
+    def metrics(self):
+        now = time.time()
+        with self.run_cache_lock:
+            changed_since = [
+                entry["changed_since"]
+                for entry in self.run_cache.values()
+                if entry["is_changed"]
+            ]
+        return {
+            "cached_runs": len(self.run_cache),
+            "dirty_runs": len(changed_since),
+            "oldest_dirty_age": now - min(changed_since) if changed_since else 0.0,
+            "last_flush_runs": self.last_flush["runs"],
+            "last_flush_bytes": self.last_flush["bytes"],
+            "last_flush_duration": self.last_flush["time"],
+        }
 
     def clean_cache(self):
         now = time.time()
@@ -158,9 +350,15 @@ class RunCache:
 
     def validate(self):
         with self.run_cache_lock:
+            run_cache = self.run_cache
+            if self.columnar_tasks:
+                run_cache = {
+                    run_id: entry | {"run": plain_run(entry["run"])}
+                    for run_id, entry in run_cache.items()
+                }
             validate(
                 cache_schema,
-                self.run_cache,
+                run_cache,
                 name="run_cache",
                 subs={"runs_schema": dict},
             )
@@ -0,0 +1,268 @@
+import bisect
+import heapq
+import math
+import threading
+
+from fishtest.util import get_hash
+
+"""
+The scheduling index keeps the unfinished runs ordered in the same way as
+the "priority()" key that RunDb.sync_request_task used to sort the full
+list of unfinished runs with on every call:
+
+  (-priority, adjusted_cores > 0, (adjusted_cores + max_threads / 2) / itp)
+
+Here adjusted_cores is run["cores"], plus max_threads if the run was the
+last run of the requesting worker. We re-add the number of cores that were
+freed by this worker when the previous task on this run finished. If we
+don't do this then this worker is likely to pick up this run again,
+especially if it has many cores. The added term max_threads / 2 is to
+mitigate granularity issues with large core workers.
+
+The last component depends on the worker, so it cannot be kept in a single
+sorted list. Writing c = max_threads / 2, x = cores / itp and y = 1 / itp
+the key becomes x + c * y. For every priority level we keep:
+
+- the idle runs (cores == 0) sorted by y; for those the key is c * y,
+  so this order is exact for every worker;
+- the busy runs (cores > 0) sorted by x and, separately, by y.
+
+The busy runs are merged lazily with the threshold algorithm: after
+looking at the first i entries of both lists, no unseen run can have a
+key smaller than x[i] + c * y[i]. So only the runs that precede the first
+suitable run (plus a few more) are ever looked at.
+
+The index is updated whenever cores, itp or the priority of a run change
+(see RunDb.request_task, set_inactive_task, update_itp, set_active_run and
+set_inactive_run). RunDb.update_itp refreshes all entries every minute, so
+that a missed update cannot go unnoticed for long.
+
+Several request_task calls may search the index at the same time. Updates
+are therefore copy-on-write: the entries are immutable and every update
+publishes a new snapshot, replacing only the sorted lists it touches. A
+search works on the snapshot that was current when it started and never
+takes a lock. With a few hundred unfinished runs the copying is cheap.
+"""
+
+
+class RunIndexEntry:
+    """A lightweight record for a single unfinished run. Besides the sort
+    keys it caches the data used by the static eligibility checks of
+    sync_request_task, so that non-matching runs are rejected without
+    recomputing anything."""
+
+    __slots__ = (
+        "run_id",
+        "priority",
+        "idle",
+        "x",
+        "y",
+        "threads",
+        "hash",
+        "compiler",
+        "arch_filter",
+        "limit_cores",
+    )
+
+    def __init__(self, run_id, run, priority, idle, x, y):
+        args = run["args"]
+        self.run_id = run_id
+        self.threads = args["threads"]
+        self.hash = get_hash(args["new_options"]) + get_hash(args["base_options"])
+        self.compiler = args.get("compiler", "")
+        self.arch_filter = args.get("arch_filter", "")
+        # Limit the number of cores. Currently this is only done for spsa.
+        if "spsa" in args:
+            self.limit_cores = 200000 / math.sqrt(len(args["spsa"]["params"]))
+        else:
+            self.limit_cores = 1000000  # infinity
+        self.priority = priority
+        self.idle = idle
+        self.x = x
+        self.y = y
+
+    def key(self, c, extra_cores=0):
+        return self.x + (extra_cores + c) * self.y
+
+
+class _PriorityLevel:
+    __slots__ = ("idle", "by_ratio", "by_inv_itp")
+
+    def __init__(self, idle=(), by_ratio=(), by_inv_itp=()):
+        self.idle = list(idle)  # (y, run_id)
+        self.by_ratio = list(by_ratio)  # (x, run_id)
+        self.by_inv_itp = list(by_inv_itp)  # (y, run_id)
+
+    def __len__(self):
+        return len(self.idle) + len(self.by_ratio)
+
+    def copy(self):
+        return _PriorityLevel(self.idle, self.by_ratio, self.by_inv_itp)
+
+
+def _remove(sorted_list, item):
+    i = bisect.bisect_left(sorted_list, item)
+    if i < len(sorted_list) and sorted_list[i] == item:
+        del sorted_list[i]
+
+
+class _Snapshot:
+    """The state of the index. A published snapshot is never modified,
+    updates work on a copy, see RunIndex.update()."""
+
+    __slots__ = ("entries", "levels", "priorities")
+
+    def __init__(self, entries=None, levels=None, priorities=None):
+        self.entries = entries if entries is not None else {}
+        self.levels = levels if levels is not None else {}
+        # Priorities in the order in which they should be visited.
+        self.priorities = priorities if priorities is not None else []
+
+    def copy(self):
+        # The levels themselves are copied on demand by link() and unlink().
+        return _Snapshot(dict(self.entries), dict(self.levels), list(self.priorities))
+
+    def link(self, entry):
+        self.entries[entry.run_id] = entry
+        level = self.levels.get(entry.priority)
+        if level is None:
+            level = _PriorityLevel()
+            bisect.insort(self.priorities, entry.priority, key=lambda p: -p)
+        else:
+            level = level.copy()
+        self.levels[entry.priority] = level
+        if entry.idle:
+            bisect.insort(level.idle, (entry.y, entry.run_id))
+        else:
+            bisect.insort(level.by_ratio, (entry.x, entry.run_id))
+            bisect.insort(level.by_inv_itp, (entry.y, entry.run_id))
+
+    def unlink(self, entry):
+        del self.entries[entry.run_id]
+        level = self.levels[entry.priority].copy()
+        if entry.idle:
+            _remove(level.idle, (entry.y, entry.run_id))
+        else:
+            _remove(level.by_ratio, (entry.x, entry.run_id))
+            _remove(level.by_inv_itp, (entry.y, entry.run_id))
+        if len(level) == 0:
+            del self.levels[entry.priority]
+            self.priorities.remove(entry.priority)
+        else:
+            self.levels[entry.priority] = level
+
+
+class RunIndex:
+    def __init__(self):
+        # Serializes the writers, readers use self.snapshot.
+        self.lock = threading.Lock()
+        self.snapshot = _Snapshot()
+
+    @property
+    def entries(self):
+        return self.snapshot.entries
+
+    def __len__(self):
+        return len(self.snapshot.entries)
+
+    def __contains__(self, run_id):
+        return str(run_id) in self.snapshot.entries
+
+    def clear(self):
+        with self.lock:
+            self.snapshot = _Snapshot()
+
+    def update(self, run):
+        """Insert the run or refresh its position after a change of
+        cores, itp or priority."""
+        run_id = str(run["_id"])
+        args = run["args"]
+        priority = args["priority"]
+        cores = run["cores"]
+        itp = args.get("itp", 100)
+        y = 1 / itp if itp > 0 else math.inf
+        x = cores * y if cores > 0 else 0.0
+        idle = cores <= 0
+        with self.lock:
+            entry = self.snapshot.entries.get(run_id)
+            if entry is not None and (entry.priority, entry.idle, entry.x, entry.y) == (
+                priority,
+                idle,
+                x,
+                y,
+            ):
+                return
+            snapshot = self.snapshot.copy()
+            if entry is not None:
+                snapshot.unlink(entry)
+            snapshot.link(RunIndexEntry(run_id, run, priority, idle, x, y))
+            self.snapshot = snapshot
+
+    def remove(self, run_id):
+        run_id = str(run_id)
+        self.retain_if(lambda entry_run_id: entry_run_id != run_id)
+
+    def retain(self, run_ids):
+        """Drop the entries of the runs that are not in run_ids."""
+        self.retain_if(lambda run_id: run_id in run_ids)
+
+    def retain_if(self, keep):
+        with self.lock:
+            dropped = [
+                entry
+                for run_id, entry in self.snapshot.entries.items()
+                if not keep(run_id)
+            ]
+            if dropped:
+                snapshot = self.snapshot.copy()
+                for entry in dropped:
+                    snapshot.unlink(entry)
+                self.snapshot = snapshot
+
+    def find(self, suitable, max_threads, last_run_id=None, exclude=()):
+        """Return the run_id of the first entry, in scheduling order, for
+        which suitable(entry) is true. The worker's last run gets its
+        cores adjusted by max_threads, as in the original priority key.
+        The runs in exclude are skipped. The search works on the current
+        snapshot and does not lock the index."""
+        c = max_threads / 2
+        snapshot = self.snapshot
+        last_entry = snapshot.entries.get(last_run_id)
+        for priority in snapshot.priorities:
+            level = snapshot.levels[priority]
+            last = (
+                last_entry
+                if last_entry is not None and last_entry.priority == priority
+                else None
+            )
+            for run_id in self.__iter_level(snapshot, level, c, max_threads, last):
+                if run_id not in exclude and suitable(snapshot.entries[run_id]):
+                    return run_id
+        return None
+
+    def __iter_level(self, snapshot, level, c, max_threads, last):
+        entries = snapshot.entries
+        skip = last.run_id if last is not None else None
+        for _, run_id in level.idle:
+            if run_id != skip:
+                yield run_id
+
+        # Threshold algorithm over the busy runs. The last run of the
+        # worker is never idle, since its cores are adjusted.
+        heap = []
+        if last is not None:
+            heap.append((last.key(c, extra_cores=max_threads), skip))
+        seen = set()
+        by_ratio, by_inv_itp = level.by_ratio, level.by_inv_itp
+        n = len(by_ratio)
+        i = 0
+        while i < n or heap:
+            threshold = by_ratio[i][0] + c * by_inv_itp[i][0] if i < n else math.inf
+            while heap and heap[0][0] <= threshold:
+                yield heapq.heappop(heap)[1]
+            if i < n:
+                for _, run_id in (by_ratio[i], by_inv_itp[i]):
+                    if run_id != skip and run_id not in seen:
+                        seen.add(run_id)
+                        heapq.heappush(heap, (entries[run_id].key(c), run_id))
+                i += 1
@@ -13,7 +13,7 @@ from datetime import UTC, datetime
 import regex
 from bson.codec_options import CodecOptions
 from bson.objectid import ObjectId
-from pymongo import DESCENDING, MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient
 from pymongo.errors import OperationFailure
 from vtjson import ValidationError, validate
 
@@ -22,10 +22,13 @@ import fishtest.run_cache
 import fishtest.spsa_handler
 import fishtest.stats.stat_util
 from fishtest.actiondb import ActionDb
+from fishtest.chi2 import Chi2State
 from fishtest.http.settings import TASK_SEMAPHORE_SIZE
 from fishtest.kvstore import KeyValueStore
-from fishtest.lru_cache import lru_cache
+from fishtest.lru_cache import LRUCache, lru_cache
 from fishtest.run_cache import Prio
+from fishtest.run_index import RunIndex
+from fishtest.runs_snapshot import StoredRunsSnapshot, UnfinishedRunsSnapshot
 from fishtest.scheduler import Scheduler
 from fishtest.schemas import (
     RUN_VERSION,
@@ -45,19 +48,18 @@ from fishtest.schemas import (
     worker_runs_schema,
     wtt_map_schema,
 )
-from fishtest.stats.stat_util import SPRT_elo
+from fishtest.stats.stat_util import SPRT_elo_cached
+from fishtest.task_deadlines import TaskDeadlines
+from fishtest.task_store import active_tasks, plain_run
 from fishtest.userdb import UserDb
 from fishtest.util import (
     FISHTEST,
-    GeneratorAsFileReader,
     count_games,
     crash_or_time,
     estimate_game_duration,
+    format_results,
     get_bad_workers,
-    get_chi2,
-    get_hash,
     get_tc_ratio,
-    remaining_hours,
     residual_to_color,
     worker_name,
 )
@@ -93,6 +95,8 @@ class RunDb:
         self.actiondb = ActionDb(self.db)
         self.workerdb = WorkerDb(self.db)
         self.pgndb = self.db["pgns"]
+        # run ObjectId -> total size and number of the pgns of the run
+        self.pgn_sizes = self.db["pgn_sizes"]
         self.nndb = self.db["nns"]
         self.runs = self.db["runs"]
         self.deltas = self.db["deltas"]
@@ -110,6 +114,8 @@ class RunDb:
         self.worker_runs = self.kvstore.get("worker_runs", {})
 
         self.task_duration = 1800  # 30 minutes
+        # A task is dead if we did not hear from its worker for this long.
+        self.dead_task_timeout = 360
         self.ltc_lower_bound = 40  # Beware: this is used as a filter in an index!
         self.pt_info = {
             "pt_version": "SF_18",
@@ -122,7 +128,14 @@ class RunDb:
 
         self.__is_primary_instance = is_primary_instance
 
-        self.run_cache = fishtest.run_cache.RunCache(self.runs)
+        # Opt-in columnar storage of the tasks of the cached runs,
+        # see task_store.py.
+        columnar_tasks = is_primary_instance and os.getenv(
+            "FISHTEST_COLUMNAR_TASKS", ""
+        ).strip() not in ("", "0")
+        self.run_cache = fishtest.run_cache.RunCache(
+            self.runs, columnar_tasks=columnar_tasks
+        )
         self.active_run_lock = self.run_cache.active_run_lock
         if is_primary_instance:
             self.buffer = self.run_cache.buffer
@@ -132,7 +145,20 @@ class RunDb:
 
         self.worker_runs_lock = threading.Lock()
 
-        self.request_task_lock = threading.Lock()
+        # Scheduling order of the unfinished runs, see run_index.py.
+        self.run_index = RunIndex()
+        # Deadlines of the active tasks, see task_deadlines.py.
+        self.task_deadlines = TaskDeadlines(self.dead_task_timeout)
+        # The unfinished runs for the homepage, see runs_snapshot.py. The
+        # snapshot of the run cache is only used on the primary, once
+        # update_aggregated_data() has collected the unfinished runs.
+        self.unfinished_runs_snapshot = UnfinishedRunsSnapshot(self)
+        self.stored_runs_snapshot = StoredRunsSnapshot(self)
+        self.aggregated_data_ready = False
+        # Per worker frequencies for the chi2 test, see chi2.py.
+        self.chi2_states = LRUCache(maxsize=500)
+        # Per run starting points for the LLR of update_SPRT().
+        self.llr_warm_starts = LRUCache(maxsize=500)
         self.scheduler = None
         self._shutdown = False
 
@@ -142,6 +168,11 @@ class RunDb:
     def get_runs_index_names(self):
         return set(self.runs.index_information())
 
+    # Requests from the same worker are serialized, see request_task().
+    @lru_cache(expiration=10000)
+    def worker_lock(self, short_worker_name):
+        return threading.Lock()
+
     @lru_cache(maxsize=1000)
     def compile_regex(self, pattern):
         # pattern is already known to compile
@@ -158,7 +189,8 @@ class RunDb:
             self.scheduler = Scheduler(jitter=0.05)
         self.scheduler.create_task(1.0, self.run_cache.flush_buffers, min_delay=1.0)
         self.scheduler.create_task(60.0, self.run_cache.clean_cache)
-        self.scheduler.create_task(60.0, self.scavenge_dead_tasks)
+        # This is cheap, see task_deadlines.py.
+        self.scheduler.create_task(10.0, self.scavenge_dead_tasks)
         self.scheduler.create_task(60.0, self.update_itp)
         # short initial delay to make testing more pleasant
         self.scheduler.create_task(180.0, self.validate_random_run, initial_delay=60.0)
@@ -218,26 +250,23 @@ class RunDb:
             # excess of caution
             run_id = str(run["_id"])
             with self.active_run_lock(run_id):
-                tasks = copy.copy(run["tasks"])
-            for task in tasks:
-                if task["active"]:
-                    concurrency = task["worker_info"]["concurrency"]
-                    nps += concurrency * float(task["worker_info"]["nps"])
-                    if task["worker_info"]["nps"] != 0:
-                        games_per_minute += (
-                            (task["worker_info"]["nps"] / 628000)
-                            * (60.0 / estimate_game_duration(run["args"]["tc"]))
-                            * (
-                                int(task["worker_info"]["concurrency"])
-                                // run["args"].get("threads", 1)
-                            )
-                        )
+                tasks = active_tasks(run["tasks"])
+            for _, task in tasks:
+                worker_info = task["worker_info"]
+                concurrency = worker_info["concurrency"]
+                nps += concurrency * float(worker_info["nps"])
+                if worker_info["nps"] != 0:
+                    games_per_minute += (
+                        (worker_info["nps"] / 628000)
+                        * (60.0 / estimate_game_duration(run["args"]["tc"]))
+                        * (int(concurrency) // run["args"].get("threads", 1))
+                    )
             with self.active_run_lock(run_id):
                 # the run may finish during the time the lock is released
                 if not run["finished"]:
                     run["nps"] = nps
                     run["games_per_minute"] = games_per_minute
-                    self.buffer(run)
+                    self.buffer(run, task_ids=())
 
     def validate_data_structures(self):
         # The main purpose of task is to ensure that the schemas
@@ -295,7 +324,13 @@ class RunDb:
 
         for run in unfinished_runs:
             self.calc_itp(run, user_active.count(run["args"].get("username")))
-            self.buffer(run)
+            self.buffer(run, task_ids=())
+
+            # This also picks up direct changes of the priority.
+            if not run["finished"]:
+                self.run_index.update(run)
+        with self.unfinished_runs_lock:
+            self.run_index.retain(self.unfinished_runs)
 
     def clean_wtt_map(self):
         with self.wtt_lock:
@@ -336,7 +371,7 @@ class RunDb:
         try:
             with self.active_run_lock(run_id):
                 print(f"Validating random run {run_id}...")
-                validate(runs_schema, run, "run")
+                validate(runs_schema, plain_run(run), "run")
         except ValidationError as e:
             message = f"The run object {run_id} does not validate: {str(e)}"
             if "version" in run and run["version"] >= RUN_VERSION:
@@ -357,11 +392,14 @@ class RunDb:
             for task_id in range(len(run["tasks"])):
                 self.set_inactive_task(task_id, run)
             self.unfinished_runs.discard(run_id)
+            self.run_index.remove(run_id)
             run["finished"] = True
             run["nps"] = 0.0
             run["games_per_minute"] = 0.0
             flags = compute_flags(run)
             run.update(flags)
+            # The results of a finished run only change when it is purged.
+            run["results_info"] = format_results(run)
         self.buffer(run, priority=Prio.SAVE_NOW)
 
     def set_active_run(self, run):
@@ -373,6 +411,8 @@ class RunDb:
             run["is_green"] = False
             run["is_yellow"] = False
             run["finished"] = False
+            run.pop("results_info", None)
+            self.run_index.update(run)
         self.buffer(run, priority=Prio.SAVE_NOW)
 
     def set_inactive_task(self, task_id, run):
@@ -393,6 +433,9 @@ class RunDb:
                 if "spsa_params" in task:
                     del task["spsa_params"]
                 task["active"] = False
+                self.task_deadlines.discard(run_id, task_id)
+                if not run["finished"]:
+                    self.run_index.update(run)
                 with self.connections_lock:
                     try:
                         remote_addr = task["worker_info"]["remote_addr"]
@@ -407,7 +450,7 @@ class RunDb:
                             message=message,
                         )
 
-        self.buffer(run, priority=Prio.MEDIUM)
+        self.buffer(run, priority=Prio.MEDIUM, task_ids=(task_id,))
 
     def set_bad_task(self, task_id, run, residual=None, residual_color=None):
         zero_stats = {
@@ -446,9 +489,11 @@ class RunDb:
             # does not change.
             # For safety we also set the stats
             # to zero.
+            if chi2_state := self.chi2_states.get(run_id):
+                chi2_state.remove(task)
             task["bad"] = True
             task["stats"] = copy.deepcopy(zero_stats)
-            self.buffer(run, priority=Prio.MEDIUM)
+            self.buffer(run, priority=Prio.MEDIUM, task_ids=(task_id,))
 
     # Do not run two copies of this function in parallel!
     def update_aggregated_data(self):
@@ -458,6 +503,10 @@ class RunDb:
             self.connections_counter = {}
         with self.unfinished_runs_lock:
             self.unfinished_runs = set()
+        self.aggregated_data_ready = False
+        self.unfinished_runs_snapshot.clear()
+        self.run_index.clear()
+        self.task_deadlines.clear()
 
         for r in self.get_unfinished_runs_id():
             run_id = str(r["_id"])
@@ -525,14 +574,14 @@ class RunDb:
                 with self.unfinished_runs_lock:
                     self.unfinished_runs.add(run_id)
 
-                for task_id, task in enumerate(run["tasks"]):
-                    if task["active"]:
-                        with self.connections_lock:
-                            remote_addr = task["worker_info"]["remote_addr"]
-                            if remote_addr in self.connections_counter:
-                                self.connections_counter[remote_addr] += 1
-                            else:
-                                self.connections_counter[remote_addr] = 1
+                for task_id, task in active_tasks(run["tasks"]):
+                    with self.connections_lock:
+                        remote_addr = task["worker_info"]["remote_addr"]
+                        if remote_addr in self.connections_counter:
+                            self.connections_counter[remote_addr] += 1
+                        else:
+                            self.connections_counter[remote_addr] = 1
+                    self.task_deadlines.refresh(run_id, task_id, task["last_updated"])
 
                 if not is_undecided(run):
                     print(
@@ -550,6 +599,7 @@ class RunDb:
                 for task_id in range(len(run["tasks"])):
                     self.insert_in_wtt_map(run_id, task_id)
 
+        self.aggregated_data_ready = True
         self.update_itp()
         self.update_nps_gpm()
         self.update_books()
@@ -717,13 +767,35 @@ class RunDb:
         run_id = str(new_run["_id"])
         with self.unfinished_runs_lock:
             self.unfinished_runs.add(run_id)
+        self.run_index.update(new_run)
         return run_id
 
     def is_primary_instance(self):
         return self.__is_primary_instance
 
+    def get_chi2_state(self, run):
+        # Only the primary instance sees all updates of the tasks.
+        if not self.__is_primary_instance:
+            return Chi2State(run["tasks"])
+        run_id = str(run["_id"])
+        with self.active_run_lock(run_id):
+            chi2_state = self.chi2_states.get(run_id)
+            # A changed number of tasks means we missed an update.
+            if chi2_state is None or chi2_state.task_count != len(run["tasks"]):
+                chi2_state = self.chi2_states[run_id] = Chi2State(run["tasks"])
+            return chi2_state
+
+    def get_chi2(self, run):
+        return self.get_chi2_state(run).get_chi2(run["tasks"])
+
     def upload_pgn(self, run_id, pgn_zip):
         record = {"run_id": run_id, "pgn_zip": pgn_zip, "size": len(pgn_zip)}
+        # run_id is "<run_id>-<task_id>". The parts are also stored
+        # separately so that get_run_pgns() can use an index.
+        run, _, task_id = run_id.partition("-")
+        if ObjectId.is_valid(run) and task_id.isdigit():
+            record["run_oid"] = ObjectId(run)
+            record["task_id"] = int(task_id)
         try:
             validate(pgns_schema, record)
         except ValidationError as e:
@@ -736,6 +808,12 @@ class RunDb:
         self.pgndb.insert_one(
             record,
         )
+        if "run_oid" in record:
+            self.pgn_sizes.update_one(
+                {"_id": record["run_oid"]},
+                {"$inc": {"size": record["size"], "count": 1}},
+                upsert=True,
+            )
         return {}
 
     def get_pgn(self, run_id):
@@ -743,19 +821,38 @@ class RunDb:
         return (pgn["pgn_zip"], pgn["size"]) if pgn else (None, 0)
 
     def get_run_pgns(self, run_id):
-        # Compute the total size using MongoDB's aggregation framework
+        """Return an iterator over the pgn.gz files of the run, sorted by
+        task_id, and their total size. The files are yielded as they come
+        from the database, so memory use does not depend on their number."""
         pgns_query = {"run_id": {"$regex": f"^{run_id}-\\d+"}}
-        total_size_agg = self.pgndb.aggregate(
-            [
-                {"$match": pgns_query},
-                {"$project": {"size": 1, "_id": 0}},
-                {"$group": {"_id": None, "totalSize": {"$sum": "$size"}}},
-            ]
-        )
-        total_size = total_size_agg.next()["totalSize"] if total_size_agg.alive else 0
-
-        if total_size > 0:
-            # Create a file reader from a generator that yields each pgn.gz file sorted for task_id
+        sizes = None
+        if ObjectId.is_valid(run_id):
+            sizes = self.pgn_sizes.find_one({"_id": ObjectId(run_id)})
+        # A run that was active across the deploy of pgn_sizes also has
+        # pgns without run_oid, which pgn_sizes does not count. Counting
+        # the pgns of the run only scans the run_id index.
+        if sizes is not None and sizes["count"] == self.pgndb.count_documents(
+            pgns_query
+        ):
+            total_size = sizes["size"]
+            pgns = self.pgndb.find(
+                {"run_oid": ObjectId(run_id)},
+                {"pgn_zip": 1, "_id": 0},
+                sort=[("task_id", ASCENDING)],
+                batch_size=16,
+            )
+        else:
+            # Some pgns were uploaded before run_oid and task_id were stored.
+            total_size_agg = self.pgndb.aggregate(
+                [
+                    {"$match": pgns_query},
+                    {"$project": {"size": 1, "_id": 0}},
+                    {"$group": {"_id": None, "totalSize": {"$sum": "$size"}}},
+                ]
+            )
+            total_size = (
+                total_size_agg.next()["totalSize"] if total_size_agg.alive else 0
+            )
             pipeline = [
                 {"$match": pgns_query},
                 {
@@ -770,12 +867,19 @@ class RunDb:
                 {"$sort": {"task_id": 1}},
                 {"$project": {"pgn_zip": 1, "_id": 0}},
             ]
-            pgns = self.pgndb.aggregate(pipeline)
-            pgns_reader = GeneratorAsFileReader(pgn["pgn_zip"] for pgn in pgns)
-        else:
-            pgns_reader = None
+            pgns = self.pgndb.aggregate(pipeline) if total_size > 0 else None
+
+        if not total_size:
+            if pgns is not None:
+                pgns.close()
+            return None, 0
 
-        return pgns_reader, total_size
+        def iter_pgns():
+            with pgns:
+                for pgn in pgns:
+                    yield pgn["pgn_zip"]
+
+        return iter_pgns(), total_size
 
     def write_nn(self, net):
         validate(nn_schema, net, "net")
@@ -829,17 +933,23 @@ class RunDb:
         gh.save()
 
     def scavenge_dead_tasks(self):
-        with self.unfinished_runs_lock:
-            unfinished_runs = [
-                (run_id, self.get_run(run_id)) for run_id in self.unfinished_runs
-            ]
         now = time.time()
         dead_tasks = []
-        for run_id, run in unfinished_runs:
+        for run_id, task_id in self.task_deadlines.pop_expired(now):
+            run = self.get_run(run_id)
+            if run is None:
+                continue
             with self.active_run_lock(run_id):
-                for task_id, task in enumerate(run["tasks"]):
-                    if task["active"] and task["last_updated"].timestamp() < now - 360:
-                        dead_tasks.append((task_id, task, run))
+                if run["finished"] or task_id >= len(run["tasks"]):
+                    continue
+                task = run["tasks"][task_id]
+                if not task["active"]:
+                    continue
+                # The deadline index is only a hint.
+                if task["last_updated"].timestamp() >= now - self.dead_task_timeout:
+                    self.task_deadlines.refresh(run_id, task_id, task["last_updated"])
+                    continue
+                dead_tasks.append((task_id, task, run))
 
         for task_id, task, run in dead_tasks:
             print(
@@ -917,71 +1027,31 @@ class RunDb:
 
         machines = []
         for run in active_runs:
-            if not any(task["active"] for task in reversed(run["tasks"])):
-                continue
-            for task_id, task in enumerate(run["tasks"]):
-                if task["active"]:
-                    machines.append(
-                        task["worker_info"]
-                        | {
-                            "last_updated": (
-                                task["last_updated"]
-                                if task.get("last_updated")
-                                else None
-                            ),
-                            "run": run,
-                            "task_id": task_id,
-                        }
-                    )
+            for task_id, task in active_tasks(run["tasks"]):
+                machines.append(
+                    task["worker_info"]
+                    | {
+                        "last_updated": (
+                            task["last_updated"] if task.get("last_updated") else None
+                        ),
+                        "run": run,
+                        "task_id": task_id,
+                    }
+                )
         return machines
 
     def aggregate_unfinished_runs(self, username=None):
-        unfinished_runs = self.get_unfinished_runs(username=username)
-        runs = {"pending": [], "active": []}
-        for run in unfinished_runs:
-            state = "active" if run["workers"] > 0 else "pending"
-            runs[state].append(run)
-        runs["pending"].sort(
-            key=lambda run: (
-                run["args"]["priority"],
-                run["args"]["itp"] if "itp" in run["args"] else 100,
-            )
-        )
-        runs["active"].sort(
-            reverse=True,
-            key=lambda run: (
-                "sprt" in run["args"],
-                run["args"].get("sprt", {}).get("llr", 0),
-                "spsa" not in run["args"],
-                run["results"]["wins"]
-                + run["results"]["draws"]
-                + run["results"]["losses"],
-            ),
-        )
-
-        cores = 0
-        machines_count = 0
-        nps = 0.0
-        games_per_minute = 0.0
-        for run in runs["active"]:
-            machines_count += run["workers"]
-            cores += run["cores"]
-            nps += run.get("nps", 0.0)
-            games_per_minute += run.get("games_per_minute", 0.0)
-
-        pending_hours = 0
-        for run in runs["pending"] + runs["active"]:
-            if cores > 0:
-                eta = remaining_hours(run) / cores
-                pending_hours += eta
-        return (
-            runs,
-            pending_hours,
-            cores,
-            nps,
-            games_per_minute,
-            machines_count,
-        )
+        if self.__is_primary_instance and self.aggregated_data_ready:
+            # This is cheap, see runs_snapshot.py.
+            return self.unfinished_runs_snapshot.get(username=username)
+        return self.stored_runs_snapshot.get(username=username)
+
+    def run_version(self, run_id):
+        """The version of the run, or None if it is not versioned, see
+        http/conditional.py. Only the primary instance sees all updates."""
+        if self.__is_primary_instance:
+            return self.run_cache.run_version(run_id)
+        return None
 
     def get_finished_runs(
         self,
@@ -1355,8 +1425,9 @@ class RunDb:
 
     # Caps concurrent /api/request_task threadpool usage to
     # TASK_SEMAPHORE_SIZE (5) out of THREADPOOL_TOKENS (200).
-    # Only 1 thread is active inside request_task_lock; the other 4
-    # absorb arrival jitter.  195 tokens stay free for beat/update_task.
+    # The admitted threads schedule in parallel, they only contend
+    # on the active_run_lock of the run they select.  195 tokens stay
+    # free for beat/update_task.
     # Derivation: docs/2-threading-model.md "Task scheduling throttle".
     task_semaphore = threading.Semaphore(TASK_SEMAPHORE_SIZE)
 
@@ -1392,10 +1463,16 @@ After fixing the issues you can unblock the worker at
 **********************************************************************
 """
 
+    # Number of times we select another run when the selected run
+    # was exhausted by a concurrent request_task.
+    request_task_attempts = 3
+
     def request_task(self, worker_info):
         if self.task_semaphore.acquire(False):
             try:
-                with self.request_task_lock:
+                # Two connections with the same worker name must not pass
+                # the checks in sync_request_task() simultaneously.
+                with self.worker_lock(worker_name(worker_info, short=True)):
                     return self.sync_request_task(worker_info)
             finally:
                 self.task_semaphore.release()
@@ -1444,17 +1521,33 @@ After fixing the issues you can unblock the worker at
                             return {"task_waiting": False, "error": error}
 
         # We see if the worker has reached the number of allowed connections from the same ip
-        # address.
+        # address. If not, we reserve a connection which is given back if no task is
+        # assigned. The check and the reservation must be atomic since other requests
+        # from this ip address may be scheduled concurrently.
+        remote_addr = worker_info["remote_addr"]
+        connections_limit = self.userdb.get_machine_limit(worker_info["username"])
         with self.connections_lock:
-            connections_limit = self.userdb.get_machine_limit(worker_info["username"])
-            connections = self.connections_counter.get(worker_info["remote_addr"], 0)
+            connections = self.connections_counter.get(remote_addr, 0)
             if connections >= connections_limit:
                 error = "Request_task: Machine limit reached for user {}".format(
                     worker_info["username"]
                 )
                 print(error, flush=True)
                 return {"task_waiting": False, "error": error}
+            self.connections_counter[remote_addr] = connections + 1
 
+        ret = None
+        try:
+            ret = self.__assign_task(worker_info, my_name)
+        finally:
+            if ret is None or "task_id" not in ret:
+                with self.connections_lock:
+                    self.connections_counter[remote_addr] -= 1
+                    if self.connections_counter[remote_addr] == 0:
+                        del self.connections_counter[remote_addr]
+        return ret
+
+    def __assign_task(self, worker_info, my_name):
         # Collect some data about the worker that will be used below.
         max_threads = int(worker_info["concurrency"])
         min_threads = int(worker_info.get("min_threads", 1))
@@ -1463,67 +1556,20 @@ After fixing the issues you can unblock the worker at
         worker_arch = worker_info["worker_arch"]
         worker_compiler = worker_info["compiler"]
 
-        # Now we sort the list of unfinished runs according to priority.
+        # The run_index visits the unfinished runs in order of priority,
+        # see run_index.py for the exact ordering.
         last_run_id = self.worker_runs.get(my_name, {}).get("last_run", None)
 
-        def priority(run):
-            # We re-add the number of cores that were freed by this worker when the previous
-            # task on this run finished. If we don't do this then this worker is likely to pick
-            # up this run again, especially if it has many cores.
-            adjusted_cores = run["cores"] + (
-                max_threads if str(run["_id"]) == last_run_id else 0
-            )
-
-            # lower is better
-            return (
-                # Always consider the higher priority runs first
-                -run["args"]["priority"],
-                # Make sure all runs at this priority level get _some_ cores
-                adjusted_cores > 0,
-                # Try to match run["args"]["itp"].
-                # The added term max_threads/2 is to mitigate granularity issues with large core workers.
-                (adjusted_cores + max_threads / 2) / run["args"]["itp"],
-            )
-
-        # Use a local copy of (the sorted) unfinished runs list so that it does
-        # not change under our nose.
-        with self.unfinished_runs_lock:
-            unfinished_runs = [self.get_run(run_id) for run_id in self.unfinished_runs]
-        unfinished_runs = sorted(unfinished_runs, key=priority)
-
-        # Now go through the sorted list of unfinished runs.
-        # We will add a task to the first run that is suitable.
-
-        run_found = False
-
-        for run in unfinished_runs:
-            run_id = str(run["_id"])
-
-            if run["finished"]:
-                continue
-
-            if not run["approved"]:
-                continue
-
-            if run["args"]["threads"] > max_threads:
-                continue
-
-            if run["args"]["threads"] < min_threads:
-                continue
-
-            # Check if there aren't already enough workers
-            # working on this run.
-            committed_games = run["committed_games"]
+        def suitable(entry):
+            # First the checks that only use data cached in the index.
+            if entry.threads > max_threads:
+                return False
 
-            remaining = run["args"]["num_games"] - committed_games
-            if remaining <= 0:
-                continue
+            if entry.threads < min_threads:
+                return False
 
             # We check if the worker has reserved enough memory
-            need_tt = 0
-            need_tt += get_hash(run["args"]["new_options"])
-            need_tt += get_hash(run["args"]["base_options"])
-            need_tt *= max_threads // run["args"]["threads"]
+            need_tt = entry.hash * (max_threads // entry.threads)
             # Needed for fastchess with the fairly large UHO_Lichess_4852_v1.epd opening book
             need_base = 220
             # Needed for binaries
@@ -1533,47 +1579,54 @@ After fixing the issues you can unblock the worker at
             # estimate another 12 per process, 16MB per thread, and 133+6MB for large and small net
             # Note that changes here need the corresponding worker change to STC_memory, which limits concurrency
             need_base += (
-                2
-                * (max_threads // run["args"]["threads"])
-                * (12 + 139 + 31 * run["args"]["threads"])
+                2 * (max_threads // entry.threads) * (12 + 139 + 31 * entry.threads)
             )
 
             if need_base + need_tt > max_memory:
-                continue
+                return False
+
+            # check if we have the correct compiler
+            if entry.compiler != "" and entry.compiler != worker_compiler:
+                return False
+
+            run = self.get_run(entry.run_id)
+            if run is None or run["finished"]:
+                return False
+
+            if not run["approved"]:
+                return False
+
+            # Check if there aren't already enough workers
+            # working on this run.
+            remaining = run["args"]["num_games"] - run["committed_games"]
+            if remaining <= 0:
+                return False
 
             # GitHub API limit...
             if near_github_api_limit:
                 have_binary = (
-                    my_name in self.worker_runs and run_id in self.worker_runs[my_name]
+                    my_name in self.worker_runs
+                    and entry.run_id in self.worker_runs[my_name]
                 )
                 if not have_binary:
-                    continue
+                    return False
 
             # Limit the number of cores.
-            # Currently this is only done for spsa.
-            if "spsa" in run["args"]:
-                limit_cores = 200000 / math.sqrt(len(run["args"]["spsa"]["params"]))
-            else:
-                limit_cores = 1000000  # infinity
-
-            if run["cores"] > limit_cores:
-                continue
+            if run["cores"] > entry.limit_cores:
+                return False
 
             # check if we satisfy the arch filter
-            arch_filter = run["args"].get("arch_filter", "")
-            if arch_filter != "":
-                arch_filter_re = self.compile_regex(arch_filter)
+            if entry.arch_filter != "":
+                arch_filter_re = self.compile_regex(entry.arch_filter)
                 # We use a timeout to protect against redos attacks.
                 # The timeout of 100ms should never trigger with a legitimate
                 # arch string.
                 # See https://github.com/official-stockfish/fishtest/pull/2428#issuecomment-3715147268
                 try:
                     if arch_filter_re.search(worker_arch, timeout=0.1) is None:
-                        continue
+                        return False
                 except Exception as e:
-                    message = (
-                        f"Matching {worker_arch} against {arch_filter} failed: {e}"
-                    )
+                    message = f"Matching {worker_arch} against {entry.arch_filter} failed: {e}"
                     self.actiondb.log_message(
                         username="fishtest.system",
                         message=message,
@@ -1583,85 +1636,45 @@ After fixing the issues you can unblock the worker at
                         flush=True,
                     )
 
-            # check if we have the correct compiler
-            compiler = run["args"].get("compiler", "")
-            if compiler != "" and compiler != worker_compiler:
-                continue
-
             # If we make it here, it means we have found a run
             # suitable for a new task.
-            run_found = True
-            break
-
-        # If there is no suitable run, tell the worker.
-        if not run_found:
-            return {"task_waiting": False}
-
-        # Now we create a new task for this run.
-        run_id = str(run["_id"])
-        with self.active_run_lock(run_id):
-            # It may happen that the run we have selected is now finished or
-            # has enough games.
-            # Since this is very rare we just return instead of cluttering the
-            # code with remedial actions.
-
-            # First recompute "remaining" because the value computed above was not
-            # synchronized.
-            remaining = run["args"]["num_games"] - run["committed_games"]
-
-            if run["finished"] or remaining <= 0:
-                info = (
-                    f"Request_task: alas the run {run_id} corresponding to the "
-                    "assigned task no longer needs games. Please try again..."
-                )
-                print(info, flush=True)
-                return {"task_waiting": False, "info": info}
-
-            opening_offset = run["total_games"]
-
-            if "sprt" in run["args"]:
-                sprt_batch_size_games = 2 * run["args"]["sprt"]["batch_size"]
-                remaining = sprt_batch_size_games * math.ceil(
-                    remaining / sprt_batch_size_games
-                )
-
-            task_size = min(self.worker_cap(run, worker_info), remaining)
-            task = {
-                "num_games": task_size,
-                "active": True,
-                "worker_info": worker_info,
-                "last_updated": datetime.now(UTC),
-                "start": opening_offset,
-                "stats": {
-                    "wins": 0,
-                    "losses": 0,
-                    "draws": 0,
-                    "crashes": 0,
-                    "time_losses": 0,
-                    "pentanomial": 5 * [0],
-                },
-            }
-            run["tasks"].append(task)
-
-            with self.connections_lock:
-                remote_addr = worker_info["remote_addr"]
-                if remote_addr in self.connections_counter:
-                    self.connections_counter[remote_addr] += 1
-                else:
-                    self.connections_counter[remote_addr] = 1
+            return True
+
+        # The run is selected without holding any lock, so it may have finished
+        # or may have received its last games from a concurrent request by
+        # the time we lock it. In that case we try the next suitable run.
+        rejected = set()
+        for _ in range(self.request_task_attempts):
+            run_id = self.run_index.find(
+                suitable, max_threads, last_run_id=last_run_id, exclude=rejected
+            )
 
-            task_id = len(run["tasks"]) - 1
+            # If there is no suitable run, tell the worker.
+            if run_id is None:
+                return {"task_waiting": False}
 
-            run["workers"] += 1
-            run["cores"] += task["worker_info"]["concurrency"]
-            run["committed_games"] += task["num_games"]
-            run["total_games"] += task["num_games"]
+            run = self.get_run(run_id)
+            with self.active_run_lock(run_id):
+                # Recompute "remaining" because the value computed in suitable()
+                # was not synchronized.
+                remaining = run["args"]["num_games"] - run["committed_games"]
+                if not run["finished"] and remaining > 0:
+                    task_id = self.__create_task(run, worker_info, remaining)
+                    break
+            rejected.add(run_id)
+        else:
+            info = (
+                f"Request_task: alas the run {run_id} corresponding to the "
+                "assigned task no longer needs games. Please try again..."
+            )
+            print(info, flush=True)
+            return {"task_waiting": False, "info": info}
 
         # We give up the lock to avoid deadlock
 
         self.insert_in_wtt_map(run_id, task_id)
 
-        self.buffer(run, priority=Prio.HIGH)
+        self.buffer(run, priority=Prio.HIGH, task_ids=(task_id,))
 
         # Cache some data. Currently we record the id's
         # the worker has seen, as well as the last id that was seen.
@@ -1673,6 +1686,47 @@ After fixing the issues you can unblock the worker at
 
         return {"run": run, "task_id": task_id}
 
+    def __create_task(self, run, worker_info, remaining):
+        # Must be called with the run lock held. The connection of the
+        # worker has already been counted by sync_request_task().
+        opening_offset = run["total_games"]
+
+        if "sprt" in run["args"]:
+            sprt_batch_size_games = 2 * run["args"]["sprt"]["batch_size"]
+            remaining = sprt_batch_size_games * math.ceil(
+                remaining / sprt_batch_size_games
+            )
+
+        task_size = min(self.worker_cap(run, worker_info), remaining)
+        task = {
+            "num_games": task_size,
+            "active": True,
+            "worker_info": worker_info,
+            "last_updated": datetime.now(UTC),
+            "start": opening_offset,
+            "stats": {
+                "wins": 0,
+                "losses": 0,
+                "draws": 0,
+                "crashes": 0,
+                "time_losses": 0,
+                "pentanomial": 5 * [0],
+            },
+        }
+        run["tasks"].append(task)
+        if chi2_state := self.chi2_states.get(str(run["_id"])):
+            chi2_state.append(task)
+
+        task_id = len(run["tasks"]) - 1
+        self.task_deadlines.refresh(run["_id"], task_id, task["last_updated"])
+
+        run["workers"] += 1
+        run["cores"] += task["worker_info"]["concurrency"]
+        run["committed_games"] += task["num_games"]
+        run["total_games"] += task["num_games"]
+        self.run_index.update(run)
+        return task_id
+
     def finished_run_message(self, run):
         if "spsa" in run["args"]:
             return "SPSA tune finished"
@@ -1686,7 +1740,7 @@ After fixing the issues you can unblock the worker at
             elo0 = sprt["elo0"]
             elo1 = sprt["elo1"]
             results = run["results"]
-            a = SPRT_elo(
+            a = SPRT_elo_cached(
                 results,
                 alpha=alpha,
                 beta=beta,
@@ -1822,9 +1876,15 @@ After fixing the issues you can unblock the worker at
 
         # Update run["tasks"][task_id] (=task).
 
+        chi2_state = self.chi2_states.get(run_id)
+        if chi2_state is not None:
+            chi2_state.remove(task)
         task["stats"] = stats
         task["last_updated"] = update_time
+        self.task_deadlines.refresh(run_id, task_id, update_time)
         task["worker_info"] = worker_info  # updates rate, ARCH, nps
+        if chi2_state is not None:
+            chi2_state.add(task)
 
         if "spsa" in run["args"] and spsa_games == spsa_results["num_games"]:
             self.spsa_handler.update_spsa_data(run_id, task_id, spsa_results)
@@ -1840,7 +1900,12 @@ After fixing the issues you can unblock the worker at
 
         if "sprt" in run["args"]:
             sprt = run["args"]["sprt"]
-            fishtest.stats.stat_util.update_SPRT(run["results"], sprt)
+            warm_start = self.llr_warm_starts.get(run_id)
+            if warm_start is None:
+                warm_start = self.llr_warm_starts[run_id] = {}
+            fishtest.stats.stat_util.update_SPRT(
+                run["results"], sprt, warm_start=warm_start
+            )
 
         # Stop the run if finished.
 
@@ -1857,7 +1922,7 @@ After fixing the issues you can unblock the worker at
             # done by stop_run.
             ret = {"task_alive": False}
         else:
-            self.buffer(run)
+            self.buffer(run, task_ids=(task_id,))
             ret = {"task_alive": task["active"]}
 
         return ret
@@ -1981,13 +2046,15 @@ After fixing the issues you can unblock the worker at
                 # The residual or residual color may not have been set yet
                 self.set_bad_task(task_id, run, residual=10.0, residual_color="red")
 
-        chi2 = get_chi2(run["tasks"])
+        chi2_state = self.get_chi2_state(run)
+        chi2 = chi2_state.get_chi2(run["tasks"])
         bad_workers = get_bad_workers(
             run["tasks"],
             cached_chi2=chi2,
             p=p,
             res=res,
             iters=iters - 1 if message == "" else iters,
+            chi2_state=chi2_state,
         )
         tasks = copy.copy(run["tasks"])
         for task_id, task in enumerate(tasks):
@@ -2013,5 +2080,6 @@ After fixing the issues you can unblock the worker at
             else:
                 flags = compute_flags(run)
                 run.update(flags)
+                run["results_info"] = format_results(run)
                 self.buffer(run, priority=Prio.SAVE_NOW)
         return message
@@ -0,0 +1,217 @@
+import copy
+import threading
+import time
+
+from fishtest.util import remaining_hours_batch
+
+"""
+RunDb.aggregate_unfinished_runs feeds the homepage and the run tables,
+which every open browser tab polls. Both are served by the secondary
+instances (see docs/8-deployment.md). Instead of querying the unfinished
+runs on every request, each instance serves an immutable snapshot of them.
+
+On a secondary instance, StoredRunsSnapshot reads the unfinished runs from
+the database with a single query when the snapshot is older than
+SNAPSHOT_MIN_AGE. The number of viewers no longer multiplies the load on
+the database. The primary already holds all the unfinished runs in the
+run cache, so UnfinishedRunsSnapshot builds its snapshot from there.
+
+Every call of RunCache.buffer() bumps RunCache.version, and buffer() with
+Prio.SAVE_NOW (new, modified, approved, finished runs...) also bumps
+RunCache.major_version. A snapshot is rebuilt when it is read and
+
+- the major version changed, so that the effect of the actions of a user
+  is visible on the next page load;
+- the version changed and the snapshot is older than SNAPSHOT_MIN_AGE,
+  so that the stream of task updates costs at most one rebuild per
+  SNAPSHOT_MIN_AGE;
+- the snapshot is older than SNAPSHOT_MAX_AGE, as a safety net for
+  changes that do not go through buffer().
+
+The runs of a snapshot are deep copies, without the tasks, in the same
+format as the lightweight projection of RunDb.get_unfinished_runs(). They
+are shared by all readers, which must not modify them. The aggregates for
+a single user are computed from the snapshot when first requested.
+"""
+
+SNAPSHOT_MIN_AGE = 1.0
+SNAPSHOT_MAX_AGE = 10.0
+
+
+def aggregate_runs(unfinished_runs):
+    """Return (runs, pending_hours, cores, nps, games_per_minute,
+    machines_count), see RunDb.aggregate_unfinished_runs."""
+    runs = {"pending": [], "active": []}
+    for run in unfinished_runs:
+        state = "active" if run["workers"] > 0 else "pending"
+        runs[state].append(run)
+    runs["pending"].sort(
+        key=lambda run: (
+            run["args"]["priority"],
+            run["args"]["itp"] if "itp" in run["args"] else 100,
+        )
+    )
+    runs["active"].sort(
+        reverse=True,
+        key=lambda run: (
+            "sprt" in run["args"],
+            run["args"].get("sprt", {}).get("llr", 0),
+            "spsa" not in run["args"],
+            run["results"]["wins"] + run["results"]["draws"] + run["results"]["losses"],
+        ),
+    )
+
+    cores = 0
+    machines_count = 0
+    nps = 0.0
+    games_per_minute = 0.0
+    for run in runs["active"]:
+        machines_count += run["workers"]
+        cores += run["cores"]
+        nps += run.get("nps", 0.0)
+        games_per_minute += run.get("games_per_minute", 0.0)
+
+    pending_hours = 0
+    if cores > 0:
+        remaining = remaining_hours_batch(runs["pending"] + runs["active"])
+        pending_hours = float(remaining.sum()) / cores
+    return (
+        runs,
+        pending_hours,
+        cores,
+        nps,
+        games_per_minute,
+        machines_count,
+    )
+
+
+def lightweight_copy(run):
+    """Must be called with the run lock held."""
+    run = {k: v for k, v in run.items() if k not in ("tasks", "bad_tasks")}
+    spsa = run["args"].get("spsa")
+    if spsa is not None and "param_history" in spsa:
+        spsa = {k: v for k, v in spsa.items() if k != "param_history"}
+        run["args"] = run["args"] | {"spsa": spsa}
+    return copy.deepcopy(run)
+
+
+class Snapshot:
+    def __init__(self, version, major_version, runs):
+        self.version = version
+        self.major_version = major_version
+        self.time = time.monotonic()
+        self.runs = runs
+        self.aggregate = aggregate_runs(runs)
+        self.lock = threading.Lock()
+        self.user_aggregates = {}
+
+    def user_aggregate(self, username):
+        with self.lock:
+            aggregate = self.user_aggregates.get(username)
+            if aggregate is None:
+                aggregate = aggregate_runs(
+                    run for run in self.runs if run["args"]["username"] == username
+                )
+                self.user_aggregates[username] = aggregate
+            return aggregate
+
+
+class UnfinishedRunsSnapshot:
+    def __init__(self, rundb):
+        self.rundb = rundb
+        self.snapshot = None
+        # Only one thread rebuilds the snapshot, the others use the old one.
+        self.build_lock = threading.Lock()
+
+    def get(self, username=None):
+        snapshot = self.snapshot
+        if snapshot is None or self.__is_stale(snapshot):
+            snapshot = self.__rebuild()
+        if username:
+            return snapshot.user_aggregate(username)
+        return snapshot.aggregate
+
+    def clear(self):
+        self.snapshot = None
+
+    def __must_rebuild(self, snapshot):
+        return (
+            snapshot is None
+            or snapshot.major_version != self.rundb.run_cache.major_version
+        )
+
+    def __is_stale(self, snapshot):
+        if self.__must_rebuild(snapshot):
+            return True
+        age = time.monotonic() - snapshot.time
+        if snapshot.version != self.rundb.run_cache.version:
+            return age >= SNAPSHOT_MIN_AGE
+        return age >= SNAPSHOT_MAX_AGE
+
+    def __rebuild(self):
+        snapshot = self.snapshot
+        # Unless the snapshot is unusable, readers do not wait for a
+        # rebuild in progress.
+        if not self.build_lock.acquire(blocking=self.__must_rebuild(snapshot)):
+            return snapshot
+        try:
+            snapshot = self.snapshot
+            if snapshot is not None and not self.__is_stale(snapshot):
+                return snapshot
+            rundb = self.rundb
+            # Read the versions first, a concurrent change leaves the
+            # snapshot stale.
+            version = rundb.run_cache.version
+            major_version = rundb.run_cache.major_version
+            with rundb.unfinished_runs_lock:
+                run_ids = list(rundb.unfinished_runs)
+            runs = []
+            for run_id in run_ids:
+                run = rundb.get_run(run_id)
+                if run is None:
+                    continue
+                with rundb.active_run_lock(run_id):
+                    if not run["finished"]:
+                        runs.append(lightweight_copy(run))
+            snapshot = self.snapshot = Snapshot(version, major_version, runs)
+            return snapshot
+        finally:
+            self.build_lock.release()
+
+
+class StoredRunsSnapshot:
+    def __init__(self, rundb):
+        self.rundb = rundb
+        self.snapshot = None
+        # Only one thread queries the database, the others use the old
+        # snapshot.
+        self.build_lock = threading.Lock()
+
+    def get(self, username=None):
+        snapshot = self.snapshot
+        if snapshot is None or self.__is_stale(snapshot):
+            snapshot = self.__rebuild()
+        if username:
+            return snapshot.user_aggregate(username)
+        return snapshot.aggregate
+
+    def clear(self):
+        self.snapshot = None
+
+    @staticmethod
+    def __is_stale(snapshot):
+        return time.monotonic() - snapshot.time >= SNAPSHOT_MIN_AGE
+
+    def __rebuild(self):
+        snapshot = self.snapshot
+        if not self.build_lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            snapshot = self.snapshot
+            if snapshot is not None and not self.__is_stale(snapshot):
+                return snapshot
+            runs = list(self.rundb.get_unfinished_runs())
+            snapshot = self.snapshot = Snapshot(None, None, runs)
+            return snapshot
+        finally:
+            self.build_lock.release()
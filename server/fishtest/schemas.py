@@ -45,6 +45,7 @@ from fishtest.constants import (
     supported_arches,
     supported_compilers,
 )
+from fishtest.task_store import active_tasks
 
 run_id = intersect(str, set_name(ObjectId.is_valid, "valid_object_id"))
 run_id_pgns = regex(r"[a-f0-9]{24}-(0|[1-9]\d*)", name="run_id_pgns")
@@ -70,7 +71,8 @@ tc = regex(r"([1-9]\d*/)?\d+(\.\d+)?(\+\d+(\.\d+)?)?", name="tc")
 str_int = regex(r"[1-9]\d*", name="str_int")
 sha = regex(r"[a-f0-9]{40}", name="sha")
 sri384 = regex(r"(sha384-)?[0-9A-Za-z+/]{64}", name="sri384")
-uuid = regex(r"[0-9a-zA-Z]{2,8}(-[a-f0-9]{4}){3}-[a-f0-9]{12}", name="uuid")
+UUID_PATTERN = r"[0-9a-zA-Z]{2,8}(-[a-f0-9]{4}){3}-[a-f0-9]{12}"
+uuid = regex(UUID_PATTERN, name="uuid")
 country_code = regex(r"[A-Z][A-Z]", name="country_code")
 epd_file = glob("*.epd", name="epd_file")
 pgn_file = glob("*.pgn", name="pgn_file")
@@ -109,14 +111,21 @@ def size_is_length(pgn_doc):
     return pgn_doc["size"] == len(pgn_doc["pgn_zip"])
 
 
+def run_id_is_split(pgn_doc):
+    return pgn_doc["run_id"] == f"{pgn_doc['run_oid']}-{pgn_doc['task_id']}"
+
+
 pgns_schema = intersect(
     {
         "_id?": ObjectId,
         "run_id": run_id_pgns,
+        "run_oid": ObjectId,
+        "task_id": uint,
         "pgn_zip": intersect(bytes, gzip_data),
         "size": uint,
     },
     size_is_length,
+    run_id_is_split,
 )
 
 user_schema = {
@@ -500,6 +509,8 @@ def valid_spsa_results(stats):
     return stats["wins"] + stats["losses"] + stats["draws"] == stats["num_games"]
 
 
+# api_access_schema and api_schema have fast path equivalents in
+# api_validation.py, keep them in sync.
 api_access_schema = lax({"password": str, "worker_info": {"username": username}})
 
 api_schema = intersect(
@@ -551,18 +562,13 @@ def compute_results(run):
 
 def compute_cores(run):
     cores = 0
-    for task in run["tasks"]:
-        if task["active"]:
-            cores += task["worker_info"]["concurrency"]
+    for _, task in active_tasks(run["tasks"]):
+        cores += task["worker_info"]["concurrency"]
     return cores
 
 
 def compute_workers(run):
-    workers = 0
-    for task in run["tasks"]:
-        if task["active"]:
-            workers += 1
-    return workers
+    return len(active_tasks(run["tasks"]))
 
 
 def compute_committed_games(run):
@@ -732,6 +738,7 @@ runs_schema = intersect(
         "committed_games": uint,
         "total_games": uint,
         "results": results_schema,
+        "results_info?": {"style": str, "info": [str, ...]},
         "nps": ufloat,
         "games_per_minute": ufloat,
         "args": intersect(
@@ -901,6 +908,10 @@ cache_schema = {
         "last_sync_time": timestamp,  # Last sync time (reading from or writing to db). If never synced then creation time.
         "last_access_time": timestamp,  # Last time the cache entry was touched (via buffer() or get_run()).
         "priority": int,  # Entries with higher priority are synced first.
+        "changed_since": union(timestamp, None),  # When the entry became dirty.
+        "changed_tasks": {uint, ...},  # Tasks to be written by the next flush.
+        "full_write": bool,  # If set, the next flush replaces the full document.
+        "digests": union({str: bytes}, None),  # Top-level fields as last written.
     },
 }
 
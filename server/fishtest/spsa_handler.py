@@ -113,7 +113,7 @@ class SPSAHandler:
         task["spsa_params"] = {}
         task["spsa_params"]["iter"] = spsa["iter"]
         task["spsa_params"]["packed_flips"] = packed_flips
-        self.buffer(run)
+        self.buffer(run, task_ids=(task_id,))
         # The signature defends against server crashes and worker bugs
         sig = zlib.crc32(packed_flips)
         result["sig"] = sig
@@ -170,7 +170,7 @@ class SPSAHandler:
 
         _add_to_history(spsa, run["args"]["num_games"], w_params)
 
-        self.buffer(run)
+        self.buffer(run, task_ids=(task_id,))
 
     def get_spsa_data(self, run_id):
         run = self.get_run(run_id)
@@ -0,0 +1,148 @@
+import math
+
+from fishtest.stats import LLRcalc
+
+"""
+Faster versions of the LLRcalc functions used by update_SPRT(), which
+runs with the run lock held on every update_task of an SPRT run.
+
+Distributions are represented by two lists, the values a and the
+probabilities p, rather than by a list of tuples (see LLRcalc.py).
+
+The secular equations are solved by a safeguarded Newton iteration
+(the derivative is cheap) instead of by scipy.optimize.brentq. Newton
+converges quadratically, more so when started close to the root. So
+the Lagrange multipliers, and for the t-value the MLE distributions,
+of the previous call can be used as a starting point. Between two calls
+the results only change by one batch. The caller keeps this state in a
+"warm_start" dict, one per run.
+
+The results agree with those of LLRcalc up to rounding errors, see
+test_llrcalc_fast.py and utils/bench_llr.py for the timings.
+"""
+
+
+def secular(a, p, x=0.0):
+    """
+    Solve the secular equation sum_i pi*ai/(1+x*ai)=0, starting from x.
+    """
+    v, w = min(a), max(a)
+    if v * w >= 0:
+        raise ValueError("secular equation requires support straddling zero")
+    lower_bound = -1 / w
+    upper_bound = -1 / v
+    if not lower_bound < x < upper_bound:
+        x = 0.0
+    for _ in range(100):
+        f = df = 0.0
+        for ai, pi in zip(a, p):
+            d = 1 + x * ai
+            q = pi * ai / d
+            f += q
+            df -= q * ai / d
+        # f is decreasing, so its sign tells on which side the root is.
+        if f > 0:
+            lower_bound = x
+        elif f < 0:
+            upper_bound = x
+        else:
+            return x
+        x_new = x - f / df
+        # Fall back to bisection if Newton leaves the bracket.
+        if not lower_bound < x_new < upper_bound:
+            x_new = (lower_bound + upper_bound) / 2
+        if abs(x_new - x) <= 1e-15 * max(1.0, abs(x)):
+            return x_new
+        x = x_new
+    raise ValueError("secular root finding did not converge")
+
+
+def stats(a, p):
+    s = sum([pi * ai for ai, pi in zip(a, p)])
+    var = sum([pi * (ai - s) ** 2 for ai, pi in zip(a, p)])
+    return s, var
+
+
+def MLE_expected(a, p, s, x=0.0):
+    """
+    See LLRcalc.MLE_expected. Returns the MLE probabilities and the
+    Lagrange multiplier, x is the starting point of the secular solve.
+    """
+    a1 = [ai - s for ai in a]
+    x = secular(a1, p, x)
+    p_MLE = [pi / (1 + x * ai) for ai, pi in zip(a1, p)]
+    s_, _ = stats(a, p_MLE)  # for validation
+    assert abs(s - s_) < 1e-6
+    return p_MLE, x
+
+
+def MLE_t_value(a, p, ref, s, start=None):
+    """
+    See LLRcalc.MLE_t_value. Returns the MLE probabilities and the
+    Lagrange multiplier, start is an optional pair (p_MLE, x) to start
+    the iteration from, e.g. the result of a previous call.
+    """
+    if start is None:
+        p_MLE, x = [1 / len(a)] * len(a), 0.0
+    else:
+        p_MLE, x = start
+    for _ in range(100):
+        mu, var = stats(a, p_MLE)
+        sigma = var ** (1 / 2)
+        a1 = [ai - ref - s * sigma * (1 + ((mu - ai) / sigma) ** 2) / 2 for ai in a]
+        x = secular(a1, p, x)
+        p_ = p_MLE
+        p_MLE = [pi / (1 + x * ai) for ai, pi in zip(a1, p)]
+        if max([abs(u - v) for u, v in zip(p_, p_MLE)]) < 1e-12:
+            break
+    mu, var = stats(a, p_MLE)  # for validation
+    assert abs(s - (mu - ref) / var**0.5) < 1e-5
+    return p_MLE, x
+
+
+def results_to_pdf(results):
+    N, pdf = LLRcalc.results_to_pdf(results)
+    return N, [ai for ai, _ in pdf], [pi for _, pi in pdf]
+
+
+def LLR(a, p, s0, s1, ref=None, statistic="expectation", warm_start=None):
+    """
+    See LLRcalc.LLR. warm_start is an optional dict in which the solutions
+    are kept for the next call.
+    """
+    solutions = {}
+    for s in (s0, s1):
+        key = (statistic, s, ref, len(a))
+        start = warm_start.get(key) if warm_start is not None else None
+        if statistic == "expectation":
+            solutions[key] = MLE_expected(a, p, s, 0.0 if start is None else start[1])
+        elif statistic == "t_value":
+            solutions[key] = MLE_t_value(a, p, ref, s, start)
+        else:
+            assert False
+    if warm_start is not None:
+        warm_start.clear()
+        warm_start.update(solutions)
+    (p0, _), (p1, _) = [solutions[(statistic, s, ref, len(a))] for s in (s0, s1)]
+    return sum([pi * (math.log(u) - math.log(v)) for pi, u, v in zip(p, p1, p0)])
+
+
+def LLR_logistic(elo0, elo1, results, warm_start=None):
+    """See LLRcalc.LLR_logistic."""
+    s0, s1 = [LLRcalc.L_(elo) for elo in (elo0, elo1)]
+    N, a, p = results_to_pdf(results)
+    return N * LLR(a, p, s0, s1, statistic="expectation", warm_start=warm_start)
+
+
+def LLR_normalized(nelo0, nelo1, results, warm_start=None):
+    """See LLRcalc.LLR_normalized."""
+    nt0, nt1 = [nelo / LLRcalc.nelo_divided_by_nt for nelo in (nelo0, nelo1)]
+    sqrt2 = 2**0.5
+    if len(results) == 3:
+        t0, t1 = nt0, nt1
+    elif len(results) == 5:
+        t0, t1 = nt0 * sqrt2, nt1 * sqrt2
+    else:
+        assert False
+    N, a, p = results_to_pdf(results)
+    return N * LLR(a, p, t0, t1, ref=1 / 2, statistic="t_value", warm_start=warm_start)
@@ -0,0 +1,234 @@
+import math
+
+import numpy as np
+import scipy.special
+from scipy.optimize import elementwise
+
+from fishtest.stats.LLRcalc import nelo_divided_by_nt
+
+"""
+Vectorised version of sprt.sprt.analytics() for many tests at once.
+
+sprt.sprt.lower_cb() solves outcome_prob(elo) = 1 - p with a separate
+scipy.optimize.brentq per confidence level, and every evaluation of
+outcome_prob() sums the series of Brownian.outcome_cdf_alt1() one term at
+a time. Here the state of all the tests is held in NumPy arrays: the
+series is summed for all the tests together and the elo estimate and
+both ends of the confidence interval of all the tests are found by a
+single call of scipy.optimize.elementwise.find_root (a vectorised
+bracketing solver).
+
+The results agree with those of sprt.sprt up to the tolerance of the
+root finders, see test_sprt_batch.py.
+"""
+
+# Like scipy.optimize.brentq.
+_TOLERANCES = {"xatol": 2e-12, "xrtol": 4 * np.finfo(float).eps}
+
+
+def _L(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def _U(n, gamma, A, y):
+    # See brownian.U().
+    return (
+        2 * A * gamma * np.sin(np.pi * n * y / A)
+        - 2 * np.pi * n * np.cos(np.pi * n * y / A)
+    ) / (A**2 * gamma**2 + np.pi**2 * n**2)
+
+
+def _outcome_cdf_alt1(a, b, mu, sigma2, T, y):
+    # See Brownian.outcome_cdf_alt1(). The series is summed until its
+    # terms are small for every test; the tests that have converged
+    # are dropped along the way.
+    A = b - a
+    x = -a
+    y = y - a
+    gamma = mu / sigma2
+    lambda_1 = ((np.pi / A) ** 2) * sigma2 / 2 + (mu**2 / sigma2) / 2
+    t0 = np.exp(-lambda_1 * T - x * gamma + y * gamma)
+    s = np.zeros_like(t0)
+    todo = np.arange(len(t0))
+    n = 1
+    while len(todo) > 0:
+        A_, gamma_, sigma2_ = A[todo], gamma[todo], sigma2[todo]
+        lambda_n = ((n * np.pi / A_) ** 2) * sigma2_ / 2 + (mu[todo] ** 2 / sigma2_) / 2
+        t1 = np.exp(-(lambda_n - lambda_1[todo]) * T[todo])
+        t3 = _U(n, gamma_, A_, y[todo])
+        t4 = np.sin(n * np.pi * x[todo] / A_)
+        s[todo] += t1 * t3 * t4
+        term = np.abs(t0[todo] * t1 * t3)
+        todo = todo[~((term <= 1e-9) | ~np.isfinite(term))]
+        n += 1
+    gA = gamma * A
+    pre = np.where(
+        gA > 30,  # avoid numerical overflow
+        np.exp(-2 * gamma * x),
+        np.where(
+            np.abs(gA) < 1e-8,  # avoid division by zero
+            (A - x) / A,
+            (1 - np.exp(2 * gamma * (A - x))) / (1 - np.exp(2 * gamma * A)),
+        ),
+    )
+    return pre + t0 * s
+
+
+def _outcome_cdf_alt2(a, b, mu, sigma2, T, y):
+    # See Brownian.outcome_cdf_alt2().
+    denom = np.sqrt(T * sigma2)
+    offset = mu * T
+    gamma = mu / sigma2
+    z = (y - offset) / denom
+    za = (-y + offset + 2 * a) / denom
+    zb = (y - offset - 2 * b) / denom
+    t1 = scipy.special.ndtr(z)
+    t2 = np.where(
+        gamma * a >= 5,
+        -np.exp(-(za**2) / 2 + 2 * gamma * a)
+        / math.sqrt(2 * math.pi)
+        * (1 / za - 1 / za**3),
+        np.exp(2 * gamma * a) * scipy.special.ndtr(za),
+    )
+    t3 = np.where(
+        gamma * b >= 5,
+        -np.exp(-(zb**2) / 2 + 2 * gamma * b)
+        / math.sqrt(2 * math.pi)
+        * (1 / zb - 1 / zb**3),
+        np.exp(2 * gamma * b) * scipy.special.ndtr(zb),
+    )
+    return t1 + t2 - t3
+
+
+def outcome_cdf(a, b, mu, sigma2, T, y):
+    """
+    Brownian(a, b, mu, sigma).outcome_cdf(T, y) for arrays of parameters,
+    with sigma2 = sigma**2."""
+    a, b, mu, sigma2, T, y = np.broadcast_arrays(
+        *(np.asarray(v, dtype=float) for v in (a, b, mu, sigma2, T, y))
+    )
+    A = b - a
+    alt2 = (sigma2 * T / A**2 < 1e-2) | (np.abs(mu / sigma2 * A) > 15)
+    ret = np.empty(a.shape)
+    with np.errstate(all="ignore"):
+        # The branches of np.where() are evaluated everywhere.
+        for mask, outcome_cdf_ in (
+            (alt2, _outcome_cdf_alt2),
+            (~alt2, _outcome_cdf_alt1),
+        ):
+            if mask.any():
+                ret[mask] = outcome_cdf_(
+                    a[mask], b[mask], mu[mask], sigma2[mask], T[mask], y[mask]
+                )
+    return ret
+
+
+def _outcome_prob(elo, s_, v_, s0, s1, a, b, T, llr):
+    # See sprt.outcome_prob() and LLRcalc.LLR_drift_variance_alt2().
+    s = _L(elo)
+    v = v_ + (s - s_) ** 2
+    mu_LLR = (s - (s0 + s1) / 2) * (s1 - s0) / v
+    var_LLR = (s1 - s0) ** 2 / v
+    return outcome_cdf(a, b, mu_LLR, np.sqrt(var_LLR) ** 2, T, llr)
+
+
+def _lower_cb(state, avg_elo, delta, target):
+    """
+    sprt.lower_cb() for all the tests: the elo such that
+    outcome_prob(elo) = target."""
+
+    def f(elo, target, *state):
+        return _outcome_prob(elo, *state) - target
+
+    arrays = np.broadcast_arrays(*state, avg_elo, delta, target)
+    shape = arrays[0].shape
+    *state, avg_elo, delta, target = [v.ravel() for v in arrays]
+    elo = np.full(target.shape, np.nan)
+    # Like sprt.lower_cb(), start with a bracket of 60 times the width of
+    # [elo0, elo1] and double it, up to [-1000, 1000], until it contains
+    # a solution. outcome_prob() need not be monotone far from [elo0, elo1],
+    # so the intermediate brackets matter.
+    N = 30
+    todo = np.ones(target.shape, dtype=bool)
+    while todo.any():
+        index = np.flatnonzero(todo)
+        lower = np.maximum(avg_elo[todo] - N * delta[todo], -1000)
+        upper = np.minimum(avg_elo[todo] + N * delta[todo], 1000)
+        args = (target[todo], *(v[todo] for v in state))
+        f_lower, f_upper = f(lower, *args), f(upper, *args)
+        # Roots on the endpoints (which find_root does not accept).
+        for x, f_x in ((upper, f_upper), (lower, f_lower)):
+            elo[index[f_x == 0]] = x[f_x == 0]
+        bracketed = (f_lower * f_upper < 0) & (f_lower != 0) & (f_upper != 0)
+        if bracketed.any():
+            res = elementwise.find_root(
+                f,
+                (lower[bracketed], upper[bracketed]),
+                args=tuple(v[bracketed] for v in args),
+                tolerances=_TOLERANCES,
+            )
+            elo[index[bracketed]] = res.x
+        # Give up if there is no solution in [-1000, 1000].
+        todo[index] = np.isnan(elo[index]) & ((lower > -1000) | (upper < 1000))
+        N *= 2
+    # Like sprt.lower_cb(), return an endpoint if there is no solution.
+    todo = np.isnan(elo)
+    if todo.any():
+        args = (target[todo], *(v[todo] for v in state))
+        elo[todo] = np.where(f(np.full(todo.sum(), -1000.0), *args) > 0, 1000, -1000)
+    return elo.reshape(shape)
+
+
+def analytics(N, s_, v_, pentanomial, alpha, beta, elo0, elo1, normalized, p=0.05):
+    """
+    Vectorised sprt.sprt(...).set_state(results) followed by analytics(p).
+
+    N, s_, v_ are the number of observations and the mean and the variance
+    of the pdf of the results of each test (see LLRcalc.results_to_pdf()
+    and LLRcalc.stats()), pentanomial tells if these are pentanomial
+    results and normalized if elo0, elo1 are normalized (otherwise
+    logistic) elo. The arguments are broadcast against each other.
+
+    Returns a dict of arrays with the keys "clamped", "a", "b", "elo",
+    "ci_lower", "ci_upper", "LOS" and "LLR"."""
+    N, s_, v_, pentanomial, alpha, beta, elo0, elo1, normalized = np.broadcast_arrays(
+        *(
+            np.asarray(v, dtype=float)
+            for v in (N, s_, v_, pentanomial, alpha, beta, elo0, elo1, normalized)
+        )
+    )
+    pentanomial = pentanomial.astype(bool)
+    normalized = normalized.astype(bool)
+    a = np.log(beta / (1 - alpha))
+    b = np.log((1 - beta) / alpha)
+
+    # sprt.set_state()
+    sigma_pg = np.where(pentanomial, np.sqrt(2 * v_), np.sqrt(v_))
+    s0, s1 = [
+        np.where(normalized, elo / nelo_divided_by_nt * sigma_pg + 0.5, _L(elo))
+        for elo in (elo0, elo1)
+    ]
+    mu_LLR = (s_ - (s0 + s1) / 2) * (s1 - s0) / v_
+    llr = N * mu_LLR
+    T = N.copy()
+    clamped = (llr > 1.03 * b) | (llr < 1.03 * a)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = llr / N
+        T = np.where(llr < a, a / slope, np.where(llr > b, b / slope, T))
+    llr = np.clip(llr, a, b)
+
+    # sprt.analytics(): the three confidence bounds of all the tests
+    # are solved together.
+    state = (s_, v_, s0, s1, a, b, T, llr)
+    targets = np.array([0.5, 1 - p / 2, p / 2])[:, np.newaxis]
+    elo, ci_lower, ci_upper = _lower_cb(state, (elo0 + elo1) / 2, elo1 - elo0, targets)
+    return {
+        "clamped": clamped,
+        "a": a,
+        "b": b,
+        "elo": elo,
+        "ci_lower": ci_lower,
+        "ci_upper": ci_upper,
+        "LOS": _outcome_prob(0.0, *state),
+        "LLR": llr,
+    }
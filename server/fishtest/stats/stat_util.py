@@ -1,10 +1,12 @@
 from __future__ import division
 
+import copy
 import math
 
 import scipy.stats
 
-from fishtest.stats import LLRcalc, sprt
+from fishtest.lru_cache import LRUCache
+from fishtest.stats import LLRcalc, LLRcalc_fast, sprt, sprt_batch
 
 
 def Phi(q):
@@ -154,6 +156,142 @@ def SPRT_elo(R, alpha=0.05, beta=0.05, p=0.05, elo0=None, elo1=None, elo_model=N
     return a
 
 
+# The results of SPRT_elo_batch() only depend on its arguments, so those of
+# finished runs can be reused indefinitely.
+SPRT_elo_cache = LRUCache(maxsize=5000)
+
+# Below this number of tests the fixed cost of the vectorised root finder
+# exceeds that of SPRT_elo().
+SPRT_ELO_BATCH_MIN = 4
+
+
+def _SPRT_elo_key(R, alpha, beta, p, elo0, elo1, elo_model):
+    pentanomial = R.get("pentanomial")
+    return (
+        R.get("losses", 0),
+        R.get("draws", 0),
+        R.get("wins", 0),
+        None if pentanomial is None else tuple(pentanomial),
+        alpha,
+        beta,
+        p,
+        elo0,
+        elo1,
+        elo_model,
+    )
+
+
+def _SPRT_elo_vectorised(queries, p):
+    # The same preprocessing as SPRT_elo().
+    columns = []
+    bounds = []
+    for query in queries:
+        R = query["R"]
+        elo0, elo1, elo_model = query["elo0"], query["elo1"], query["elo_model"]
+        assert elo_model in ["BayesElo", "logistic", "normalized"]
+        R3 = LLRcalc.regularize(
+            [R.get("losses", 0), R.get("draws", 0), R.get("wins", 0)]
+        )
+        if elo_model == "BayesElo":
+            drawelo = draw_elo_calc(R3)
+            elo0, elo1 = [bayeselo_to_elo(elo_, drawelo) for elo_ in (elo0, elo1)]
+            elo_model = "logistic"
+        R_ = R["pentanomial"] if "pentanomial" in R.keys() else R3
+        N, pdf = LLRcalc.results_to_pdf(R_)
+        mu, var = LLRcalc.stats(pdf)
+        columns.append(
+            (
+                N,
+                mu,
+                var,
+                len(R_) == 5,
+                query["alpha"],
+                query["beta"],
+                elo0,
+                elo1,
+                elo_model == "normalized",
+            )
+        )
+        bounds.append((elo0, elo1, elo_model, R_))
+
+    analytics = sprt_batch.analytics(*zip(*columns), p=p)
+    ret = []
+    for j, (elo0, elo1, elo_model, R_) in enumerate(bounds):
+        # The LLR we actually use, see SPRT_elo().
+        if elo_model == "logistic":
+            LLR = LLRcalc_fast.LLR_logistic(elo0, elo1, R_)
+        else:
+            LLR = LLRcalc_fast.LLR_normalized(elo0, elo1, R_)
+        ret.append(
+            {
+                "a": float(analytics["a"][j]),
+                "b": float(analytics["b"][j]),
+                "elo": float(analytics["elo"][j]),
+                "ci": [
+                    float(analytics["ci_lower"][j]),
+                    float(analytics["ci_upper"][j]),
+                ],
+                "LOS": float(analytics["LOS"][j]),
+                "LLR": LLR,
+            }
+        )
+    return ret
+
+
+def SPRT_elo_batch(queries, p=0.05):
+    """
+    SPRT_elo() for many tests at once. "queries" is a list of dicts with
+    the keyword arguments R, alpha, beta, elo0, elo1, elo_model of
+    SPRT_elo(). The results are cached and those of the tests which are
+    not in the cache are computed together by sprt_batch.analytics()."""
+    ret = [None] * len(queries)
+    keys = [None] * len(queries)
+    todo = []
+    for i, query in enumerate(queries):
+        query = {"alpha": 0.05, "beta": 0.05} | query
+        keys[i] = key = _SPRT_elo_key(
+            query["R"],
+            query["alpha"],
+            query["beta"],
+            p,
+            query["elo0"],
+            query["elo1"],
+            query["elo_model"],
+        )
+        a = SPRT_elo_cache.get(key)
+        if a is not None:
+            ret[i] = copy.deepcopy(a)
+        else:
+            todo.append((i, query))
+    if not todo:
+        return ret
+
+    if len(todo) < SPRT_ELO_BATCH_MIN:
+        computed = [SPRT_elo(p=p, **query) for _, query in todo]
+    else:
+        computed = _SPRT_elo_vectorised([query for _, query in todo], p)
+    for (i, _), a in zip(todo, computed):
+        SPRT_elo_cache[keys[i]] = a
+        ret[i] = copy.deepcopy(a)
+    return ret
+
+
+def SPRT_elo_cached(
+    R, alpha=0.05, beta=0.05, p=0.05, elo0=None, elo1=None, elo_model=None
+):
+    """
+    Like SPRT_elo(), through SPRT_elo_batch() and its cache."""
+    query = {
+        "R": R,
+        "alpha": alpha,
+        "beta": beta,
+        "elo0": elo0,
+        "elo1": elo1,
+        "elo_model": elo_model,
+    }
+    return SPRT_elo_batch([query], p=p)[0]
+
+
 def LLRlegacy(belo0, belo1, results):
     """
     LLR calculation using the BayesElo model where
@@ -193,7 +331,7 @@ def SPRT(
     }
 
 
-def update_SPRT(R, sprt):
+def update_SPRT(R, sprt, warm_start=None):
     """Sequential Probability Ratio Test
 
     sprt is a dictionary with fixed fields
@@ -229,7 +367,11 @@ def update_SPRT(R, sprt):
 
     R['wins'], R['losses'], R['draws'] contains the number of wins, losses and draws
     R['pentanomial'] contains the pentanomial frequencies
-    elo_model can be either 'BayesElo', 'logistic' or 'normalized'"""
+    elo_model can be either 'BayesElo', 'logistic' or 'normalized'
+
+    warm_start is an optional dict, owned by the caller, in which the
+    LLR computation keeps its state for the next update of the same test
+    (see LLRcalc_fast.py)."""
 
     elo_model = sprt["elo_model"]
     assert elo_model in ["BayesElo", "logistic", "normalized"]
@@ -259,9 +401,9 @@ def update_SPRT(R, sprt):
     # Log-Likelihood Ratio
     assert elo_model in ["logistic", "normalized"]
     if elo_model == "logistic":
-        sprt["llr"] = LLRcalc.LLR_logistic(elo0, elo1, R_)
+        sprt["llr"] = LLRcalc_fast.LLR_logistic(elo0, elo1, R_, warm_start=warm_start)
     else:
-        sprt["llr"] = LLRcalc.LLR_normalized(elo0, elo1, R_)
+        sprt["llr"] = LLRcalc_fast.LLR_normalized(elo0, elo1, R_, warm_start=warm_start)
 
     # update the overshoot data
     if "overshoot" in sprt:
@@ -0,0 +1,83 @@
+import heapq
+import threading
+
+"""
+A task is dead when its worker has not contacted the server for "timeout"
+seconds. Rather than scanning all tasks of all unfinished runs, the
+primary keeps the deadlines of the active tasks (last_updated + timeout)
+in a min-heap, so that the expired tasks are found in O(k log n).
+
+The deadline of a task only ever moves forward (beat, update_task), so
+refreshing it just records the new deadline in a dict, without touching
+the heap. When a heap entry expires we compare it with the recorded
+deadline: if the task was refreshed in the meantime the entry is pushed
+back with its current deadline, if the task was removed it is dropped.
+Hence the heap holds about one entry per active task and a refresh is
+O(1).
+
+The index is only a hint: RunDb.scavenge_dead_tasks checks the task
+itself before declaring it dead.
+"""
+
+
+class TaskDeadlines:
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        # Entries (deadline, run_id, task_id), possibly stale.
+        self.heap = []
+        # (run_id, task_id) -> current deadline
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def refresh(self, run_id, task_id, last_updated):
+        """Record that the task was alive at last_updated (a datetime)."""
+        run_id = str(run_id)
+        deadline = last_updated.timestamp() + self.timeout
+        key = (run_id, task_id)
+        with self.lock:
+            old_deadline = self.deadlines.get(key)
+            self.deadlines[key] = deadline
+            if old_deadline is None or deadline < old_deadline:
+                heapq.heappush(self.heap, (deadline, run_id, task_id))
+                # A task may be removed and added again, leaving
+                # stale entries behind.
+                if len(self.heap) > 2 * len(self.deadlines) + 100:
+                    self.__rebuild()
+
+    def discard(self, run_id, task_id):
+        with self.lock:
+            self.deadlines.pop((str(run_id), task_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.heap = []
+            self.deadlines = {}
+
+    def pop_expired(self, now):
+        """Remove and return the pairs (run_id, task_id) of the tasks whose
+        deadline is <= now (a timestamp)."""
+        expired = []
+        with self.lock:
+            heap = self.heap
+            while heap and heap[0][0] <= now:
+                deadline, run_id, task_id = heapq.heappop(heap)
+                key = (run_id, task_id)
+                current = self.deadlines.get(key)
+                if current is None:
+                    continue
+                if current > deadline:
+                    heapq.heappush(heap, (current, run_id, task_id))
+                    continue
+                del self.deadlines[key]
+                expired.append(key)
+        return expired
+
+    def __rebuild(self):
+        self.heap = [
+            (deadline, run_id, task_id)
+            for (run_id, task_id), deadline in self.deadlines.items()
+        ]
+        heapq.heapify(self.heap)
@@ -0,0 +1,502 @@
+import copy
+import hashlib
+from array import array
+from collections.abc import Mapping, MutableMapping, MutableSequence, Sequence
+from datetime import UTC, datetime, timedelta
+from itertools import compress
+
+from bson.codec_options import TypeEncoder, TypeRegistry
+
+"""
+Columnar storage for run["tasks"]
+=================================
+A run may have tens of thousands of tasks. As nested dicts every task
+costs a few kilobytes, mostly in its worker_info, and the garbage
+collector has to traverse all of them. TaskList stores the tasks of a
+run as a struct of arrays instead:
+
+- one array per scalar field (active, num_games, start, last_updated),
+  the five counters of the stats and the pentanomial;
+- worker_info records are interned: identical records, except for the
+  volatile "nps" field, are stored once per run;
+- a bitmask per task remembers which fields are present.
+
+Values which do not fit a column (e.g. an int that is not 64 bit, a
+naive datetime) and fields without a column (bad, spsa_params,...) are
+kept in a sparse per-task dict, so a TaskList holds exactly the same
+data as the list of dicts it was built from.
+
+Existing code keeps working through dict-compatible views: run["tasks"][i]
+is a TaskView, and task["stats"] a StatsView, which read and write the
+columns. The views are created on demand, so they are not stable objects.
+A few values are materialized on every access and in-place modifications
+of those are lost: task["worker_info"] and task["stats"]["pentanomial"].
+In the server these are always replaced as a whole.
+
+TaskList is not a list, so it needs to be converted at the boundaries
+where a real list is required: see task_type_registry for BSON encoding
+and plain_run() for validation.
+"""
+
+_FIELDS = ("num_games", "active", "worker_info", "last_updated", "start", "stats")
+_STATS_FIELDS = ("wins", "losses", "draws", "crashes", "time_losses")
+
+# Bits of the flags of a task: 0-5 for the fields above, 6-11 for the
+# counters of the stats and the pentanomial, 12 for an integer nps.
+_FIELD_BITS = dict(zip(_FIELDS, (1 << i for i in range(6))))
+_STATS = _FIELD_BITS["stats"]
+_STATS_BITS = dict(
+    zip(_STATS_FIELDS + ("pentanomial",), (1 << i for i in range(6, 12)))
+)
+_NPS_INT = 1 << 12
+_STATS_MASK = sum(_STATS_BITS.values())
+_STATS_INDEX = {key: i for i, key in enumerate(_STATS_FIELDS)}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=UTC)
+# Marks the position of "nps" in an interned worker_info record.
+_NPS = object()
+
+
+def _is_int64(value):
+    return type(value) is int and -(2**63) <= value < 2**63
+
+
+def _is_pentanomial(value):
+    return type(value) is list and len(value) == 5 and all(map(_is_int64, value))
+
+
+def _is_stats(value):
+    if type(value) is not dict:
+        return False
+    for key, v in value.items():
+        if key == "pentanomial":
+            if not _is_pentanomial(v):
+                return False
+        elif key not in _STATS_INDEX or not _is_int64(v):
+            return False
+    return True
+
+
+def _is_nps(value):
+    # Integers are stored as doubles, so they must be exactly representable.
+    return type(value) is float or (type(value) is int and abs(value) <= 2**53)
+
+
+def _is_column_value(key, value):
+    if key == "active":
+        return type(value) is bool
+    if key == "last_updated":
+        return type(value) is datetime and value.tzinfo is UTC
+    if key == "stats":
+        return _is_stats(value)
+    if key == "worker_info":
+        return type(value) is dict and ("nps" not in value or _is_nps(value["nps"]))
+    return _is_int64(value)
+
+
+def _record_key(record):
+    # The repr() of a worker_info distinguishes e.g. 1, 1.0 and True,
+    # contrary to hashing the values themselves. Only a digest is kept.
+    return hashlib.blake2b(repr(record).encode(), digest_size=16).digest()
+
+
+def _microseconds(value):
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class TaskStore:
+    """The columns of a TaskList, one row per task."""
+
+    def __init__(self):
+        self.size = 0
+        self.flags = array("H")
+        self.active = array("b")
+        self.num_games = array("q")
+        self.start = array("q")
+        self.last_updated = array("q")
+        self.stats = array("q")
+        self.pentanomial = array("q")
+        self.nps = array("d")
+        self.worker_info = array("i")
+        self.worker_infos = []
+        self.worker_info_index = {}
+        # row -> {key: value} for the values which are not in a column
+        self.extras = {}
+
+    def append(self, task):
+        if not isinstance(task, Mapping):
+            raise TypeError(f"A task must be a mapping, not {type(task).__name__}")
+        row = self.size
+        self.flags.append(0)
+        self.active.append(0)
+        self.num_games.append(0)
+        self.start.append(0)
+        self.last_updated.append(0)
+        self.stats.extend((0, 0, 0, 0, 0))
+        self.pentanomial.extend((0, 0, 0, 0, 0))
+        self.nps.append(0.0)
+        self.worker_info.append(-1)
+        self.size += 1
+        for key, value in task.items():
+            self.set(row, key, value)
+
+    def replace(self, row, task):
+        if not isinstance(task, Mapping):
+            raise TypeError(f"A task must be a mapping, not {type(task).__name__}")
+        # The new value may be a view of the same row.
+        items = list(task.items())
+        self.flags[row] = 0
+        self.active[row] = 0
+        self.extras.pop(row, None)
+        for key, value in items:
+            self.set(row, key, value)
+
+    def contains(self, row, key):
+        bit = _FIELD_BITS.get(key)
+        if bit is not None and self.flags[row] & bit:
+            return True
+        extras = self.extras.get(row)
+        return extras is not None and key in extras
+
+    def keys(self, row):
+        flags = self.flags[row]
+        extras = self.extras.get(row, {})
+        keys = [key for key in _FIELDS if flags & _FIELD_BITS[key] or key in extras]
+        keys.extend(key for key in extras if key not in _FIELD_BITS)
+        return keys
+
+    def get(self, row, key):
+        bit = _FIELD_BITS.get(key)
+        if bit is not None and self.flags[row] & bit:
+            if key == "active":
+                return self.active[row] != 0
+            elif key == "num_games":
+                return self.num_games[row]
+            elif key == "start":
+                return self.start[row]
+            elif key == "last_updated":
+                return _EPOCH + timedelta(microseconds=self.last_updated[row])
+            elif key == "stats":
+                return StatsView(self, row)
+            else:
+                return self.get_worker_info(row)
+        extras = self.extras.get(row)
+        if extras is not None and key in extras:
+            return extras[key]
+        raise KeyError(key)
+
+    def set(self, row, key, value):
+        if isinstance(value, (TaskView, StatsView)):
+            # Do not keep references to (possibly the same) row.
+            value = value.to_dict()
+        bit = _FIELD_BITS.get(key)
+        if bit is None:
+            self.extras.setdefault(row, {})[key] = value
+            return
+        if key == "active":
+            # The column holds the truth value even if the value itself
+            # is an extra, so that active_items() can rely on it.
+            self.active[row] = 1 if value else 0
+        if not _is_column_value(key, value):
+            self.flags[row] &= ~bit
+            if key == "stats":
+                self.flags[row] &= ~_STATS_MASK
+            self.extras.setdefault(row, {})[key] = value
+            return
+        if key == "num_games":
+            self.num_games[row] = value
+        elif key == "start":
+            self.start[row] = value
+        elif key == "last_updated":
+            self.last_updated[row] = _microseconds(value)
+        elif key == "stats":
+            self.flags[row] &= ~_STATS_MASK
+            for k, v in value.items():
+                self.set_stat(row, k, v)
+        elif key == "worker_info":
+            self.set_worker_info(row, value)
+        self.flags[row] |= bit
+        extras = self.extras.get(row)
+        if extras is not None:
+            extras.pop(key, None)
+            if not extras:
+                del self.extras[row]
+
+    def delete(self, row, key):
+        if not self.contains(row, key):
+            raise KeyError(key)
+        bit = _FIELD_BITS.get(key)
+        if bit is not None:
+            self.flags[row] &= ~bit
+            if key == "stats":
+                self.flags[row] &= ~_STATS_MASK
+            elif key == "active":
+                self.active[row] = 0
+        extras = self.extras.get(row)
+        if extras is not None:
+            extras.pop(key, None)
+            if not extras:
+                del self.extras[row]
+
+    def set_stat(self, row, key, value):
+        # Only called with values that fit the columns.
+        if key == "pentanomial":
+            self.pentanomial[5 * row : 5 * row + 5] = array("q", value)
+        else:
+            self.stats[5 * row + _STATS_INDEX[key]] = value
+        self.flags[row] |= _STATS_BITS[key]
+
+    def get_worker_info(self, row):
+        record = self.worker_infos[self.worker_info[row]]
+        if "nps" not in record:
+            return dict(record)
+        nps = self.nps[row]
+        if self.flags[row] & _NPS_INT:
+            nps = int(nps)
+        # This keeps the position of "nps" in the record.
+        return record | {"nps": nps}
+
+    def set_worker_info(self, row, worker_info):
+        record = dict(worker_info)
+        self.flags[row] &= ~_NPS_INT
+        if "nps" in record:
+            nps = record["nps"]
+            self.nps[row] = nps
+            if type(nps) is int:
+                self.flags[row] |= _NPS_INT
+            record["nps"] = _NPS
+        key = _record_key(record)
+        index = self.worker_info_index.get(key)
+        if index is None:
+            # The record must not share mutable values with the caller.
+            record = {
+                k: v if v is _NPS else copy.deepcopy(v) for k, v in record.items()
+            }
+            index = self.worker_info_index[key] = len(self.worker_infos)
+            self.worker_infos.append(record)
+        self.worker_info[row] = index
+
+    def to_dict(self, row):
+        task = {}
+        for key in self.keys(row):
+            value = self.get(row, key)
+            if type(value) is StatsView:
+                value = value.to_dict()
+            task[key] = value
+        return task
+
+
+class StatsView(MutableMapping):
+    """A dict-compatible view of the stats of a task."""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __stats(self):
+        # The stats of the task may have been replaced by a value which
+        # does not fit the columns since this view was created.
+        if self._store.flags[self._row] & _STATS:
+            return None
+        return self._store.get(self._row, "stats")
+
+    def __getitem__(self, key):
+        store, row = self._store, self._row
+        flags = store.flags[row]
+        if not flags & _STATS:
+            return store.get(row, "stats")[key]
+        bit = _STATS_BITS.get(key)
+        if bit is None or not flags & bit:
+            raise KeyError(key)
+        if key == "pentanomial":
+            return store.pentanomial[5 * row : 5 * row + 5].tolist()
+        return store.stats[5 * row + _STATS_INDEX[key]]
+
+    def __setitem__(self, key, value):
+        stats = self.__stats()
+        if stats is not None:
+            stats[key] = value
+        elif (key == "pentanomial" and _is_pentanomial(value)) or (
+            key in _STATS_INDEX and _is_int64(value)
+        ):
+            self._store.set_stat(self._row, key, value)
+        else:
+            stats = self.to_dict()
+            stats[key] = value
+            self._store.set(self._row, "stats", stats)
+
+    def __delitem__(self, key):
+        stats = self.__stats()
+        if stats is not None:
+            del stats[key]
+            return
+        bit = _STATS_BITS.get(key)
+        if bit is None or not self._store.flags[self._row] & bit:
+            raise KeyError(key)
+        self._store.flags[self._row] &= ~bit
+
+    def __iter__(self):
+        stats = self.__stats()
+        if stats is not None:
+            return iter(list(stats))
+        flags = self._store.flags[self._row]
+        return iter([key for key, bit in _STATS_BITS.items() if flags & bit])
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def to_dict(self):
+        return {key: self[key] for key in self}
+
+    def __copy__(self):
+        return self.to_dict()
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.to_dict(), memo)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class TaskView(MutableMapping):
+    """A dict-compatible view of a task in a TaskList."""
+
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store, row):
+        self._store = store
+        self._row = row
+
+    def __getitem__(self, key):
+        return self._store.get(self._row, key)
+
+    def __setitem__(self, key, value):
+        self._store.set(self._row, key, value)
+
+    def __delitem__(self, key):
+        self._store.delete(self._row, key)
+
+    def __contains__(self, key):
+        return self._store.contains(self._row, key)
+
+    def __iter__(self):
+        return iter(self._store.keys(self._row))
+
+    def __len__(self):
+        return len(self._store.keys(self._row))
+
+    def to_dict(self):
+        return self._store.to_dict(self._row)
+
+    def __copy__(self):
+        return self.to_dict()
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.to_dict(), memo)
+
+    def __repr__(self):
+        return repr(self.to_dict())
+
+
+class TaskList(MutableSequence):
+    """A dict-compatible replacement for the list run["tasks"]. Tasks can
+    only be appended, as their index is their task_id."""
+
+    def __init__(self, tasks=()):
+        self._store = TaskStore()
+        # Set for a shallow copy, which shares the rows of the original.
+        self._length = None
+        for task in tasks:
+            self._store.append(task)
+
+    def __len__(self):
+        return self._store.size if self._length is None else self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TaskView(self._store, i) for i in range(*index.indices(len(self)))]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("task index out of range")
+        return TaskView(self._store, index)
+
+    def __iter__(self):
+        store = self._store
+        return (TaskView(store, row) for row in range(len(self)))
+
+    def __setitem__(self, index, task):
+        if isinstance(index, slice):
+            raise TypeError("TaskList does not support slice assignment")
+        self[index]  # bounds check
+        self._store.replace(index % len(self), task)
+
+    def __delitem__(self, index):
+        raise TypeError("Tasks cannot be deleted, this would change the task ids")
+
+    def insert(self, index, task):
+        if self._length is not None:
+            raise TypeError("A copy of a TaskList cannot be extended")
+        if index < len(self):
+            raise TypeError("Tasks can only be appended to a TaskList")
+        self._store.append(task)
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence) or isinstance(other, str):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+
+    def active_items(self):
+        """Return the pairs (task_id, task) of the active tasks, without
+        going through the inactive ones."""
+        store = self._store
+        rows = compress(range(len(self)), store.active[: len(self)])
+        return [(row, TaskView(store, row)) for row in rows]
+
+    def to_list(self):
+        """Return the tasks as a list of plain dicts."""
+        store = self._store
+        return [store.to_dict(row) for row in range(len(self))]
+
+    def __copy__(self):
+        tasks = TaskList.__new__(TaskList)
+        tasks._store = self._store
+        tasks._length = len(self)
+        return tasks
+
+    def __deepcopy__(self, memo):
+        return copy.deepcopy(self.to_list(), memo)
+
+    def __repr__(self):
+        return f"TaskList({self.to_list()!r})"
+
+
+def active_tasks(tasks):
+    """Return the pairs (task_id, task) of the active tasks in tasks, which
+    may be a list or a TaskList."""
+    if isinstance(tasks, TaskList):
+        return tasks.active_items()
+    return [(task_id, task) for task_id, task in enumerate(tasks) if task["active"]]
+
+
+def plain_run(run):
+    """Return a shallow copy of the run with the tasks as a list of dicts,
+    e.g. for validation."""
+    if not isinstance(run.get("tasks"), TaskList):
+        return run
+    return run | {"tasks": run["tasks"].to_list()}
+
+
+class TaskListEncoder(TypeEncoder):
+    python_type = TaskList
+
+    def transform_python(self, value):
+        return value.to_list()
+
+
+# To be added to the CodecOptions of the runs collection.
+task_type_registry = TypeRegistry([TaskListEncoder()])
@@ -6,34 +6,21 @@ from datetime import UTC, datetime
 from functools import cache
 
 import numpy as np
-import scipy.stats
 from email_validator import EmailNotValidError, caching_resolver, validate_email
 from zxcvbn import zxcvbn
 
 import fishtest.github_api as gh
 import fishtest.stats.stat_util
+from fishtest.chi2 import Chi2State
 
 FISHTEST = "fishtest_new"
 PASSWORD_MAX_LENGTH = 72
 VALID_USERNAME_PATTERN = "[A-Za-z0-9]{2,}"
 
-
-class GeneratorAsFileReader:
-    def __init__(self, generator):
-        self.generator = generator
-        self.buffer = b""
-
-    def read(self, size=-1):
-        while size < 0 or len(self.buffer) < size:
-            try:
-                self.buffer += next(self.generator)
-            except StopIteration:
-                break
-        result, self.buffer = self.buffer[:size], self.buffer[size:]
-        return result
-
-    def close(self):
-        pass  # No cleanup needed, but method is required
+# Current average number of games. The number should be regularly updated.
+AVERAGE_TOTAL_GAMES = 95000
+# Assume all tests use default book (UHO_Lichess_4852_v1).
+BOOK_POSITIONS = 2632036
 
 
 def hex_print(run_id):
@@ -60,121 +47,7 @@ def worker_name(worker_info, short=False):
 
 def get_chi2(tasks, exclude_workers=set()):
     """Perform chi^2 test on the stats from each worker."""
-
-    default_results = {
-        "chi2": float("nan"),
-        "dof": 0,
-        "p": float("nan"),
-        "residual": {},
-        "z_95": float("nan"),
-        "z_99": float("nan"),
-    }
-
-    # Aggregate results by worker
-    users = {}
-    has_pentanomial = None
-    for task in tasks:
-        if "bad" in task:
-            continue
-        if "worker_info" not in task:
-            continue
-        key = task["worker_info"]["unique_key"]
-        if key in exclude_workers:
-            continue
-        stats = task.get("stats", {})
-        if has_pentanomial is None:
-            has_pentanomial = "pentanomial" in stats
-        if not has_pentanomial:
-            wld = [
-                float(stats.get("wins", 0)),
-                float(stats.get("losses", 0)),
-                float(stats.get("draws", 0)),
-            ]
-        else:
-            p = stats.get("pentanomial", 5 * [0])  # there was a small window
-            # in time where we could have both trinomial and pentanomial
-            # workers
-
-            # The ww and ll frequencies will typically be too small for
-            # the full pentanomial chi2 test to be valid. See e.g. the last page of
-            # https://www.open.ac.uk/socialsciences/spsstutorial/files/tutorials/chi-square.pdf.
-            # So we combine the ww and ll frequencies with the wd and ld frequencies,
-            # this is equivalent to use the frequencies for the pair of games.
-            wld = [float(p[4] + p[3]), float(p[0] + p[1]), float(p[2])]
-
-        users[key] = [
-            user_val + wld_val
-            for user_val, wld_val in zip(users.get(key, [0] * len(wld)), wld)
-        ]
-    # We filter out the workers whose expected frequences are <= 5 as
-    # they break the chi2 test.
-    filtering_done = False
-    while not filtering_done:
-        # Whenever less than two qualifying workers are left,
-        # we bail out and just return "something".
-        if len(users) <= 1:
-            return default_results
-        # Now do the matrix computations with numpy.
-        observed = np.array(list(users.values()))
-        rows, columns = observed.shape
-        column_sums = np.sum(observed, axis=0)
-        row_sums = np.sum(observed, axis=1)
-        grand_total = np.sum(column_sums)
-        # if no games have been received, we cannot continue
-        if grand_total == 0:
-            return default_results
-        expected = np.outer(row_sums, column_sums) / grand_total
-        filtering_done = True
-        for key, expected_row in zip(list(users), expected):
-            if min(expected_row) <= 5:
-                del users[key]
-                filtering_done = False
-
-    # Now we do the basic chi2 computation.
-    df = (rows - 1) * (columns - 1)
-    raw_residual = observed - expected
-    ratio = raw_residual**2 / expected
-    row_chi2 = np.sum(ratio, axis=1)
-    chi2 = np.sum(row_chi2)
-    p_value = 1 - scipy.stats.chi2.cdf(chi2, df)
-
-    # Finally we also compute for each qualifying worker a "residual"
-    # indicating how badly it deviates from the average worker.
-
-    # The entries of adj_row_chi2 below associate with each row the
-    # chi2 value of the 2xcolumns table obtained by collapsing
-    # all other rows. This can be checked by a simple algebraic
-    # manipulation.
-    # As such, under the null hypothesis that all rows are drawn
-    # from the same distribution, these "adjusted chi2 values"
-    # follow a chi2 distribution with columns-1 degrees of freedom.
-    adj_row_chi2 = row_chi2 / (1 - row_sums / grand_total)
-
-    # Most people will not be familiar with the chi2 distribution,
-    # so we convert the adjusted chi2 values to standard normal
-    # values. As a cosmetic tweak we use isf/sf rather than ppf/cdf
-    # in order to be able to deal accurately with very low p-values.
-    res_z = scipy.stats.norm.isf(scipy.stats.chi2.sf(adj_row_chi2, columns - 1))
-
-    for idx, key in enumerate(users):
-        # We cap the standard normal "residuals" at zero since negative values
-        # do not look very nice and moreover they do not convey any
-        # information.
-        users[key] = max(0, res_z[idx])
-
-    # We compute 95% and 99% thresholds using the Bonferroni correction.
-    # Under the null hypothesis, yellow and red residuals should appear
-    # in approximately 4% and 1% of the tests.
-    z_95, z_99 = [scipy.stats.norm.ppf(1 - p / rows) for p in (0.05, 0.01)]
-
-    return {
-        "chi2": chi2,
-        "dof": df,
-        "p": p_value,
-        "residual": users,
-        "z_95": z_95,
-        "z_99": z_99,
-    }
+    return Chi2State(tasks).get_chi2(tasks, exclude_workers=exclude_workers)
 
 
 def crash_or_time(task):
@@ -185,16 +58,22 @@ def crash_or_time(task):
     return crashes > 3 or (total > 20 and time_losses / total > 0.1)
 
 
-def get_bad_workers(tasks, cached_chi2=None, p=0.001, res=7.0, iters=1):
+def get_bad_workers(
+    tasks, cached_chi2=None, p=0.001, res=7.0, iters=1, chi2_state=None
+):
     # If we have an up-to-date result of get_chi2() we can pass
     # it as cached_chi2 to avoid needless recomputation.
+    # Likewise an up-to-date Chi2State for the tasks can be passed as
+    # chi2_state. The workers found so far are left out by downdating
+    # the per-worker frequencies, the tasks are aggregated only once.
     bad_workers = set()
     for i in range(iters):
-        chi2 = (
-            get_chi2(tasks, exclude_workers=bad_workers)
-            if i > 0 or cached_chi2 is None
-            else cached_chi2
-        )
+        if i == 0 and cached_chi2 is not None:
+            chi2 = cached_chi2
+        else:
+            if chi2_state is None:
+                chi2_state = Chi2State(tasks)
+            chi2 = chi2_state.get_chi2(tasks, exclude_workers=bad_workers)
         worst_user = {}
         residuals = chi2["residual"]
         for worker_key in residuals:
@@ -331,6 +210,16 @@ def format_results(run):
     return result
 
 
+def get_results_info(run):
+    """Return the results summary of format_results(). For finished runs it
+    is stored in run["results_info"] by RunDb, so it is not recomputed on
+    every page view. Runs finished before that are backfilled by
+    utils/backfill_results_info.py, or else computed here."""
+    if run.get("finished") and "results_info" in run:
+        return run["results_info"]
+    return format_results(run)
+
+
 @cache  # A single hash lookup should be much cheaper than parsing a string
 def estimate_game_duration(tc):
     # Total time for a game is assumed to be the double of tc for each player
@@ -430,11 +319,15 @@ def format_date(date):
     return formatted_date
 
 
+def book_weight(played_pairs):
+    # CDF of the beta(1, 15) distribution at the fraction of the book that
+    # has been played, in closed form. Works for scalars and NumPy arrays.
+    x = np.minimum(played_pairs / BOOK_POSITIONS, 1.0)
+    return 1 - (1 - x) ** 15
+
+
 def remaining_hours(run):
     if "sprt" in run["args"]:
-        # Current average number of games. The number should be regularly updated.
-        average_total_games = 95000
-
         # SPRT tests always have pentanomial stats.
         played_pairs = sum(run["results"]["pentanomial"])
         played_games = played_pairs * 2
@@ -457,13 +350,11 @@ def remaining_hours(run):
         if llr >= llr_bound:
             return 0
 
-        # Assume all tests use default book (UHO_Lichess_4852_v1).
-        book_positions = 2632036
-        t = scipy.stats.beta(1, 15).cdf(min(played_pairs / book_positions, 1.0))
+        t = float(book_weight(played_pairs))
         expected_games_llr = int(played_games * llr_bound / llr)
         expected_games = min(
             run["args"]["num_games"],
-            int(expected_games_llr * t + average_total_games * (1 - t)),
+            int(expected_games_llr * t + AVERAGE_TOTAL_GAMES * (1 - t)),
         )
         remaining_games = max(0, expected_games - played_games)
     else:
@@ -474,6 +365,65 @@ def remaining_hours(run):
     return game_secs * remaining_games * int(run["args"].get("threads", 1)) / (60 * 60)
 
 
+def remaining_hours_batch(runs):
+    """Return a NumPy array with remaining_hours(run) for each run.
+
+    Only the extraction of the inputs loops over the runs; the estimate
+    itself is computed for all the runs at once.
+    """
+    n = len(runs)
+    is_sprt = np.zeros(n, dtype=bool)
+    played_games = np.zeros(n)
+    llr = np.zeros(n)
+    # Harmless values for the runs without SPRT, their results are masked.
+    alpha = np.full(n, 0.05)
+    beta = np.full(n, 0.05)
+    o0 = np.zeros(n)
+    o1 = np.zeros(n)
+    num_games = np.zeros(n)
+    game_secs = np.zeros(n)
+    threads = np.ones(n)
+    for i, run in enumerate(runs):
+        args, results = run["args"], run["results"]
+        sprt = args.get("sprt")
+        if sprt is not None:
+            is_sprt[i] = True
+            played_games[i] = sum(results["pentanomial"]) * 2
+            llr[i], alpha[i], beta[i] = sprt["llr"], sprt["alpha"], sprt["beta"]
+            o = sprt.get("overshoot")
+            if o is not None:
+                o0[i] = -o["sq0"] / o["m0"] / 2 if o["m0"] != 0 else 0
+                o1[i] = o["sq1"] / o["m1"] / 2 if o["m1"] != 0 else 0
+        else:
+            played_games[i] = results["wins"] + results["losses"] + results["draws"]
+        num_games[i] = args["num_games"]
+        game_secs[i] = estimate_game_duration(args["tc"])
+        threads[i] = int(args.get("threads", 1))
+
+    llr_bound = np.abs(
+        np.where(
+            llr > 0.0,
+            np.log((1 - beta) / alpha) - o1,
+            np.log(beta / (1 - alpha)) + o0,
+        )
+    )
+    # Use 0.1 as a safeguard if LLR is too small.
+    llr = np.maximum(0.1, np.abs(llr))
+    t = book_weight(played_games / 2)
+    expected_games_llr = np.trunc(played_games * llr_bound / llr)
+    expected_games = np.where(
+        is_sprt,
+        np.minimum(
+            num_games,
+            np.trunc(expected_games_llr * t + AVERAGE_TOTAL_GAMES * (1 - t)),
+        ),
+        num_games,
+    )
+    remaining_games = np.maximum(0, expected_games - played_games)
+    remaining_games[is_sprt & (llr >= llr_bound)] = 0
+    return game_secs * remaining_games * threads / (60 * 60)
+
+
 def plural(quantity, word):
     return word if quantity == 1 else word + "s"
 
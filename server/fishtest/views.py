@@ -40,6 +40,11 @@ from fishtest.http.boundary import (
     forget,
     remember,
 )
+from fishtest.http.conditional import (
+    build_etag,
+    conditional_get_stats,
+    etag_matches,
+)
 from fishtest.http.cookie_session import (
     CookieSession,
     authenticated_user,
@@ -77,7 +82,6 @@ from fishtest.http.settings import (
 )
 from fishtest.http.template_helpers import (
     build_contributors_rows,
-    build_contributors_summary,
     build_run_table_rows,
     build_tasks_rows,
     build_tests_stats_context,
@@ -116,14 +120,14 @@ from fishtest.schemas import (
     short_worker_name,
 )
 from fishtest.spsa_workflow import build_spsa_form_values, format_spsa_value
+from fishtest.task_store import active_tasks, plain_run
 from fishtest.util import (
     VALID_USERNAME_PATTERN,
     email_valid,
     format_date,
     format_group,
-    format_results,
     format_time_ago,
-    get_chi2,
+    get_results_info,
     get_tc_ratio,
     is_sprt_ltc_data,
     password_strength,
@@ -134,6 +138,11 @@ from fishtest.util import (
     tests_repo,
 )
 from fishtest.views_actions import actions as _actions_impl
+from fishtest.views_contributors import (
+    _CONTRIBUTORS_DEFAULT_SORT,
+    _CONTRIBUTORS_SORT_MAP,
+    get_leaderboard,
+)
 from fishtest.views_finished import get_paginated_finished_runs
 from fishtest.views_helpers import (
     _SORT_ORDER_VALUES,
@@ -387,6 +396,8 @@ class _ViewRouteConfig(TypedDict, total=False):
     request_method: _RouteMethods
     http_cache: int
     direct: bool
+    # Version of the data of a GET, see http/conditional.py.
+    etag: Callable[[_ViewContext], Any]
 
 
 type _ViewRoute = tuple[Callable[..., Any], str, _ViewRouteConfig]
@@ -512,9 +523,22 @@ async def _dispatch_view(
         commit_session_response(request, session, shim, response)
         return _apply_response_headers(shim, response)
 
+    etag = None
+    etag_version = cfg.get("etag")
+    if request.method == "GET" and etag_version is not None:
+        etag = await run_in_threadpool(_view_etag, shim, etag_version)
+        if etag is not None and etag_matches(request, etag):
+            conditional_get_stats.hit()
+            response = Response(status_code=304, headers={"ETag": etag})
+            commit_session_response(request, session, shim, response)
+            _append_vary_header(response, "HX-Request")
+            response.headers.setdefault("Cache-Control", "no-cache, private")
+            return _apply_response_headers(shim, response)
+
     result = await run_in_threadpool(fn, shim)
 
     if isinstance(result, Response):
+        _set_etag(result, etag)
         commit_session_response(request, session, shim, result)
         apply_http_cache(result, cfg)
         if request.method == "GET":
@@ -541,6 +565,7 @@ async def _dispatch_view(
         # Most UI endpoints either redirect or render templates.
         response = HTMLResponse("", status_code=204)
 
+    _set_etag(response, etag)
     commit_session_response(request, session, shim, response)
     apply_http_cache(response, cfg)
     if request.method == "GET":
@@ -551,6 +576,31 @@ async def _dispatch_view(
     return _apply_response_headers(shim, response)
 
 
+def _view_etag(
+    shim: _ViewContext,
+    etag_version: Callable[[_ViewContext], Any],
+) -> str | None:
+    version = etag_version(shim)
+    if version is None:
+        return None
+    return build_etag(shim.raw_request, shim.session, version)
+
+
+def _set_etag(response: Response, etag: str | None) -> None:
+    # Polling fragments stop with 286 and pause with 204: only the
+    # fragments themselves are revalidated.
+    if etag is None or response.status_code != 200:  # noqa: PLR2004
+        return
+    conditional_get_stats.miss()
+    response.headers["ETag"] = etag
+
+
+def _run_fragment_version(request: _ViewContext) -> Any:  # noqa: ANN401
+    if not _is_hx_request(request):
+        return None
+    return request.rundb.run_version(request.matchdict["id"])
+
+
 # === Authentication ===
 
 
@@ -1803,36 +1853,10 @@ def user(request: _ViewContext) -> dict[str, Any] | RedirectResponse:  # noqa: C
 
 
 # === Contributors ===
-_CONTRIBUTORS_SORT_MAP = {
-    "cpu_hours": ("cpu_hours", True),
-    "username": ("username", False),
-    "last_updated": ("last_updated", True),
-    "games_per_hour": ("games_per_hour", True),
-    "games": ("games", True),
-    "tests": ("tests", True),
-    "tests_repo": ("tests_repo", False),
-}
-_CONTRIBUTORS_DEFAULT_SORT = "cpu_hours"
 _CONTRIBUTORS_PAGE_SIZE = CONTRIBUTORS_PAGE_SIZE
 _CONTRIBUTORS_MAX_ALL = CONTRIBUTORS_MAX_ALL
 
 
-def _contributors_sort_value(user: dict[str, Any], sort_key: str) -> Any:  # noqa: ANN401
-    if sort_key == "username":
-        return str(user.get("username", "")).lower()
-    if sort_key == "tests_repo":
-        return str(user.get("tests_repo", "")).lower()
-    if sort_key == "last_updated":
-        value = user.get("last_updated")
-        if isinstance(value, datetime):
-            return value.timestamp()
-        return 0
-    try:
-        return int(user.get(sort_key, 0))
-    except TypeError, ValueError:
-        return 0
-
-
 def _contributors_common(  # noqa: C901, PLR0912, PLR0915
     request: _ViewContext,
     *,
@@ -1858,17 +1882,9 @@ def _contributors_common(  # noqa: C901, PLR0912, PLR0915
 
     view_param = _normalize_view_mode(view_param)
 
-    all_users_unfiltered = list(collection.find())
-    users_list = list(all_users_unfiltered)
-
-    # Stable two-pass sort: enforce username asc tie-breaker, then primary key.
-    users_list.sort(key=lambda u: str(u.get("username", "")).lower())
-    users_list.sort(
-        key=lambda u: _contributors_sort_value(u, sort_key),
-        reverse=reverse,
-    )
-
-    num_users = len(users_list)
+    leaderboard = get_leaderboard(collection)
+    ranking = leaderboard.ranking(sort_key, reverse=reverse)
+    num_users = leaderboard.num_users
 
     findme = request.params.get("findme", "").strip()
     username = request.authenticated_userid
@@ -1876,36 +1892,10 @@ def _contributors_common(  # noqa: C901, PLR0912, PLR0915
     if findme and username:
         target_username = username
     elif search:
-        search_lower = search.lower()
-        exact_match = next(
-            (
-                user.get("username", "")
-                for user in users_list
-                if str(user.get("username", "")).lower() == search_lower
-            ),
-            "",
-        )
-        if exact_match:
-            target_username = exact_match
-        else:
-            target_username = next(
-                (
-                    user.get("username", "")
-                    for user in users_list
-                    if search_lower in str(user.get("username", "")).lower()
-                ),
-                "",
-            )
+        target_username = ranking.find(search)
 
     if target_username:
-        user_rank = next(
-            (
-                idx
-                for idx, user in enumerate(users_list, start=1)
-                if user.get("username") == target_username
-            ),
-            None,
-        )
+        user_rank = ranking.rank(target_username)
         if user_rank is not None:
             target_page = str((user_rank - 1) // _CONTRIBUTORS_PAGE_SIZE + 1)
             current_page = str(page_idx + 1)
@@ -1934,17 +1924,11 @@ def _contributors_common(  # noqa: C901, PLR0912, PLR0915
                     status_code=302,
                 )
 
-    for idx, user in enumerate(users_list, start=1):
-        user["_rank"] = idx
-
-    if highlight and not any(
-        str(user.get("username", "")).lower() == highlight.lower()
-        for user in users_list
-    ):
+    if highlight and highlight.lower() not in ranking.lower_ranks:
         highlight = ""
 
     if view_param == "all":
-        users_page = users_list[:_CONTRIBUTORS_MAX_ALL]
+        users_page = ranking.page(0, _CONTRIBUTORS_MAX_ALL)
         is_truncated = num_users > _CONTRIBUTORS_MAX_ALL
         if is_truncated:
             logger.info(
@@ -1956,7 +1940,7 @@ def _contributors_common(  # noqa: C901, PLR0912, PLR0915
     else:
         start = page_idx * _CONTRIBUTORS_PAGE_SIZE
         end = (page_idx + 1) * _CONTRIBUTORS_PAGE_SIZE
-        users_page = users_list[start:end]
+        users_page = ranking.page(start, end)
         is_truncated = False
 
     is_approver = request.has_permission("approve_run")
@@ -1979,7 +1963,7 @@ def _contributors_common(  # noqa: C901, PLR0912, PLR0915
     context = {
         "is_monthly": is_monthly,
         "monthly_suffix": " - Top Month" if is_monthly else "",
-        "summary": build_contributors_summary(all_users_unfiltered),
+        "summary": leaderboard.summary,
         "users": rows,
         "pages": pages,
         "is_approver": is_approver,
@@ -2701,7 +2685,7 @@ def _build_live_elo_context(run: dict[str, Any]) -> dict[str, Any]:
     results = run["results"]
     sprt = run["args"]["sprt"]
     elo_model = sprt.get("elo_model", "BayesElo")
-    a = fishtest.stats.stat_util.SPRT_elo(
+    a = fishtest.stats.stat_util.SPRT_elo_cached(
         results,
         alpha=sprt["alpha"],
         beta=sprt["beta"],
@@ -2757,10 +2741,9 @@ def _classify_run_status(run: dict[str, Any]) -> str:
 def _build_tests_view_status_context(run: dict[str, Any]) -> dict[str, str]:
     active_workers = 0
     active_cores = 0
-    for task in run["tasks"]:
-        if task["active"]:
-            active_workers += 1
-            active_cores += task["worker_info"]["concurrency"]
+    for _, task in active_tasks(run["tasks"]):
+        active_workers += 1
+        active_cores += task["worker_info"]["concurrency"]
 
     return {
         "run_status_label": _classify_run_status(run),
@@ -3398,8 +3381,8 @@ def _build_tests_view_detail_context(
         **_build_tests_view_status_context(run),
         "run_args": _build_tests_view_run_args(run),
         "approver": request.has_permission("approve_run"),
-        "chi2": get_chi2(run["tasks"]),
-        "document_size": len(bson.BSON.encode(run)),
+        "chi2": request.rundb.get_chi2(run),
+        "document_size": len(bson.BSON.encode(plain_run(run))),
         "spsa_data": request.rundb.spsa_handler.get_spsa_data(run_id),
         "spsa_percentage_checked": read_cookie_bool(
             request,
@@ -3465,7 +3448,7 @@ def tests_tasks(request: _ViewContext) -> dict[str, Any] | Response:
     run = request.rundb.get_run(request.matchdict["id"])
     if run is None:
         raise StarletteHTTPException(status_code=404)
-    chi2 = get_chi2(run["tasks"])
+    chi2 = request.rundb.get_chi2(run)
     show_task = _parse_show_task_param(request)
 
     context = _task_table_state(
@@ -3526,7 +3509,7 @@ def tests_view(request: _ViewContext) -> dict[str, Any] | RedirectResponse:  # n
         raise StarletteHTTPException(status_code=404)
     follow = 1 if "follow" in request.params else 0
     page_title = get_page_title(run)
-    results_info = format_results(run)
+    results_info = get_results_info(run)
     detail_context = _build_tests_view_detail_context(request, run)
     open_graph, theme_color = build_tests_view_open_graph(
         page_url=f"{_host_url(request)}/tests/view/{run['_id']}",
@@ -3818,18 +3801,25 @@ _VIEW_ROUTES: list[_ViewRoute] = [
     (
         live_elo_update,
         "/tests/live_elo_update/{id}",
-        {"renderer": "live_elo_fragment.html.j2"},
+        {"renderer": "live_elo_fragment.html.j2", "etag": _run_fragment_version},
+    ),
+    (
+        tests_stats,
+        "/tests/stats/{id}",
+        {"renderer": "tests_stats.html.j2", "etag": _run_fragment_version},
     ),
-    (tests_stats, "/tests/stats/{id}", {"renderer": "tests_stats.html.j2"}),
     (
         tests_tasks,
         "/tests/tasks/{id}",
-        {"renderer": "tasks_content_fragment.html.j2"},
+        {"renderer": "tasks_content_fragment.html.j2", "etag": _run_fragment_version},
     ),
     (
         tests_view_detail,
         "/tests/view/{id}/detail",
-        {"renderer": "tests_view_detail_fragment.html.j2"},
+        {
+            "renderer": "tests_view_detail_fragment.html.j2",
+            "etag": _run_fragment_version,
+        },
     ),
     (
         tests_machines,
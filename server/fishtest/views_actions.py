@@ -315,9 +315,9 @@ def _matching_action_usernames(
     if matches:
         return matches
 
-    cache_clear = getattr(get_action_usernames, "cache_clear", None)
-    if callable(cache_clear):
-        cache_clear()
+    refresh_action_usernames = getattr(actiondb, "refresh_action_usernames", None)
+    if callable(refresh_action_usernames):
+        refresh_action_usernames()
         matches = _matches_from_cached_usernames()
 
     return matches
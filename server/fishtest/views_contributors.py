@@ -0,0 +1,131 @@
+"""Keep the ranked contributors leaderboards of `/contributors`.
+
+The ``user_cache`` and ``top_month`` collections are rewritten as a whole by
+``utils/delta_update_users.py``. Between two updates every page view, sort
+and search would otherwise reload and re-sort the full collection, so a
+``Leaderboard`` is built once per collection content and shared by all
+requests. It holds the precomputed summary and, lazily per sort order, the
+ranked users with the username to rank indexes.
+
+A leaderboard is rebuilt when the signature of its collection changes, that
+is the number of documents or the newest ``_id``. Both are cheap to query.
+``delta_update_users`` inserts all documents with fresh ids, so each of its
+updates is picked up by the next request.
+"""
+
+from __future__ import annotations
+
+import threading
+from datetime import datetime
+from typing import Any
+
+from pymongo import DESCENDING
+
+from fishtest.http.template_helpers import build_contributors_summary
+
+_CONTRIBUTORS_SORT_MAP = {
+    "cpu_hours": ("cpu_hours", True),
+    "username": ("username", False),
+    "last_updated": ("last_updated", True),
+    "games_per_hour": ("games_per_hour", True),
+    "games": ("games", True),
+    "tests": ("tests", True),
+    "tests_repo": ("tests_repo", False),
+}
+_CONTRIBUTORS_DEFAULT_SORT = "cpu_hours"
+
+
+def _contributors_sort_value(user: dict[str, Any], sort_key: str) -> Any:  # noqa: ANN401
+    if sort_key == "username":
+        return str(user.get("username", "")).lower()
+    if sort_key == "tests_repo":
+        return str(user.get("tests_repo", "")).lower()
+    if sort_key == "last_updated":
+        value = user.get("last_updated")
+        if isinstance(value, datetime):
+            return value.timestamp()
+        return 0
+    try:
+        return int(user.get(sort_key, 0))
+    except TypeError, ValueError:
+        return 0
+
+
+class Ranking:
+    """The users of a leaderboard in a given sort order."""
+
+    def __init__(self, users: list[dict[str, Any]], sort_key: str, *, reverse: bool):
+        # Stable two-pass sort: enforce username asc tie-breaker, then primary key.
+        users = sorted(users, key=lambda u: str(u.get("username", "")).lower())
+        users.sort(key=lambda u: _contributors_sort_value(u, sort_key), reverse=reverse)
+        self.users = users
+        self.usernames = [str(u.get("username", "")) for u in users]
+        self.lower_usernames = [username.lower() for username in self.usernames]
+        self.ranks = {}
+        self.lower_ranks = {}
+        for rank, username in enumerate(self.usernames, start=1):
+            self.ranks.setdefault(username, rank)
+            self.lower_ranks.setdefault(username.lower(), rank)
+
+    def find(self, search: str) -> str:
+        """Return the best ranked username matching search, or ``""``."""
+        search_lower = search.lower()
+        rank = self.lower_ranks.get(search_lower)
+        if rank is None:
+            rank = next(
+                (
+                    idx
+                    for idx, username in enumerate(self.lower_usernames, start=1)
+                    if search_lower in username
+                ),
+                None,
+            )
+        return "" if rank is None else self.usernames[rank - 1]
+
+    def rank(self, username: str) -> int | None:
+        return self.ranks.get(username)
+
+    def page(self, start: int, end: int) -> list[dict[str, Any]]:
+        """Return copies of the users in [start, end) with their ``_rank``."""
+        return [
+            {**user, "_rank": rank}
+            for rank, user in enumerate(self.users[start:end], start=start + 1)
+        ]
+
+
+class Leaderboard:
+    def __init__(self, users: list[dict[str, Any]]):
+        self.num_users = len(users)
+        self.summary = build_contributors_summary(users)
+        self.__users = users
+        self.__rankings = {}
+        self.__lock = threading.Lock()
+
+    def ranking(self, sort_key: str, *, reverse: bool) -> Ranking:
+        with self.__lock:
+            ranking = self.__rankings.get((sort_key, reverse))
+            if ranking is None:
+                ranking = Ranking(self.__users, sort_key, reverse=reverse)
+                self.__rankings[sort_key, reverse] = ranking
+            return ranking
+
+
+_leaderboards: dict[str, tuple[tuple[int, Any], Leaderboard]] = {}
+_leaderboards_lock = threading.Lock()
+
+
+def get_leaderboard(collection: Any) -> Leaderboard:  # noqa: ANN401
+    newest = collection.find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    signature = (
+        collection.estimated_document_count(),
+        newest["_id"] if newest is not None else None,
+    )
+    with _leaderboards_lock:
+        cached = _leaderboards.get(collection.full_name)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    # If the collection changes meanwhile, the next request rebuilds it.
+    leaderboard = Leaderboard(list(collection.find()))
+    with _leaderboards_lock:
+        _leaderboards[collection.full_name] = (signature, leaderboard)
+    return leaderboard
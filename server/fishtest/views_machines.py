@@ -2,10 +2,18 @@
 
 Normalize rows, apply filtering and sorting, manage UI-state cookies, and
 support the ``tests_machines`` entry point.
+
+The normalized rows of the active machines are shared by all requests of
+the instance for ``MACHINE_ROWS_MAX_AGE_S`` seconds, together with an
+index by username and the sort orders computed so far. The machines page
+and the filtered worker count of the homepage read them instead of
+scanning the task lists of the unfinished runs on every request.
 """
 
 from __future__ import annotations
 
+import threading
+import time
 from datetime import datetime
 from typing import TYPE_CHECKING, Any
 
@@ -13,6 +21,7 @@ if TYPE_CHECKING:
     from collections.abc import Mapping
 
 from fishtest.http.settings import (
+    MACHINE_ROWS_MAX_AGE_S,
     MACHINES_PAGE_SIZE,
     UI_STATE_COOKIE_MAX_AGE_SECONDS,
 )
@@ -185,8 +194,67 @@ def _filter_machine_rows(
     return filtered_rows
 
 
-def _normalized_machine_rows(request: Any) -> list[dict[str, Any]]:  # noqa: ANN401
-    return [_normalize_machine_row(machine) for machine in request.rundb.get_machines()]
+class _MachineRows:
+    """Normalized machine rows, shared by the requests: read only."""
+
+    def __init__(self, rundb: Any, rows: list[dict[str, Any]]) -> None:  # noqa: ANN401
+        self.rundb = rundb
+        self.time = time.monotonic()
+        self.rows = rows
+        self.by_username: dict[str, list[dict[str, Any]]] = {}
+        for row in rows:
+            self.by_username.setdefault(row["username"], []).append(row)
+        self.lock = threading.Lock()
+        self.sorted: dict[tuple[str, bool], list[dict[str, Any]]] = {}
+
+    def user_rows(self, username: str) -> list[dict[str, Any]]:
+        return self.by_username.get(username, [])
+
+    def sorted_rows(self, sort_key: str, *, reverse: bool) -> list[dict[str, Any]]:
+        with self.lock:
+            rows = self.sorted.get((sort_key, reverse))
+            if rows is None:
+                rows = self.sorted[sort_key, reverse] = _sort_machine_rows(
+                    self.rows, sort_key, reverse=reverse
+                )
+            return rows
+
+
+class _MachineRowsCache:
+    def __init__(self) -> None:
+        self.machine_rows: _MachineRows | None = None
+        # Only one thread rebuilds the rows, the others use the old ones.
+        self.build_lock = threading.Lock()
+
+    def get(self, rundb: Any) -> _MachineRows:  # noqa: ANN401
+        machine_rows = self.machine_rows
+        if self._is_current(machine_rows, rundb):
+            return machine_rows
+        usable = machine_rows is not None and machine_rows.rundb is rundb
+        if not self.build_lock.acquire(blocking=not usable):
+            return machine_rows
+        try:
+            machine_rows = self.machine_rows
+            if not self._is_current(machine_rows, rundb):
+                rows = [_normalize_machine_row(m) for m in rundb.get_machines()]
+                machine_rows = self.machine_rows = _MachineRows(rundb, rows)
+            return machine_rows
+        finally:
+            self.build_lock.release()
+
+    def clear(self) -> None:
+        self.machine_rows = None
+
+    @staticmethod
+    def _is_current(machine_rows: _MachineRows | None, rundb: Any) -> bool:  # noqa: ANN401
+        return (
+            machine_rows is not None
+            and machine_rows.rundb is rundb
+            and time.monotonic() - machine_rows.time < MACHINE_ROWS_MAX_AGE_S
+        )
+
+
+_machine_rows_cache = _MachineRowsCache()
 
 
 def _filtered_machine_count(
@@ -196,8 +264,13 @@ def _filtered_machine_count(
     my_workers: bool,
     authenticated_username: str | None,
 ) -> int:
+    machine_rows = _machine_rows_cache.get(request.rundb)
+    if my_workers and authenticated_username:
+        rows = machine_rows.user_rows(authenticated_username)
+    else:
+        rows = machine_rows.rows
     filtered_rows = _filter_machine_rows(
-        _normalized_machine_rows(request),
+        rows,
         query_filter=query_filter,
         my_workers=my_workers,
         authenticated_username=authenticated_username,
@@ -229,6 +302,17 @@ def _machines_sort_value(  # noqa: PLR0911
         return 0
 
 
+def _sort_machine_rows(
+    rows: list[dict[str, Any]],
+    sort_key: str,
+    *,
+    reverse: bool,
+) -> list[dict[str, Any]]:
+    rows = sorted(rows, key=lambda m: str(m.get("username", "")).lower())
+    rows.sort(key=lambda m: _machines_sort_value(m, sort_key), reverse=reverse)
+    return rows
+
+
 def _build_machines_query_params(
     sort_param: str,
     order_param: str,
@@ -308,8 +392,8 @@ def tests_machines(request: Any) -> dict[str, Any]:  # noqa: ANN401
     Returns a dict of template context with machine rows, pagination,
     filter state, and sort controls.
     """
-    normalized_rows = _normalized_machine_rows(request)
-    total_machines = len(normalized_rows)
+    machine_rows = _machine_rows_cache.get(request.rundb)
+    total_machines = len(machine_rows.rows)
 
     sort_param = request.params.get("sort", "").strip().lower()
     if sort_param not in _MACHINES_SORT_MAP:
@@ -329,19 +413,19 @@ def tests_machines(request: Any) -> dict[str, Any]:  # noqa: ANN401
     query_filter = machine_filters["query_filter"]
     my_workers = machine_filters["my_workers"]
 
+    if my_workers and username:
+        sorted_rows = _sort_machine_rows(
+            machine_rows.user_rows(username), sort_key, reverse=reverse
+        )
+    else:
+        sorted_rows = machine_rows.sorted_rows(sort_key, reverse=reverse)
     filtered_rows = _filter_machine_rows(
-        normalized_rows,
+        sorted_rows,
         query_filter=query_filter,
         my_workers=my_workers,
         authenticated_username=username,
     )
 
-    filtered_rows.sort(key=lambda m: str(m.get("username", "")).lower())
-    filtered_rows.sort(
-        key=lambda m: _machines_sort_value(m, sort_key),
-        reverse=reverse,
-    )
-
     page_idx = _page_index_from_params(request.params)
     num_machines = len(filtered_rows)
     page_idx = _clamp_page_index(
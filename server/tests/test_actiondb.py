@@ -0,0 +1,69 @@
+"""Test the buffered writer of the actions event log."""
+
+import unittest
+from unittest import mock
+
+import test_support
+
+import fishtest.actiondb
+
+
+class ActionDbWriterTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.rundb = test_support.get_rundb()
+        cls.actiondb = cls.rundb.actiondb
+
+    def tearDown(self):
+        self.actiondb.stop_writer()
+        self.actiondb.actions.delete_many(
+            {"username": {"$in": ["TestActionDbUser", "TestActionDbNewUser"]}}
+        )
+
+    def _count(self, username="TestActionDbUser"):
+        return self.actiondb.actions.count_documents({"username": username})
+
+    def test_queued_actions_are_written_on_stop(self):
+        self.actiondb.start_writer()
+        written = self.actiondb.queue_stats()["written"]
+        for i in range(5):
+            self.actiondb.log_message(
+                username="TestActionDbUser", message=f"message {i}"
+            )
+        self.actiondb.stop_writer()
+        stats = self.actiondb.queue_stats()
+        self.assertEqual(stats["queued"], 0)
+        self.assertEqual(stats["written"], written + 5)
+        self.assertEqual(self._count(), 5)
+
+    def test_get_actions_sees_queued_actions(self):
+        self.actiondb.start_writer()
+        self.actiondb.log_message(username="TestActionDbUser", message="hello")
+        actions, count = self.actiondb.get_actions(username="TestActionDbUser")
+        self.assertEqual(count, 1)
+        self.assertEqual(actions[0]["message"], "hello")
+
+    def test_full_queue_drops_actions(self):
+        self.actiondb.start_writer()
+        dropped = self.actiondb.queue_stats()["dropped"]
+        with (
+            mock.patch.object(fishtest.actiondb, "ACTION_QUEUE_SIZE", 0),
+            mock.patch("builtins.print"),
+        ):
+            self.actiondb.log_message(username="TestActionDbUser", message="lost")
+        self.assertEqual(self.actiondb.queue_stats()["dropped"], dropped + 1)
+        self.actiondb.stop_writer()
+        self.assertEqual(self._count(), 0)
+
+    def test_usernames_are_maintained_incrementally(self):
+        self.actiondb.log_message(username="TestActionDbUser", message="hello")
+        self.assertIn("TestActionDbUser", self.actiondb.get_action_usernames())
+        with mock.patch.object(
+            self.actiondb.actions, "distinct", side_effect=AssertionError
+        ):
+            self.actiondb.log_message(username="TestActionDbNewUser", message="hi")
+            self.assertIn("TestActionDbNewUser", self.actiondb.get_action_usernames())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,11 +5,13 @@ import base64
 import copy
 import gzip
 import io
+import json
 import sys
 import unittest
 from datetime import UTC, datetime
 
 import test_support
+from bson.objectid import ObjectId
 
 from fishtest.run_cache import Prio
 
@@ -876,6 +878,69 @@ class TestHttpApi(unittest.TestCase):
             path="/api/upload_pgn",
         )
 
+    def _pgn_stream_headers(self, run_id: str, task_id: int, password: str) -> dict:
+        payload = {
+            **self._payload(password=password),
+            "run_id": run_id,
+            "task_id": task_id,
+        }
+        return {
+            "Content-Type": "application/gzip",
+            "X-Fishtest-Request": base64.b64encode(
+                json.dumps(payload).encode(),
+            ).decode(),
+        }
+
+    def test_upload_pgn_stream_ok(self):
+        run_id, task_id = self._create_run_with_task()
+        pgn_zip = base64.b64decode(self._build_pgn_payload(run_id, task_id))
+
+        response = self.client.post(
+            "/api/upload_pgn_stream",
+            content=pgn_zip,
+            headers=self._pgn_stream_headers(run_id, task_id, self.password),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(isinstance(response.json().get("duration"), (int, float)))
+        pgn, size = self.rundb.get_pgn(f"{run_id}-{task_id}")
+        self.assertEqual(pgn, pgn_zip)
+        self.assertEqual(size, len(pgn_zip))
+
+    def test_upload_pgn_stream_errors(self):
+        run_id, task_id = self._create_run_with_task()
+        pgn_zip = base64.b64decode(self._build_pgn_payload(run_id, task_id))
+
+        response = self.client.post(
+            "/api/upload_pgn_stream",
+            content=pgn_zip,
+            headers=self._pgn_stream_headers(run_id, task_id, "wrong-password"),
+        )
+        self._assert_worker_error_response(
+            response,
+            status_code=401,
+            path="/api/upload_pgn_stream",
+        )
+
+        response = self.client.post(
+            "/api/upload_pgn_stream",
+            content=pgn_zip[:-4],
+            headers=self._pgn_stream_headers(run_id, task_id, self.password),
+        )
+        self._assert_worker_error_response(
+            response,
+            status_code=400,
+            path="/api/upload_pgn_stream",
+            contains="truncated",
+        )
+
+        response = self.client.post("/api/upload_pgn_stream", content=pgn_zip)
+        self._assert_worker_error_response(
+            response,
+            status_code=400,
+            path="/api/upload_pgn_stream",
+            contains="not json encoded",
+        )
+
     def test_get_active_runs(self):
         run_id = self._create_run()
         response = self.client.get("/api/active_runs")
@@ -883,6 +948,13 @@ class TestHttpApi(unittest.TestCase):
         body = response.json()
         self.assertIn(run_id, body)
 
+    def test_server_stats(self):
+        response = self.client.get("/api/server_stats")
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(set(body["conditional_gets"]), {"hits", "misses"})
+        self.assertEqual(set(body["action_log"]), {"queued", "written", "dropped"})
+
     def test_actions_post(self):
         response = self.client.post("/api/actions", json={})
         self.assertEqual(response.status_code, 200)
@@ -1045,6 +1117,53 @@ class TestHttpApi(unittest.TestCase):
         self.assertEqual(response.headers.get("content-type"), "application/gzip")
         self.assertEqual(len(response.content), len(pgn_a) + len(pgn_b))
 
+    def test_download_run_pgns_in_task_order(self):
+        run_id = "0123456789abcdef01234568"
+        pgns = {
+            task_id: gzip.compress(f"{task_id}\n".encode()) for task_id in range(12)
+        }
+        for task_id in (3, 11, 0, 10, 2, 1, 4, 9, 5, 8, 6, 7):
+            self.rundb.upload_pgn(f"{run_id}-{task_id}", pgns[task_id])
+
+        record = self.rundb.pgndb.find_one({"run_id": f"{run_id}-10"})
+        self.assertEqual(record["run_oid"], ObjectId(run_id))
+        self.assertEqual(record["task_id"], 10)
+        total_size = sum(len(pgn) for pgn in pgns.values())
+        self.assertEqual(
+            self.rundb.pgn_sizes.find_one({"_id": ObjectId(run_id)})["size"],
+            total_size,
+        )
+
+        response = self.client.get(f"/api/run_pgns/{run_id}.pgn.gz")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get("content-length"), str(total_size))
+        self.assertEqual(
+            gzip.decompress(response.content),
+            "".join(f"{task_id}\n" for task_id in range(12)).encode(),
+        )
+
+    def test_download_run_pgns_uploaded_across_deploy(self):
+        run_id = "0123456789abcdef01234569"
+        pgns = [gzip.compress(f"{task_id}\n".encode()) for task_id in range(3)]
+        # Uploaded before run_oid, task_id and pgn_sizes were stored.
+        for task_id in range(2):
+            self.rundb.pgndb.insert_one(
+                {
+                    "run_id": f"{run_id}-{task_id}",
+                    "pgn_zip": pgns[task_id],
+                    "size": len(pgns[task_id]),
+                }
+            )
+        self.rundb.upload_pgn(f"{run_id}-2", pgns[2])
+
+        response = self.client.get(f"/api/run_pgns/{run_id}.pgn.gz")
+
+        self.assertEqual(response.status_code, 200)
+        total_size = sum(len(pgn) for pgn in pgns)
+        self.assertEqual(response.headers.get("content-length"), str(total_size))
+        self.assertEqual(gzip.decompress(response.content), b"0\n1\n2\n")
+
     def test_download_pgn_streaming_response(self):
         run_id = "0123456789abcdef01234567-0"
         raw_pgn = b"pgn-bytes"
@@ -0,0 +1,181 @@
+"""Test the fast path validators of the worker API against the vtjson schemas."""
+
+import copy
+import random
+import unittest
+
+from vtjson import ValidationError, validate
+
+from fishtest.api_validation import (
+    is_valid_api_access,
+    is_valid_api_request,
+    validate_api_access,
+    validate_api_request,
+)
+from fishtest.schemas import api_access_schema, api_schema
+
+WORKER_INFO = {
+    "uname": "Linux 6.1.0",
+    "architecture": ["64bit", "ELF"],
+    "concurrency": 7,
+    "max_memory": 5702,
+    "min_threads": 1,
+    "username": "TestWorkerUser",
+    "version": 331,
+    "python_version": [3, 12, 1],
+    "gcc_version": [13, 2, 0],
+    "compiler": "g++",
+    "unique_key": "amaya-5a28-4b7d-b27b-d78d97ecf11a",
+    "modified": False,
+    "worker_arch": "x86-64-avx512",
+    "ARCH": "x86-64-avx512",
+    "nps": 1234567.5,
+    "near_github_api_limit": False,
+}
+
+REQUESTS = [
+    {"password": "secret", "worker_info": WORKER_INFO},
+    {
+        "password": "secret",
+        "worker_info": WORKER_INFO,
+        "run_id": "64e74776a170cb1f26fa3930",
+        "task_id": 12,
+        "stats": {
+            "wins": 13,
+            "losses": 10,
+            "draws": 9,
+            "crashes": 0,
+            "time_losses": 0,
+            "pentanomial": [1, 3, 6, 4, 2],
+        },
+    },
+    {
+        "password": "secret",
+        "worker_info": WORKER_INFO,
+        "run_id": "64e74776a170cb1f26fa3930",
+        "task_id": 0,
+        "spsa": {"wins": 5, "losses": 4, "draws": 7, "num_games": 16, "sig": 9},
+    },
+    {
+        "password": "secret",
+        "worker_info": WORKER_INFO,
+        "run_id": "64e74776a170cb1f26fa3930",
+        "task_id": 3,
+        "message": "fastchess says: 'Warning; Illegal move'",
+    },
+]
+
+# Values which are wrong for at least some fields.
+BAD_VALUES = [
+    None,
+    True,
+    -1,
+    0,
+    1.5,
+    float("nan"),
+    "",
+    "x",
+    "64e74776a170cb1f26fa393",
+    [],
+    [1, 2],
+    ["a", "b", "c"],
+    {},
+]
+
+
+def _paths(obj, prefix=()):
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            yield (*prefix, key)
+            yield from _paths(value, (*prefix, key))
+    elif isinstance(obj, list):
+        for index, value in enumerate(obj):
+            yield (*prefix, index)
+            yield from _paths(value, (*prefix, index))
+
+
+def _mutations(request):
+    for path in _paths(request):
+        for value in BAD_VALUES:
+            mutated = copy.deepcopy(request)
+            target = mutated
+            for key in path[:-1]:
+                target = target[key]
+            target[path[-1]] = value
+            yield mutated
+        if isinstance(path[-1], str):
+            mutated = copy.deepcopy(request)
+            target = mutated
+            for key in path[:-1]:
+                target = target[key]
+            del target[path[-1]]
+            yield mutated
+            target["extra"] = 1
+            yield mutated
+
+
+def _schema_accepts(schema, request):
+    try:
+        validate(schema, request, "request")
+    except ValidationError:
+        return False
+    return True
+
+
+class ApiValidationTest(unittest.TestCase):
+    def test_valid_requests(self):
+        for request in REQUESTS:
+            self.assertTrue(_schema_accepts(api_schema, request))
+            self.assertTrue(is_valid_api_request(request))
+            self.assertTrue(_schema_accepts(api_access_schema, request))
+            self.assertTrue(is_valid_api_access(request))
+
+    def test_conformance(self):
+        # The fast path may only accept what the schema accepts.
+        count = 0
+        for request in REQUESTS:
+            for mutated in _mutations(request):
+                if is_valid_api_request(mutated):
+                    self.assertTrue(_schema_accepts(api_schema, mutated), mutated)
+                if is_valid_api_access(mutated):
+                    self.assertTrue(
+                        _schema_accepts(api_access_schema, mutated), mutated
+                    )
+                count += 1
+        self.assertGreater(count, 1000)
+
+    def test_random_stats(self):
+        rng = random.Random(42)
+        request = copy.deepcopy(REQUESTS[1])
+        for _ in range(1000):
+            stats = request["stats"]
+            for key in ("wins", "losses", "draws"):
+                stats[key] = rng.randrange(20)
+            stats["pentanomial"] = [rng.randrange(6) for _ in range(5)]
+            self.assertEqual(
+                is_valid_api_request(request), _schema_accepts(api_schema, request)
+            )
+
+    def test_error_messages(self):
+        # Rejected requests get the error message of the schema.
+        for request in REQUESTS:
+            for mutated in _mutations(request):
+                for schema, fast_validate in (
+                    (api_schema, validate_api_request),
+                    (api_access_schema, validate_api_access),
+                ):
+                    try:
+                        validate(schema, mutated, "request")
+                        expected = None
+                    except ValidationError as e:
+                        expected = str(e)
+                    try:
+                        fast_validate(mutated, "request")
+                        message = None
+                    except ValidationError as e:
+                        message = str(e)
+                    self.assertEqual(message, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
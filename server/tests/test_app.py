@@ -17,6 +17,15 @@ class _ConnStub:
 
 
 class _ActionDbStub:
+    def start_writer(self):
+        return None
+
+    def stop_writer(self):
+        return None
+
+    def queue_stats(self):
+        return {}
+
     def system_event(self, message: str):
         _ = message
 
@@ -0,0 +1,116 @@
+"""Test the incremental chi2 state against a full recomputation."""
+
+import bisect
+import random
+import unittest
+
+import scipy.stats
+
+from fishtest.chi2 import Chi2State, chi2_from_frequencies
+
+
+def _make_task(rng, key, bias=0.0, pentanomial=True):
+    pairs = 50
+    p = [0] * 5
+    for _ in range(pairs):
+        r = rng.random() - bias
+        p[bisect.bisect([0.05, 0.25, 0.75, 0.95], r)] += 1
+    wins = 2 * p[4] + p[3]
+    losses = 2 * p[0] + p[1]
+    stats = {
+        "wins": wins,
+        "losses": losses,
+        "draws": 2 * pairs - wins - losses,
+        "crashes": 0,
+        "time_losses": 0,
+    }
+    if pentanomial:
+        stats["pentanomial"] = p
+    return {"worker_info": {"unique_key": key}, "stats": stats}
+
+
+class Chi2StateTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(3)
+        self.tasks = [
+            _make_task(self.rng, f"worker{i % 20}", bias=0.15 if i % 20 == 0 else 0.0)
+            for i in range(400)
+        ]
+
+    def assert_same_chi2(self, a, b):
+        self.assertAlmostEqual(a["chi2"], b["chi2"])
+        self.assertEqual(a["dof"], b["dof"])
+        self.assertAlmostEqual(a["p"], b["p"])
+        self.assertEqual(a["residual"].keys(), b["residual"].keys())
+        for key in a["residual"]:
+            self.assertAlmostEqual(a["residual"][key], b["residual"][key])
+
+    def test_chi2_matches_contingency_test(self):
+        observed = [
+            [float(n) for n in row]
+            for row in ([120, 100, 280], [90, 110, 300], [100, 105, 295])
+        ]
+        result = chi2_from_frequencies(["a", "b", "c"], observed)
+        chi2, p, dof, _ = scipy.stats.chi2_contingency(observed, correction=False)
+        self.assertAlmostEqual(result["chi2"], chi2)
+        self.assertAlmostEqual(result["p"], p)
+        self.assertEqual(result["dof"], dof)
+
+    def test_small_expected_frequencies_are_filtered(self):
+        observed = [[100.0, 100.0, 300.0], [110.0, 95.0, 290.0], [1.0, 0.0, 1.0]]
+        result = chi2_from_frequencies(["a", "b", "c"], observed)
+        self.assertEqual(set(result["residual"]), {"a", "b"})
+        self.assertEqual(result["dof"], 2)
+
+    def test_incremental_updates(self):
+        state = Chi2State(self.tasks)
+        for _ in range(300):
+            task = self.rng.choice(self.tasks)
+            state.remove(task)
+            if self.rng.random() < 0.1:
+                task["bad"] = True
+            else:
+                task["stats"] = _make_task(self.rng, "")["stats"]
+            state.add(task)
+        for _ in range(20):
+            task = _make_task(self.rng, "new_worker")
+            self.tasks.append(task)
+            state.append(task)
+        self.assertEqual(state.task_count, len(self.tasks))
+        self.assert_same_chi2(
+            state.get_chi2(self.tasks), Chi2State(self.tasks).get_chi2(self.tasks)
+        )
+
+    def test_excluded_workers(self):
+        state = Chi2State(self.tasks)
+        full = state.get_chi2(self.tasks)
+        self.assertGreater(full["residual"]["worker0"], full["z_99"])
+        excluded = state.get_chi2(self.tasks, exclude_workers={"worker0"})
+        self.assertNotIn("worker0", excluded["residual"])
+        remaining = [
+            task
+            for task in self.tasks
+            if task["worker_info"]["unique_key"] != "worker0"
+        ]
+        self.assert_same_chi2(excluded, Chi2State(remaining).get_chi2(remaining))
+
+    def test_trinomial_tasks(self):
+        tasks = [
+            _make_task(self.rng, f"worker{i % 5}", pentanomial=False) for i in range(50)
+        ]
+        result = Chi2State(tasks).get_chi2(tasks)
+        self.assertEqual(result["dof"], 8)
+        # The first task decides, pentanomial frequencies of later
+        # tasks are ignored.
+        tasks.append(_make_task(self.rng, "worker0"))
+        self.assertEqual(Chi2State(tasks).get_chi2(tasks)["dof"], 8)
+
+    def test_not_enough_workers(self):
+        tasks = [_make_task(self.rng, "worker0") for _ in range(10)]
+        result = Chi2State(tasks).get_chi2(tasks)
+        self.assertEqual(result["dof"], 0)
+        self.assertEqual(result["residual"], {})
+
+
+if __name__ == "__main__":
+    unittest.main()
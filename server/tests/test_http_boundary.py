@@ -1,6 +1,7 @@
 # ruff: noqa: ANN201, ANN206, D100, D101, D102, E501, INP001, PLC0415, PT009
 """Test HTTP boundary shims, template context, and fragment behavior."""
 
+import gzip
 import re
 import tempfile
 import unittest
@@ -241,6 +242,64 @@ class TestHttpBoundary(unittest.TestCase):
         self.assertTrue(body["error"])
         self.assertIsNone(body["body"])
 
+    def test_json_parsing_gzip_body(self):
+        from fishtest.http.boundary import JsonBodyResult, get_json_body
+
+        app = self._build_app()
+
+        @app.post("/json")
+        async def _json_probe(result: JsonBodyResult = Depends(get_json_body)):
+            return {"error": result.error, "body": result.body}
+
+        client = self.TestClient(app)
+        headers = {"content-type": "application/json", "content-encoding": "gzip"}
+        response = client.post(
+            "/json", content=gzip.compress(b'{"ok": true}'), headers=headers
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"error": False, "body": {"ok": True}})
+
+        for content in (b'{"ok": true}', gzip.compress(b'{"ok": true}')[:-4]):
+            response = client.post("/json", content=content, headers=headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {"error": True, "body": None})
+
+        with patch("fishtest.http.boundary.API_GZIP_MAX_DECOMPRESSED_BYTES", 8):
+            response = client.post(
+                "/json", content=gzip.compress(b'{"ok": true}'), headers=headers
+            )
+        self.assertEqual(response.json(), {"error": True, "body": None})
+
+    def test_read_gzip_body(self):
+        from fishtest.http.boundary import read_gzip_body
+
+        app = self._build_app()
+
+        @app.post("/gzip")
+        async def _gzip_probe(request: Request):
+            try:
+                body = await read_gzip_body(
+                    request, max_bytes=1000, max_decompressed_bytes=10000
+                )
+            except ValueError as e:
+                return {"error": str(e)}
+            return {"size": len(body)}
+
+        client = self.TestClient(app)
+        pgn_zip = gzip.compress(b"1. e4 e5 " * 100)
+        response = client.post("/gzip", content=pgn_zip)
+        self.assertEqual(response.json(), {"size": len(pgn_zip)})
+
+        for content, error in (
+            (b"not gzip", "invalid"),
+            (pgn_zip[:-4], "truncated"),
+            (pgn_zip + pgn_zip, "trailing"),
+            (gzip.compress(b"1. e4 e5 " * 10000), "decompresses"),
+            (bytes(2000), "too large"),
+        ):
+            response = client.post("/gzip", content=content)
+            self.assertIn(error, response.json()["error"])
+
     def test_dispatch_view_204_has_no_body(self):
         from fishtest.views import _dispatch_view
 
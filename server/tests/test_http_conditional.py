@@ -0,0 +1,73 @@
+"""Test the ETags of the versioned polling fragments."""
+
+import unittest
+
+from starlette.requests import Request
+
+from fishtest.http.conditional import ConditionalGetStats, build_etag, etag_matches
+from fishtest.http.cookie_session import SESSION_COOKIE_NAME, CookieSession
+
+
+def _request(path="/tests/stats/1", query="", headers=()):
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": path,
+            "query_string": query.encode(),
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        }
+    )
+
+
+class ConditionalTest(unittest.TestCase):
+    def setUp(self):
+        self.session = CookieSession(data={})
+
+    def test_etag_depends_on_version_url_user_and_ui_cookies(self):
+        etag = build_etag(_request(), self.session, 1)
+        self.assertEqual(build_etag(_request(), self.session, 1), etag)
+        self.assertNotEqual(build_etag(_request(), self.session, 2), etag)
+        self.assertNotEqual(build_etag(_request(query="a=1"), self.session, 1), etag)
+        cookie = [("Cookie", "tasks_view=all")]
+        self.assertNotEqual(build_etag(_request(headers=cookie), self.session, 1), etag)
+        # The session cookie changes on every response.
+        self.assertEqual(
+            build_etag(
+                _request(headers=[("Cookie", f"{SESSION_COOKIE_NAME}=x")]),
+                self.session,
+                1,
+            ),
+            etag,
+        )
+        self.session.data["user"] = "alice"
+        self.assertNotEqual(build_etag(_request(), self.session, 1), etag)
+
+    def test_no_etag_with_pending_flash(self):
+        self.session.flash("Run approved")
+        self.assertIsNone(build_etag(_request(), self.session, 1))
+
+    def test_etag_matches(self):
+        etag = build_etag(_request(), self.session, 1)
+        opaque = etag.removeprefix("W/")
+        for header, expected in (
+            (None, False),
+            (etag, True),
+            (opaque, True),
+            (f'"other", {etag}', True),
+            ('"other"', False),
+            ("*", True),
+        ):
+            headers = [] if header is None else [("If-None-Match", header)]
+            self.assertEqual(etag_matches(_request(headers=headers), etag), expected)
+
+    def test_stats(self):
+        stats = ConditionalGetStats()
+        stats.hit()
+        stats.miss()
+        stats.miss()
+        self.assertEqual(stats.snapshot(), {"hits": 1, "misses": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
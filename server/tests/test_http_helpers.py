@@ -11,11 +11,11 @@ from starlette.responses import Response
 
 from fishtest.api import WORKER_API_PATHS
 from fishtest.app import _require_single_worker_on_primary
-from fishtest.http import cookie_session, jinja
+from fishtest.http import cookie_session, jinja, template_helpers
 from fishtest.http.errors import _WORKER_API_PATHS
 from fishtest.http.middleware import _get_blocked_cached
 from fishtest.http.settings import AppSettings
-from fishtest.http.template_helpers import tests_run_setup
+from fishtest.http.template_helpers import build_run_table_rows, tests_run_setup
 from fishtest.http.ui_pipeline import apply_http_cache
 
 
@@ -315,3 +315,63 @@ class HttpCacheHeaderTests(unittest.TestCase):
         response = Response()
         apply_http_cache(response, {"http_cache": "not-a-number"})
         self.assertIsNone(response.headers.get("Cache-Control"))
+
+
+class FinishedRunRowsCacheTests(unittest.TestCase):
+    def setUp(self):
+        template_helpers._finished_run_rows.clear()
+
+    @staticmethod
+    def _run(*, finished, wins=5):
+        return {
+            "_id": "64e74776233ad9e1a4f0f5a6",
+            "finished": finished,
+            "last_updated": "2025-01-01",
+            "start_time": None,
+            "results": {"wins": wins, "losses": 3, "draws": 2},
+            "args": {
+                "username": "user",
+                "new_tag": "patch",
+                "tc": "10+0.1",
+                "num_games": 10,
+                "tests_repo": "https://github.com/user/Stockfish",
+                "resolved_base": "a" * 40,
+                "resolved_new": "b" * 40,
+            },
+        }
+
+    def test_finished_rows_are_cached_until_the_run_changes(self):
+        run = self._run(finished=True)
+        with mock.patch(
+            "fishtest.http.template_helpers.get_results_info",
+            return_value={"info": ["results"], "style": ""},
+        ) as results_info:
+            (row,) = build_run_table_rows([run], allow_github_api_calls=False)
+            (row2,) = build_run_table_rows([dict(run)], allow_github_api_calls=False)
+            self.assertEqual(results_info.call_count, 1)
+            self.assertEqual(row2["results_info"], {"info": ["results"], "style": ""})
+            self.assertIsNot(row2["run"], run)
+            self.assertEqual(row2["diff_url"], row["diff_url"])
+
+            # E.g. a purge
+            build_run_table_rows(
+                [self._run(finished=True, wins=4)], allow_github_api_calls=False
+            )
+            self.assertEqual(results_info.call_count, 2)
+
+            # Whether a sha is in master is checked on each request.
+            with mock.patch(
+                "fishtest.http.template_helpers.gh.is_master",
+                side_effect=[False, False, True, False],
+            ):
+                (row,) = build_run_table_rows([run], allow_github_api_calls=True)
+                self.assertIn("compare/user:", row["diff_url"])
+                (row,) = build_run_table_rows([run], allow_github_api_calls=True)
+                self.assertIn("compare/official-stockfish:", row["diff_url"])
+            self.assertEqual(results_info.call_count, 2)
+
+            # Unfinished runs are not cached.
+            (row,) = build_run_table_rows(
+                [self._run(finished=False)], allow_github_api_calls=False
+            )
+            self.assertNotIn("results_info", row)
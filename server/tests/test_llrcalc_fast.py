@@ -0,0 +1,91 @@
+"""Check LLRcalc_fast against the reference implementation in LLRcalc."""
+
+import copy
+import random
+import unittest
+
+from fishtest.stats import LLRcalc, LLRcalc_fast
+from fishtest.stats.stat_util import SPRT, update_SPRT
+
+
+def _random_results(rng, count, pairs):
+    weights = [rng.uniform(0.5, 2.0) for _ in range(count)]
+    results = [0] * count
+    for i in rng.choices(range(count), weights=weights, k=pairs):
+        results[i] += 1
+    return results
+
+
+class LLRcalcFastTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(11)
+
+    def test_secular(self):
+        for _ in range(100):
+            values = sorted(self.rng.uniform(-1, 1) for _ in range(5))
+            values[0], values[-1] = -abs(values[0]) - 0.01, abs(values[-1]) + 0.01
+            probabilities = _random_results(self.rng, 5, 1000)
+            probabilities = [(n + 1) / 1005 for n in probabilities]
+            pdf = list(zip(values, probabilities))
+            self.assertAlmostEqual(
+                LLRcalc_fast.secular(values, probabilities),
+                LLRcalc.secular(pdf),
+                places=9,
+            )
+        with self.assertRaises(ValueError):
+            LLRcalc_fast.secular([0.1, 0.2], [0.5, 0.5])
+
+    def test_mle(self):
+        for count in (3, 5):
+            N, pdf = LLRcalc.results_to_pdf(_random_results(self.rng, count, 5000))
+            a, p = [ai for ai, _ in pdf], [pi for _, pi in pdf]
+            for s in (0.45, 0.5, 0.55):
+                p_MLE, _ = LLRcalc_fast.MLE_expected(a, p, s)
+                for u, (_, v) in zip(p_MLE, LLRcalc.MLE_expected(pdf, s)):
+                    self.assertAlmostEqual(u, v, places=9)
+            for t in (-0.05, 0.0, 0.05):
+                p_MLE, _ = LLRcalc_fast.MLE_t_value(a, p, 0.5, t)
+                for u, (_, v) in zip(p_MLE, LLRcalc.MLE_t_value(pdf, 0.5, t)):
+                    self.assertAlmostEqual(u, v, places=8)
+
+    def test_llr(self):
+        for count in (3, 5):
+            warm_starts = {"logistic": {}, "normalized": {}}
+            results = [0] * count
+            for _ in range(50):
+                batch = _random_results(self.rng, count, 200)
+                results = [x + y for x, y in zip(results, batch)]
+                for model, elo0, elo1 in (
+                    ("logistic", -1.75, 0.25),
+                    ("normalized", 0, 2),
+                ):
+                    cold, warm, reference = (
+                        getattr(module, f"LLR_{model}")(elo0, elo1, results, **kwargs)
+                        for module, kwargs in (
+                            (LLRcalc_fast, {}),
+                            (LLRcalc_fast, {"warm_start": warm_starts[model]}),
+                            (LLRcalc, {}),
+                        )
+                    )
+                    self.assertAlmostEqual(cold, reference, delta=1e-7)
+                    self.assertAlmostEqual(warm, reference, delta=1e-7)
+
+    def test_update_SPRT(self):
+        R = {
+            "wins": 65388,
+            "losses": 65804,
+            "draws": 56553,
+            "pentanomial": [10789, 19328, 33806, 19402, 10543],
+        }
+        sprt = SPRT(elo0=0, alpha=0.05, elo1=2, beta=0.05, elo_model="normalized")
+        warm_start = {}
+        for _ in range(3):
+            sprt_ = copy.deepcopy(sprt)
+            update_SPRT(R, sprt_, warm_start=warm_start)
+            llr = LLRcalc.LLR_normalized(0, 2, R["pentanomial"])
+            self.assertAlmostEqual(sprt_["llr"], llr, delta=1e-7)
+            self.assertEqual(sprt_["state"], "rejected")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+"""Check remaining_hours_batch against remaining_hours, one run at a time."""
+
+import random
+import unittest
+
+import scipy.stats
+
+from fishtest.util import book_weight, remaining_hours, remaining_hours_batch
+
+
+def _random_run(rng):
+    num_games = rng.choice([1000, 20000, 60000, 200000, 800000])
+    tc = rng.choice(["10+0.1", "60+0.6", "5+0.05", "40/20"])
+    args = {"num_games": num_games, "tc": tc}
+    if rng.random() < 0.5:
+        args["threads"] = rng.choice([1, 2, 8])
+    if rng.random() < 0.7:
+        played_pairs = rng.choice([0, 1, 100, 5000, 40000, 400000, 2000000])
+        pentanomial = [0] * 5
+        for _ in range(played_pairs):
+            if played_pairs > 1000:
+                break
+            pentanomial[rng.randrange(5)] += 1
+        if played_pairs > 1000:
+            pentanomial = [played_pairs // 5] * 4
+            pentanomial.append(played_pairs - sum(pentanomial))
+        sprt = {
+            "llr": rng.choice([0.0, 0.05, -0.05, rng.uniform(-3, 3), 2.95, -2.95]),
+            "alpha": 0.05,
+            "beta": 0.05,
+        }
+        if rng.random() < 0.5:
+            sprt["overshoot"] = {
+                "m0": rng.choice([0, rng.uniform(-5, 0)]),
+                "sq0": rng.uniform(0, 1),
+                "m1": rng.choice([0, rng.uniform(0, 5)]),
+                "sq1": rng.uniform(0, 1),
+            }
+        args["sprt"] = sprt
+        results = {"wins": 0, "losses": 0, "draws": 0, "pentanomial": pentanomial}
+    else:
+        games = rng.randrange(int(num_games * 1.2))
+        wins = rng.randrange(games + 1)
+        losses = rng.randrange(games - wins + 1)
+        results = {"wins": wins, "losses": losses, "draws": games - wins - losses}
+    return {"args": args, "results": results}
+
+
+class RemainingHoursTest(unittest.TestCase):
+    def test_book_weight(self):
+        for played_pairs in (0, 1, 1000, 100000, 1000000, 2632036, 5000000):
+            self.assertAlmostEqual(
+                book_weight(played_pairs),
+                scipy.stats.beta(1, 15).cdf(min(played_pairs / 2632036, 1.0)),
+                delta=1e-12,
+            )
+
+    def test_parity(self):
+        rng = random.Random(5)
+        runs = [_random_run(rng) for _ in range(500)]
+        batch = remaining_hours_batch(runs)
+        self.assertEqual(len(batch), len(runs))
+        for run, hours in zip(runs, batch):
+            # The integer truncations may differ by one game.
+            self.assertAlmostEqual(hours, remaining_hours(run), delta=1e-3)
+        self.assertEqual(len(remaining_hours_batch([])), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+"""Test the scheduling order of the run index against a full sort."""
+
+import random
+import threading
+import unittest
+
+from bson.objectid import ObjectId
+
+from fishtest.run_index import RunIndex
+
+
+def _make_run(rng):
+    return {
+        "_id": ObjectId(),
+        "cores": rng.choice([0, 0, 1, 4, 8, 16, 64, 250]),
+        "args": {
+            "priority": rng.choice([-1, 0, 0, 0, 1]),
+            "itp": rng.uniform(1.0, 400.0),
+            "threads": rng.choice([1, 1, 2, 8]),
+            "new_options": "Hash=16",
+            "base_options": "Hash=16",
+        },
+    }
+
+
+def _legacy_order(runs, max_threads, last_run_id):
+    def priority(run):
+        adjusted_cores = run["cores"] + (
+            max_threads if str(run["_id"]) == last_run_id else 0
+        )
+        return (
+            -run["args"]["priority"],
+            adjusted_cores > 0,
+            (adjusted_cores + max_threads / 2) / run["args"]["itp"],
+        )
+
+    return [str(run["_id"]) for run in sorted(runs, key=priority)]
+
+
+def _index_order(index, max_threads, last_run_id):
+    order = []
+
+    def collect(entry):
+        order.append(entry.run_id)
+        return False
+
+    index.find(collect, max_threads, last_run_id=last_run_id)
+    return order
+
+
+class RunIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(42)
+        self.runs = [_make_run(self.rng) for _ in range(200)]
+        self.index = RunIndex()
+        for run in self.runs:
+            self.index.update(run)
+
+    def assert_same_order(self, max_threads, last_run_id=None):
+        self.assertEqual(
+            _index_order(self.index, max_threads, last_run_id),
+            _legacy_order(self.runs, max_threads, last_run_id),
+        )
+
+    def test_order_matches_sort(self):
+        for max_threads in (1, 3, 8, 64, 255):
+            self.assert_same_order(max_threads)
+
+    def test_order_matches_sort_with_last_run(self):
+        for run in self.runs[:20]:
+            for max_threads in (1, 16, 128):
+                self.assert_same_order(max_threads, str(run["_id"]))
+
+    def test_updates_move_runs(self):
+        for _ in range(500):
+            run = self.rng.choice(self.runs)
+            run["cores"] = max(0, run["cores"] + self.rng.choice([-8, -1, 1, 8]))
+            run["args"]["itp"] = self.rng.uniform(1.0, 400.0)
+            if self.rng.random() < 0.1:
+                run["args"]["priority"] = self.rng.choice([-1, 0, 1, 2])
+            self.index.update(run)
+        self.assert_same_order(7)
+        self.assert_same_order(32, str(self.runs[0]["_id"]))
+
+    def test_remove_and_retain(self):
+        removed = self.runs.pop()
+        self.index.remove(removed["_id"])
+        self.assertNotIn(str(removed["_id"]), self.index)
+        self.assert_same_order(4)
+
+        kept = self.runs[:50]
+        self.index.retain({str(run["_id"]) for run in kept})
+        self.runs = kept
+        self.assertEqual(len(self.index), 50)
+        self.assert_same_order(4)
+
+    def test_find_returns_first_suitable(self):
+        order = _legacy_order(self.runs, 8, None)
+        wanted = set(order[37::50])
+        run_id = self.index.find(lambda entry: entry.run_id in wanted, 8)
+        self.assertEqual(run_id, order[37])
+        self.assertIsNone(self.index.find(lambda entry: False, 8))
+
+    def test_find_excludes_runs(self):
+        order = _legacy_order(self.runs, 8, None)
+        run_id = self.index.find(lambda entry: True, 8, exclude={order[0], order[1]})
+        self.assertEqual(run_id, order[2])
+
+    def test_find_during_updates(self):
+        # A search runs on a snapshot, so it sees every run exactly once
+        # even if the index is updated concurrently.
+        errors = []
+        stop = threading.Event()
+
+        def search():
+            while not stop.is_set():
+                try:
+                    order = _index_order(self.index, 16, None)
+                    if sorted(order) != sorted(self.index.entries.keys() & order):
+                        errors.append("unknown run")
+                    if len(order) != len(set(order)) or len(order) != 200:
+                        errors.append(f"{len(order)} runs visited")
+                except Exception as e:
+                    errors.append(repr(e))
+
+        threads = [threading.Thread(target=search) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        rng = random.Random(7)
+        for _ in range(2000):
+            run = rng.choice(self.runs)
+            run["cores"] = max(0, run["cores"] + rng.choice([-8, 8]))
+            self.index.update(run)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assert_same_order(16)
+
+    def test_static_eligibility_data(self):
+        run = self.runs[0]
+        run["args"]["new_options"] = "Hash=64 Threads=1"
+        run["args"]["arch_filter"] = "avx2"
+        run["args"]["spsa"] = {"params": [{}] * 4}
+        index = RunIndex()
+        index.update(run)
+        entry = index.entries[str(run["_id"])]
+        self.assertEqual(entry.hash, 80)
+        self.assertEqual(entry.arch_filter, "avx2")
+        self.assertEqual(entry.compiler, "")
+        self.assertEqual(entry.limit_cores, 100000)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,6 +5,7 @@ import sys
 import unittest
 from datetime import UTC, datetime, timedelta
 
+import bson
 import test_support
 from bson.objectid import ObjectId
 from pymongo import DESCENDING
@@ -12,6 +13,7 @@ from pymongo import DESCENDING
 from fishtest.api import WORKER_VERSION
 from fishtest.run_cache import Prio
 from fishtest.spsa_handler import _pack_flips, _unpack_flips
+from fishtest.util import format_results, get_results_info
 
 
 class CreateRunDBTest(unittest.TestCase):
@@ -370,6 +372,47 @@ class CreateRunDBTest(unittest.TestCase):
         )
         self.assertEqual(run, {"task_alive": False})
 
+    def test_21_flush_buffers_writes_deltas(self):
+        # Earlier tests may leave dirty runs in the cache.
+        self.rundb.run_cache.flush_all()
+        dirty_runs = self.rundb.run_cache.metrics()["dirty_runs"]
+        run_id = self._create_test_run()
+        run = self.rundb.get_run(run_id)
+        run["tasks"].append(
+            {
+                "num_games": self.chunk_size,
+                "stats": {"wins": 3, "draws": 2, "losses": 1, "crashes": 0},
+                "pending": True,
+                "active": True,
+            }
+        )
+        run["cores"] = 5
+        del run["rescheduled_from"]
+        self.rundb.buffer(run, task_ids=(1,))
+        self.assertEqual(self.rundb.run_cache.metrics()["dirty_runs"], dirty_runs + 1)
+
+        self.rundb.run_cache.flush_all()
+        metrics = self.rundb.run_cache.metrics()
+        self.assertEqual(metrics["dirty_runs"], 0)
+        self.assertEqual(metrics["last_flush_runs"], dirty_runs + 1)
+        self.assertGreater(metrics["last_flush_bytes"], 0)
+
+        stored = self.rundb.runs.find_one({"_id": run["_id"]})
+        self.assertEqual(len(stored["tasks"]), 2)
+        self.assertEqual(stored["tasks"][1]["stats"]["wins"], 3)
+        self.assertEqual(stored["cores"], 5)
+        self.assertNotIn("rescheduled_from", stored)
+
+        # Only the modified task is sent, not the full document.
+        run["tasks"][0]["stats"]["draws"] = 7
+        self.rundb.buffer(run, task_ids=(0,))
+        self.rundb.run_cache.flush_all()
+        metrics = self.rundb.run_cache.metrics()
+        self.assertLess(metrics["last_flush_bytes"], len(bson.encode(stored)) // 4)
+        stored = self.rundb.runs.find_one({"_id": run["_id"]})
+        self.assertEqual(stored["tasks"][0]["stats"]["draws"], 7)
+        self.assertEqual(stored["tasks"][1]["stats"]["wins"], 3)
+
     def test_30_finish(self):
         run_id = self._create_test_run()
         print("run_id: {}".format(run_id))
@@ -378,6 +421,22 @@ class CreateRunDBTest(unittest.TestCase):
         self.rundb.buffer(run, priority=Prio.SAVE_NOW)
         self.assertTrue(self.rundb.get_run(run_id)["finished"])
 
+    def test_31_stop_run_stores_results_info(self):
+        run_id = self._create_test_run()
+        run = self.rundb.get_run(run_id)
+        run["tasks"][0]["active"] = False
+        self.rundb.stop_run(run_id)
+        run = self.rundb.get_run(run_id)
+        self.assertTrue(run["finished"])
+        self.assertEqual(run["results_info"], format_results(run))
+        finished_runs = self.rundb.get_finished_runs(username="TestRunDbUser")[0]
+        stored = next(r for r in finished_runs if str(r["_id"]) == run_id)
+        self.assertEqual(stored["results_info"], run["results_info"])
+        self.assertIs(get_results_info(stored), stored["results_info"])
+        # A revived run has no summary.
+        self.rundb.set_active_run(run)
+        self.assertNotIn("results_info", self.rundb.get_run(run_id))
+
     def test_40_list_LTC(self):
         self._create_test_run(finished=True)
         self._create_test_run(tc="40+0.4", finished=True)
@@ -0,0 +1,138 @@
+"""Test the snapshots of the unfinished runs served by the homepage."""
+
+import threading
+import unittest
+from unittest import mock
+
+from bson.objectid import ObjectId
+
+import fishtest.runs_snapshot
+from fishtest.runs_snapshot import (
+    StoredRunsSnapshot,
+    UnfinishedRunsSnapshot,
+    aggregate_runs,
+    lightweight_copy,
+)
+
+
+def make_run(username, workers, priority=0):
+    return {
+        "_id": ObjectId(),
+        "finished": False,
+        "workers": workers,
+        "cores": 8 * workers,
+        "nps": 1e6 * workers,
+        "games_per_minute": 10.0 * workers,
+        "results": {"wins": workers, "losses": 2, "draws": 3},
+        "args": {
+            "username": username,
+            "priority": priority,
+            "num_games": 1000,
+            "threads": 1,
+            "tc": "10+0.1",
+            "spsa": {"iter": 0, "param_history": [[{"theta": 1}]]},
+        },
+        "tasks": [{"active": True}] * workers,
+    }
+
+
+class _RunCacheStub:
+    version = 0
+    major_version = 0
+
+
+class _RunDbStub:
+    def __init__(self, runs):
+        self.runs = {str(run["_id"]): run for run in runs}
+        self.run_cache = _RunCacheStub()
+        self.unfinished_runs = set(self.runs)
+        self.unfinished_runs_lock = threading.Lock()
+        self.lock = threading.RLock()
+
+    def get_run(self, run_id):
+        return self.runs.get(run_id)
+
+    def active_run_lock(self, run_id):
+        return self.lock
+
+
+class RunsSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.runs = [
+            make_run("alice", 0, priority=1),
+            make_run("alice", 2),
+            make_run("bob", 0),
+            make_run("bob", 1),
+        ]
+        self.rundb = _RunDbStub(self.runs)
+        self.snapshot = UnfinishedRunsSnapshot(self.rundb)
+
+    def test_matches_aggregate_of_the_runs(self):
+        runs, *totals = self.snapshot.get()
+        expected_runs, *expected_totals = aggregate_runs(self.runs)
+        self.assertEqual(totals, expected_totals)
+        for state in ("pending", "active"):
+            self.assertEqual(
+                [run["_id"] for run in runs[state]],
+                [run["_id"] for run in expected_runs[state]],
+            )
+            for run in runs[state]:
+                self.assertNotIn("tasks", run)
+                self.assertNotIn("param_history", run["args"]["spsa"])
+        self.assertIn("param_history", self.runs[0]["args"]["spsa"])
+
+        runs, *totals = self.snapshot.get(username="bob")
+        self.assertEqual(totals[1], 8)
+        self.assertEqual(len(runs["pending"]) + len(runs["active"]), 2)
+
+    def test_invalidation(self):
+        runs = self.snapshot.get()[0]
+        self.assertIs(self.snapshot.get()[0], runs)
+
+        # A minor change is picked up once the snapshot is old enough.
+        self.rundb.run_cache.version += 1
+        self.assertIs(self.snapshot.get()[0], runs)
+        with mock.patch.object(fishtest.runs_snapshot, "SNAPSHOT_MIN_AGE", 0.0):
+            new_runs = self.snapshot.get()[0]
+        self.assertIsNot(new_runs, runs)
+        self.assertIs(self.snapshot.get()[0], new_runs)
+
+        # A major change is picked up at once.
+        self.runs[0]["workers"] = 1
+        self.rundb.run_cache.major_version += 1
+        runs = self.snapshot.get()[0]
+        self.assertEqual(len(runs["pending"]), 1)
+        self.assertEqual(len(runs["active"]), 3)
+
+
+class _StoredRunDbStub:
+    def __init__(self, runs):
+        self.runs = runs
+        self.queries = 0
+
+    def get_unfinished_runs(self):
+        self.queries += 1
+        return iter([lightweight_copy(run) for run in self.runs])
+
+
+class StoredRunsSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.runs = [make_run("alice", 2), make_run("bob", 0), make_run("bob", 1)]
+        self.rundb = _StoredRunDbStub(self.runs)
+        self.snapshot = StoredRunsSnapshot(self.rundb)
+
+    def test_one_query_per_snapshot(self):
+        runs, *totals = self.snapshot.get()
+        self.assertEqual(totals, list(aggregate_runs(self.runs)[1:]))
+        self.assertIs(self.snapshot.get()[0], runs)
+        runs, *totals = self.snapshot.get(username="bob")
+        self.assertEqual(len(runs["pending"]) + len(runs["active"]), 2)
+        self.assertEqual(self.rundb.queries, 1)
+
+        with mock.patch.object(fishtest.runs_snapshot, "SNAPSHOT_MIN_AGE", 0.0):
+            self.snapshot.get()
+        self.assertEqual(self.rundb.queries, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
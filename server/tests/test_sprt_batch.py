@@ -0,0 +1,81 @@
+"""Check SPRT_elo_batch against SPRT_elo, one test at a time."""
+
+import random
+import unittest
+
+from fishtest.stats import stat_util
+
+
+def _random_query(rng):
+    elo_model = rng.choice(["BayesElo", "logistic", "normalized"])
+    elo0 = rng.choice([-3, -1.75, 0, 0.5])
+    elo1 = elo0 + rng.choice([1.5, 2, 4, 5])
+    games = rng.choice([0, 10, 1000, 20000, 200000])
+    if rng.random() < 0.5:
+        wins = rng.randrange(games + 1)
+        losses = rng.randrange(games - wins + 1)
+        R = {"wins": wins, "losses": losses, "draws": games - wins - losses}
+    else:
+        skew = rng.uniform(-0.03, 0.03)
+        weights = [0.06 - skew, 0.24 - skew, 0.4, 0.24 + skew, 0.06 + skew]
+        pentanomial = [0] * 5
+        for i in rng.choices(range(5), weights=weights, k=min(games, 2000)):
+            pentanomial[i] += max(1, games // 2000)
+        R = {"wins": 1, "losses": 1, "draws": 1, "pentanomial": pentanomial}
+    return {"R": R, "elo0": elo0, "elo1": elo1, "elo_model": elo_model}
+
+
+class SPRTBatchTest(unittest.TestCase):
+    def setUp(self):
+        stat_util.SPRT_elo_cache.clear()
+
+    def assert_close(self, a, b):
+        self.assertEqual(list(a), list(b))
+        for key in ("a", "b", "elo", "LOS", "LLR"):
+            self.assertAlmostEqual(a[key], b[key], delta=1e-7, msg=key)
+        for x, y in zip(a["ci"], b["ci"]):
+            self.assertAlmostEqual(x, y, delta=1e-7, msg="ci")
+
+    def test_parity(self):
+        rng = random.Random(3)
+        queries = [_random_query(rng) for _ in range(200)]
+        # Extreme results, where the solutions are at the edges of [-1000, 1000].
+        queries.extend(
+            {"R": R, "elo0": 0, "elo1": 5, "elo_model": "BayesElo"}
+            for R in (
+                {"wins": 0, "losses": 0, "draws": 0},
+                {"wins": 10, "losses": 0, "draws": 0},
+                {"wins": 100, "losses": 0, "draws": 0},
+                {"wins": 0, "losses": 100, "draws": 3},
+            )
+        )
+        for p in (0.05, 0.2):
+            for query, a in zip(queries, stat_util.SPRT_elo_batch(queries, p=p)):
+                self.assert_close(a, stat_util.SPRT_elo(p=p, **query))
+
+    def test_cache(self):
+        rng = random.Random(5)
+        queries = [_random_query(rng) for _ in range(10)]
+        ret = stat_util.SPRT_elo_batch(queries)
+        self.assertEqual(len(stat_util.SPRT_elo_cache), 10)
+        # Modifying the results does not affect the cache.
+        ret[0]["ci"][0] = None
+        self.assert_close(
+            stat_util.SPRT_elo_batch(queries[:1])[0],
+            stat_util.SPRT_elo(**queries[0]),
+        )
+        query = queries[3]
+        self.assertEqual(
+            stat_util.SPRT_elo_cached(
+                query["R"],
+                elo0=query["elo0"],
+                elo1=query["elo1"],
+                elo_model=query["elo_model"],
+            ),
+            ret[3],
+        )
+        self.assertEqual(len(stat_util.SPRT_elo_cache), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -48,6 +48,7 @@ def cleanup_test_rundb(
 
     if clear_pgndb and hasattr(rundb, "pgndb"):
         rundb.pgndb.delete_many({})
+        rundb.pgn_sizes.delete_many({})
 
     if clear_runs and hasattr(rundb, "runs"):
         rundb.runs.delete_many({})
@@ -0,0 +1,68 @@
+"""Test the deadline heap used to detect dead tasks."""
+
+import random
+import unittest
+from datetime import UTC, datetime, timedelta
+
+from fishtest.task_deadlines import TaskDeadlines
+
+EPOCH = datetime(2025, 1, 1, tzinfo=UTC)
+
+
+def at(seconds):
+    return EPOCH + timedelta(seconds=seconds)
+
+
+class TaskDeadlinesTest(unittest.TestCase):
+    def setUp(self):
+        self.deadlines = TaskDeadlines(timeout=360)
+
+    def test_expiry(self):
+        self.deadlines.refresh("run1", 0, at(0))
+        self.deadlines.refresh("run1", 1, at(100))
+        self.deadlines.refresh("run2", 0, at(50))
+        self.assertEqual(self.deadlines.pop_expired(at(359).timestamp()), [])
+        self.assertEqual(
+            self.deadlines.pop_expired(at(410).timestamp()),
+            [("run1", 0), ("run2", 0)],
+        )
+        self.assertEqual(len(self.deadlines), 1)
+
+    def test_refresh_and_discard(self):
+        self.deadlines.refresh("run1", 0, at(0))
+        self.deadlines.refresh("run1", 1, at(0))
+        self.deadlines.refresh("run1", 0, at(300))
+        self.deadlines.discard("run1", 1)
+        self.assertEqual(self.deadlines.pop_expired(at(400).timestamp()), [])
+        self.assertEqual(self.deadlines.pop_expired(at(660).timestamp()), [("run1", 0)])
+        self.assertEqual(self.deadlines.pop_expired(at(10000).timestamp()), [])
+
+    def test_against_scan(self):
+        rng = random.Random(1)
+        last_updated = {}
+        now = 0
+        for _ in range(5000):
+            now += rng.randrange(5)
+            key = ("run", rng.randrange(300))
+            action = rng.random()
+            if action < 0.8:
+                last_updated[key] = now
+                self.deadlines.refresh(*key, at(now))
+            elif action < 0.9:
+                last_updated.pop(key, None)
+                self.deadlines.discard(*key)
+            else:
+                expired = sorted(
+                    key for key, t in last_updated.items() if t + 360 <= now
+                )
+                for key in expired:
+                    del last_updated[key]
+                self.assertEqual(
+                    sorted(self.deadlines.pop_expired(at(now).timestamp())), expired
+                )
+        self.assertEqual(len(self.deadlines), len(last_updated))
+        self.assertLessEqual(len(self.deadlines.heap), 2 * len(last_updated) + 101)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+"""Test the columnar TaskList against the list of dicts it replaces."""
+
+import copy
+import random
+import unittest
+from datetime import UTC, datetime, timedelta
+
+import bson
+from bson.codec_options import CodecOptions
+
+from fishtest.task_store import TaskList, active_tasks, plain_run, task_type_registry
+
+
+def _make_task(rng, worker):
+    wins, losses = rng.randrange(100), rng.randrange(100)
+    return {
+        "num_games": 200,
+        "active": rng.random() < 0.3,
+        "worker_info": {
+            "username": f"user{worker}",
+            "concurrency": 1 + worker % 8,
+            "unique_key": f"key{worker}",
+            "python_version": [3, 12, 0],
+            "nps": rng.choice([0.0, 1234567.5, 900000]),
+        },
+        "last_updated": datetime(2025, 1, 1, tzinfo=UTC)
+        + timedelta(milliseconds=rng.randrange(10**9)),
+        "start": 200 * rng.randrange(1000),
+        "stats": {
+            "wins": wins,
+            "losses": losses,
+            "draws": 200 - wins - losses,
+            "crashes": 0,
+            "time_losses": rng.randrange(2),
+            "pentanomial": [rng.randrange(20) for _ in range(5)],
+        },
+    }
+
+
+class TaskListTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(5)
+        self.tasks = [_make_task(rng, i % 7) for i in range(100)]
+        self.tasks[3]["bad"] = True
+        self.tasks[4]["spsa_params"] = {"iter": 1, "packed_flips": 3}
+        self.task_list = TaskList(copy.deepcopy(self.tasks))
+
+    def test_round_trip(self):
+        self.assertEqual(self.task_list.to_list(), self.tasks)
+        self.assertEqual(self.task_list, self.tasks)
+        for task, view in zip(self.tasks, self.task_list):
+            self.assertEqual(list(view), list(task))
+            self.assertEqual(
+                type(view["worker_info"]["nps"]), type(task["worker_info"]["nps"])
+            )
+        # The worker_info records are interned.
+        self.assertEqual(len(self.task_list._store.worker_infos), 7)
+
+    def test_values_outside_the_columns(self):
+        task = {
+            "num_games": 2**70,
+            "active": 1,
+            "last_updated": datetime(2025, 1, 1),
+            "stats": {"wins": 1.5},
+            "worker_info": {"nps": True},
+            "pending": [],
+        }
+        self.task_list.append(copy.deepcopy(task))
+        self.assertEqual(self.task_list[-1].to_dict(), task)
+        self.assertIs(self.task_list[-1]["worker_info"]["nps"], True)
+        self.assertEqual(self.task_list[-1]["active"], 1)
+        self.assertIn(100, dict(self.task_list.active_items()))
+
+    def test_mutations(self):
+        rng = random.Random(7)
+        for _ in range(500):
+            task_id = rng.randrange(len(self.tasks))
+            task, view = self.tasks[task_id], self.task_list[task_id]
+            action = rng.randrange(6)
+            if action == 0:
+                value = rng.random() < 0.5
+                task["active"] = view["active"] = value
+            elif action == 1:
+                value = _make_task(rng, rng.randrange(10))["stats"]
+                task["stats"] = value
+                view["stats"] = copy.deepcopy(value)
+            elif action == 2:
+                value = rng.randrange(1000)
+                task["stats"]["wins"] = view["stats"]["wins"] = value
+            elif action == 3:
+                value = _make_task(rng, rng.randrange(10))["worker_info"]
+                task["worker_info"] = value
+                view["worker_info"] = copy.deepcopy(value)
+            elif action == 4:
+                task["last_updated"] = view["last_updated"] = datetime.now(UTC)
+            elif "bad" not in task:
+                task["bad"] = view["bad"] = True
+            else:
+                del task["bad"]
+                del view["bad"]
+        self.assertEqual(self.task_list.to_list(), self.tasks)
+        self.assertEqual(
+            [task_id for task_id, _ in active_tasks(self.task_list)],
+            [task_id for task_id, _ in active_tasks(self.tasks)],
+        )
+
+    def test_copies(self):
+        tasks = copy.copy(self.task_list)
+        self.task_list.append(copy.deepcopy(self.tasks[0]))
+        self.assertEqual(len(tasks), len(self.tasks))
+        with self.assertRaises(TypeError):
+            tasks.append({})
+        tasks = copy.deepcopy(self.task_list)
+        self.assertIs(type(tasks), list)
+        self.assertIs(type(tasks[0]["stats"]), dict)
+        task = copy.deepcopy(self.task_list[0])
+        task["worker_info"]["python_version"][0] = 2
+        self.assertEqual(self.task_list[0]["worker_info"]["python_version"][0], 3)
+
+    def test_bson(self):
+        codec_options = CodecOptions(
+            tz_aware=True, tzinfo=UTC, type_registry=task_type_registry
+        )
+        run = {"_id": bson.ObjectId(), "tasks": self.task_list}
+        self.assertEqual(
+            bson.encode(run, codec_options=codec_options),
+            bson.encode(plain_run(run), codec_options=codec_options),
+        )
+        # BSON datetimes have a millisecond resolution.
+        run = bson.decode(bson.encode(run, codec_options=codec_options), codec_options)
+        self.assertIs(run["tasks"][0]["last_updated"].tzinfo, UTC)
+        self.assertEqual(TaskList(run["tasks"]), self.tasks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -25,13 +25,13 @@ class _CachedActionUsernamesStub:
     def __init__(self, usernames_versions):
         self._usernames_versions = [list(usernames) for usernames in usernames_versions]
         self._version_idx = 0
-        self.cache_clear_calls = 0
+        self.refresh_calls = 0
 
     def __call__(self):
         return list(self._usernames_versions[self._version_idx])
 
-    def cache_clear(self):
-        self.cache_clear_calls += 1
+    def refresh(self):
+        self.refresh_calls += 1
         if self._version_idx < len(self._usernames_versions) - 1:
             self._version_idx += 1
 
@@ -41,6 +41,9 @@ class _RefreshingActionDbStub(_ActionDbStub):
         super().__init__(return_count=return_count)
         self.get_action_usernames = _CachedActionUsernamesStub(usernames_versions)
 
+    def refresh_action_usernames(self):
+        self.get_action_usernames.refresh()
+
 
 class _PriorityActionDbStub:
     def __init__(self, *, usernames, actions_by_username):
@@ -265,7 +268,7 @@ class TestActionsViewMaxCount(unittest.TestCase):
 
         last_kwargs = self._last_kwargs(request)
         self.assertEqual(last_kwargs["usernames"], ["TestFreshActionUser"])
-        self.assertEqual(request.actiondb.get_action_usernames.cache_clear_calls, 1)
+        self.assertEqual(request.actiondb.get_action_usernames.refresh_calls, 1)
 
 
 class TestActionsViews(unittest.TestCase):
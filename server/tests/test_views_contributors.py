@@ -185,6 +185,43 @@ class TestViewsContributors(UiUserTestCase):
                 {"username": {"$regex": "^RankUser"}}
             )
 
+    def test_contributors_leaderboard_follows_collection_updates(self):
+        def docs(first, second):
+            return [
+                {
+                    "username": username,
+                    "cpu_hours": cpu_hours,
+                    "games": 10,
+                    "tests": 1,
+                    "games_per_hour": 1,
+                    "last_updated": datetime.now(UTC),
+                    "tests_repo": self.tests_repo,
+                }
+                for username, cpu_hours in (
+                    ("LeaderboardUserA", first),
+                    ("LeaderboardUserB", second),
+                )
+            ]
+
+        query = {"username": {"$regex": "^LeaderboardUser"}}
+        self.rundb.userdb.user_cache.insert_many(docs(20000000, 10000000))
+        try:
+            response = self.client.get("/contributors?page=1")
+            self.assertLess(
+                response.text.index("LeaderboardUserA"),
+                response.text.index("LeaderboardUserB"),
+            )
+            # The same users, rewritten as delta_update_users does.
+            self.rundb.userdb.user_cache.delete_many(query)
+            self.rundb.userdb.user_cache.insert_many(docs(10000000, 20000000))
+            response = self.client.get("/contributors?page=1")
+            self.assertLess(
+                response.text.index("LeaderboardUserB"),
+                response.text.index("LeaderboardUserA"),
+            )
+        finally:
+            self.rundb.userdb.user_cache.delete_many(query)
+
     def test_contributors_findme_redirects_to_page(self):
         docs = [
             {
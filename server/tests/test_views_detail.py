@@ -404,6 +404,38 @@ class TestTestsViewDetail(unittest.TestCase):
         self.assertIn("p-value", response.text)
         self.assertNotIn("<title>", response.text)
 
+    def test_tests_view_detail_answers_conditional_get_until_run_changes(self):
+        run_id = self._create_run()
+        run = self.rundb.get_run(run_id)
+        run["workers"] = 1
+        self.rundb.buffer(run, priority=Prio.SAVE_NOW)
+        url = f"/tests/view/{run_id}/detail?expected=active"
+
+        response = self.client.get(url, headers={"HX-Request": "true"})
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+
+        response = self.client.get(
+            url,
+            headers={"HX-Request": "true", "If-None-Match": etag},
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.text, "")
+
+        # The full page is not versioned.
+        response = self.client.get(url, headers={"If-None-Match": etag})
+        self.assertNotIn("ETag", response.headers)
+
+        run["results"] = {"wins": 1, "losses": 0, "draws": 1}
+        self.rundb.buffer(run)
+        response = self.client.get(
+            url,
+            headers={"HX-Request": "true", "If-None-Match": etag},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
     def test_tests_view_detail_hx_active_returns_spsa_oob_fragments(self):
         run_id = self._create_run()
         run = self.rundb.get_run(run_id)
@@ -6,6 +6,7 @@ from unittest.mock import patch
 
 from ui_user_test_case import UiUserTestCase
 
+import fishtest.views_machines
 from fishtest.http.settings import UI_STATE_COOKIE_MAX_AGE_SECONDS
 from fishtest.views_machines import (
     _MACHINES_PAGE_SIZE,
@@ -63,8 +64,10 @@ def _machine_doc(
 class _RunDbStub:
     def __init__(self, machines: list[dict[str, object]]) -> None:
         self._machines = machines
+        self.get_machines_calls = 0
 
     def get_machines(self) -> list[dict[str, object]]:
+        self.get_machines_calls += 1
         return list(self._machines)
 
 
@@ -139,6 +142,34 @@ class MachineRowTests(unittest.TestCase):
 
         self.assertEqual(filtered_count, 2)
 
+    def test_machine_rows_are_shared_until_they_expire(self):
+        owner = "TestMachineOwner"
+        machines = [
+            _machine_doc(0, username=owner),
+            _machine_doc(1, username="TestPeerWorkerUser"),
+        ]
+        request = _RequestStub(machines=machines, authenticated_userid=owner)
+        request.params = {"my_workers": "1"}
+
+        context = tests_machines(request)
+        self.assertEqual(context["machines_count"], 1)
+        self.assertEqual(
+            _filtered_machine_count(
+                request,
+                query_filter="",
+                my_workers=True,
+                authenticated_username=owner,
+            ),
+            1,
+        )
+        self.assertEqual(request.rundb.get_machines_calls, 1)
+
+        machines.append(_machine_doc(2, username=owner))
+        self.assertEqual(tests_machines(request)["machines_count"], 1)
+        with patch.object(fishtest.views_machines, "MACHINE_ROWS_MAX_AGE_S", 0.0):
+            self.assertEqual(tests_machines(request)["machines_count"], 2)
+        self.assertEqual(request.rundb.get_machines_calls, 2)
+
     def test_workers_count_label_reflects_filter_state(self):
         total_workers = 5
         filtered_workers = 2
@@ -7,12 +7,18 @@ from unittest.mock import patch
 
 from ui_user_test_case import UiUserTestCase
 
+from fishtest import views_machines
 from fishtest.http.settings import UI_STATE_COOKIE_MAX_AGE_SECONDS
 
 
 class TestTestsHomepage(UiUserTestCase):
     username = "TestHomepageUser"
 
+    def setUp(self):
+        super().setUp()
+        # The tests patch get_machines, see views_machines._MachineRowsCache.
+        views_machines._machine_rows_cache.clear()
+
     def test_tests_homepage_hidden_workers_count_recomputes_filtered_value(self):
         now = datetime.now(UTC)
         docs = [
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+# backfill_results_info.py - store the results summary (see
+# fishtest.util.get_results_info) in the finished runs that do not have
+# one yet, e.g. runs finished before RunDb started to store it
+#
+# Finished runs only change when they are purged, and RunDb then updates
+# the summary itself, so the script can be run on a live server. Use
+# --force to recompute the summary of all the finished runs.
+#
+
+import argparse
+import time
+
+from pymongo import MongoClient, UpdateOne
+
+from fishtest.util import format_results
+
+
+def backfill(runs, *, force, batch_size, dry_run):
+    q = {"finished": True}
+    if not force:
+        q["results_info"] = {"$exists": False}
+    # format_results() only looks at "args" and "results".
+    projection = {"args": 1, "results": 1}
+    updates = []
+    count = 0
+    for run in runs.find(q, projection, batch_size=batch_size):
+        try:
+            results_info = format_results(run)
+        except Exception as e:
+            # Some very old runs lack fields which are now mandatory.
+            print(f"Skipping run {run['_id']}: {e!r}", flush=True)
+            continue
+        updates.append(
+            UpdateOne({"_id": run["_id"]}, {"$set": {"results_info": results_info}})
+        )
+        if len(updates) >= batch_size:
+            if not dry_run:
+                runs.bulk_write(updates, ordered=False)
+            count += len(updates)
+            updates = []
+            print(f"{count} runs updated", flush=True)
+    if updates and not dry_run:
+        runs.bulk_write(updates, ordered=False)
+    return count + len(updates)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Store the results summary in the finished runs"
+    )
+    parser.add_argument("--db", default="fishtest_new", help="database name")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="recompute the summary of all the finished runs",
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="do not write to the database"
+    )
+    args = parser.parse_args()
+
+    conn = MongoClient()
+    runs = conn[args.db]["runs"]
+    start = time.time()
+    count = backfill(
+        runs, force=args.force, batch_size=args.batch_size, dry_run=args.dry_run
+    )
+    action = "would be updated" if args.dry_run else "updated"
+    print(f"{count} runs {action} in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
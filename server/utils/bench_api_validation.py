@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# bench_api_validation.py - time the validation of typical worker API
+# requests (as in WorkerApi.validate_request) with the vtjson schemas, with
+# the vtjson schemas compiled once, and with the fast path of
+# fishtest.api_validation
+#
+
+import argparse
+import copy
+import time
+
+from vtjson import compile as compile_schema
+from vtjson import validate
+
+from fishtest.api_validation import validate_api_access, validate_api_request
+from fishtest.schemas import api_access_schema, api_schema
+
+WORKER_INFO = {
+    "uname": "Linux 6.1.0",
+    "architecture": ["64bit", "ELF"],
+    "concurrency": 7,
+    "max_memory": 5702,
+    "min_threads": 1,
+    "username": "TestWorkerUser",
+    "version": 331,
+    "python_version": [3, 12, 1],
+    "gcc_version": [13, 2, 0],
+    "compiler": "g++",
+    "unique_key": "amaya-5a28-4b7d-b27b-d78d97ecf11a",
+    "modified": False,
+    "worker_arch": "x86-64-avx512",
+    "ARCH": "x86-64-avx512",
+    "nps": 1234567.5,
+    "near_github_api_limit": False,
+}
+
+REQUESTS = {
+    "request_task": {"password": "secret", "worker_info": WORKER_INFO},
+    "beat": {
+        "password": "secret",
+        "worker_info": WORKER_INFO,
+        "run_id": "64e74776a170cb1f26fa3930",
+        "task_id": 12,
+    },
+    "update_task": {
+        "password": "secret",
+        "worker_info": WORKER_INFO,
+        "run_id": "64e74776a170cb1f26fa3930",
+        "task_id": 12,
+        "stats": {
+            "wins": 13,
+            "losses": 10,
+            "draws": 9,
+            "crashes": 0,
+            "time_losses": 0,
+            "pentanomial": [1, 3, 6, 4, 2],
+        },
+    },
+}
+
+
+def vtjson_validate(request):
+    validate(api_access_schema, request, "request")
+    validate(api_schema, request, "request")
+
+
+compiled_api_access_schema = compile_schema(api_access_schema)
+compiled_api_schema = compile_schema(api_schema)
+
+
+def compiled_validate(request):
+    validate(compiled_api_access_schema, request, "request")
+    validate(compiled_api_schema, request, "request")
+
+
+def fast_validate(request):
+    validate_api_access(request, "request")
+    validate_api_request(request, "request")
+
+
+def bench(function, request, count):
+    # Fresh copies, as each request body is a new object.
+    requests = [copy.deepcopy(request) for _ in range(count)]
+    start = time.perf_counter()
+    for request in requests:
+        function(request)
+    return (time.perf_counter() - start) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the validation of worker API requests"
+    )
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+
+    for name, request in REQUESTS.items():
+        slow = bench(vtjson_validate, request, args.count)
+        compiled = bench(compiled_validate, request, args.count)
+        fast = bench(fast_validate, request, args.count)
+        print(
+            f"{name:>12}: vtjson {1e6 * slow:7.1f} us"
+            f"  compiled {1e6 * compiled:6.1f} us"
+            f"  fast path {1e6 * fast:5.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
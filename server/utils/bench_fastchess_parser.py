@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+# bench_fastchess_parser.py - replay fastchess output through the former
+# line parser of the worker (a regex search per pattern and per line) and
+# through games.FastchessOutputParser, check that both agree, and time
+# them
+#
+# With --log the given fastchess logs (the output of the worker, which
+# prints every fastchess line) are replayed, otherwise a synthetic log
+# with the usual mix of lines is generated. --stream also replays the log
+# in bursts through a queue, as fastchess output reaches the worker, and
+# reports the delay until the result blocks are seen with the former
+# get_nowait()/sleep(0.1) loop and with a blocking get().
+#
+
+import argparse
+import random
+import re
+import statistics
+import sys
+import threading
+import time
+from pathlib import Path
+from queue import Empty, Queue
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "worker"))
+
+from games import (  # noqa: E402
+    FASTCHESS_ERRORS,
+    FASTCHESS_WARNINGS,
+    FastchessOutputParser,
+)
+
+NEW = "New-e443b2459e5a3d2c5f7e38c1b0a2d4e5f6a7b8c9"
+BASE = "Base-0bfc4b69bbe928d6f474a46560bcc3b3f6709aa"
+
+
+def synthetic_log(games, batch_size, seed=42):
+    rng = random.Random(seed)
+    lines = []
+    wld = [0, 0, 0]
+    ptnml = [0] * 5
+    for pair in range(games // 2):
+        for game in (2 * pair + 1, 2 * pair + 2):
+            white, black = (NEW, BASE) if game % 2 else (BASE, NEW)
+            lines.append(f"Started game {game} of {games} ({white} vs {black})")
+            if rng.random() < 0.002:
+                lines.append(f"Warning; Engine {black} is not responsive")
+            outcome = rng.choice(
+                [
+                    "1-0 {White mates}",
+                    "0-1 {Black mates}",
+                    "1/2-1/2 {Draw by adjudication}",
+                ]
+                * 30
+                + ["0-1 {White loses on time}"]
+            )
+            lines.append(f"Finished game {game} ({white} vs {black}): {outcome}")
+        wld[rng.randrange(3)] += 2
+        ptnml[rng.choice([0, 1, 2, 2, 3, 4])] += 1
+        if (2 * pair + 2) % batch_size == 0:
+            count = 2 * (pair + 1)
+            lines += [
+                "--------------------------------------------------",
+                f"Results of {NEW} vs {BASE} (10+0.1, 1t, 16MB, UHO_Lichess_4852_v1.epd):",
+                "Elo: -9.20 +/- 20.93, nElo: -11.50 +/- 26.11",
+                "LOS: 19.41 %, DrawRatio: 42.35 %, PairsRatio: 0.88",
+                f"Games: {count}, Wins: {wld[0]}, Losses: {wld[1]}, Draws: {wld[2]},"
+                f" Points: {wld[0] + wld[2] / 2:.1f} (50.00 %)",
+                f"Ptnml(0-2): [{', '.join(map(str, ptnml))}], WL/DD Ratio: 4.76",
+                "--------------------------------------------------",
+            ]
+    lines.append("Finished match")
+    return lines
+
+
+class LegacyParser:
+    # The line parsing of games.parse_fastchess_output() before
+    # FastchessOutputParser, for comparison.
+
+    def __init__(self, new_name_long, base_name_long, stats, post_warning):
+        self.hash_pattern = re.compile(r"(Base|New)-[a-f0-9]+")
+        self.base_name = self.hash_pattern.sub(self.shorten_hash, base_name_long)
+        self.new_name = self.hash_pattern.sub(self.shorten_hash, new_name_long)
+        self.release_names = frozenset()
+        self.pattern_WLD = FastchessOutputParser.pattern_WLD
+        self.pattern_ptnml = FastchessOutputParser.pattern_ptnml
+        self.patterns_error = tuple(re.compile(p) for p in FASTCHESS_ERRORS)
+        self.patterns_warning = tuple(re.compile(p) for p in FASTCHESS_WARNINGS)
+        self.stats = stats
+        self.post_warning = post_warning
+        self.count_warnings = {}
+        self.pgn_file = {}
+        self.finished_match = False
+        self.WLD_results = None
+        self.ptnml_results = None
+
+    @staticmethod
+    def shorten_hash(match):
+        word = match.group(0).split("-")
+        return "-".join([word[0], word[1][:10]])
+
+    def parse_line(self, line):
+        line = self.hash_pattern.sub(self.shorten_hash, line)
+        if "has CRC32:" in line:
+            self.pgn_file["CRC"] = line.split()[-1]
+        self.finished_match = "Finished match" in line
+        engine_names = frozenset(
+            name for name in (self.base_name, self.new_name) if name in line
+        )
+        if (
+            any(pattern.search(line) for pattern in self.patterns_error)
+            and not engine_names & self.release_names
+        ):
+            raise RuntimeError(f"fastchess says: '{line}'")
+        for pattern in self.patterns_warning:
+            if not pattern.search(line) or engine_names & self.release_names:
+                continue
+            count, exponential = self.count_warnings.get(
+                (pattern.pattern, engine_names), (0, 1)
+            )
+            count += 1
+            if count == exponential:
+                self.post_warning(line)
+                exponential *= 2
+            self.count_warnings[(pattern.pattern, engine_names)] = (count, exponential)
+        if "disconnect" in line or "stall" in line:
+            self.stats["crashes"] += 1
+        if "on time" in line or "timeout" in line:
+            self.stats["time_losses"] += 1
+        m = self.pattern_WLD.search(line)
+        if m:
+            self.WLD_results = {
+                "games": int(m.group(1)),
+                "wins": int(m.group(2)),
+                "losses": int(m.group(3)),
+                "draws": int(m.group(4)),
+                "points": float(m.group(5)),
+            }
+        m = self.pattern_ptnml.search(line)
+        if m:
+            self.ptnml_results = [int(m.group(i)) for i in range(1, 6)]
+        if self.WLD_results is None or self.ptnml_results is None:
+            return line, None
+        results = self.WLD_results, self.ptnml_results
+        self.WLD_results = None
+        self.ptnml_results = None
+        return line, results
+
+
+def replay(parser_class, lines):
+    stats = {"crashes": 0, "time_losses": 0}
+    warnings = []
+    parser = parser_class(NEW, BASE, stats, warnings.append)
+    start = time.perf_counter()
+    output = [parser.parse_line(line) for line in lines]
+    elapsed = time.perf_counter() - start
+    return elapsed, (output, stats, len(warnings))
+
+
+def stream(lines, burst, interval, polling):
+    # Feed the lines to a queue in bursts and measure the delay until the
+    # consumer has parsed each result block.
+    q = Queue()
+    put_times = {}
+
+    def produce():
+        for i in range(0, len(lines), burst):
+            now = time.perf_counter()
+            for j in range(i, min(i + burst, len(lines))):
+                put_times[j] = now
+                q.put((j, lines[j]))
+            time.sleep(interval)
+        q.put(None)
+
+    stats = {"crashes": 0, "time_losses": 0}
+    parser = FastchessOutputParser(NEW, BASE, stats, lambda message: None)
+    delays = []
+    producer = threading.Thread(target=produce)
+    cpu = time.thread_time()
+    producer.start()
+    while True:
+        if polling:
+            try:
+                item = q.get_nowait()
+            except Empty:
+                time.sleep(0.1)
+                continue
+        else:
+            item = q.get(timeout=1.0)
+        if item is None:
+            break
+        j, line = item
+        if parser.parse_line(line)[1] is not None:
+            delays.append(time.perf_counter() - put_times[j])
+    cpu = time.thread_time() - cpu
+    producer.join()
+    return delays, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fastchess parser")
+    parser.add_argument("--log", nargs="*", default=[], help="fastchess logs")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stream", action="store_true")
+    args = parser.parse_args()
+
+    if args.log:
+        lines = []
+        for name in args.log:
+            lines += Path(name).read_text(errors="replace").splitlines()
+    else:
+        lines = synthetic_log(args.games, args.batch_size)
+    print(f"Replaying {len(lines)} lines")
+
+    timings = {}
+    outputs = {}
+    for name, parser_class in (
+        ("legacy", LegacyParser),
+        ("new", FastchessOutputParser),
+    ):
+        runs = [replay(parser_class, lines) for _ in range(args.repeat)]
+        timings[name] = min(elapsed for elapsed, _ in runs)
+        outputs[name] = runs[0][1]
+        print(
+            f"{name:>6}: {timings[name]:6.3f} s"
+            f"  {1e6 * timings[name] / len(lines):5.2f} us/line"
+        )
+    assert outputs["legacy"] == outputs["new"], "the parsers disagree"
+    print(f"speedup {timings['legacy'] / timings['new']:.1f}x, identical output")
+
+    if args.stream:
+        for name, polling in (("get_nowait+sleep", True), ("blocking get", False)):
+            delays, cpu = stream(lines, burst=200, interval=0.02, polling=polling)
+            print(
+                f"{name:>16}: block delay mean {1000 * statistics.mean(delays):6.2f} ms"
+                f"  max {1000 * max(delays):6.2f} ms  consumer cpu {cpu:.2f} s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+# bench_llr.py - time update_SPRT() for a sequence of updates of a run,
+# with the reference LLRcalc, and with LLRcalc_fast with and without
+# warm start
+#
+
+import argparse
+import random
+import time
+
+from fishtest.stats import LLRcalc, LLRcalc_fast
+
+
+def make_updates(count, batch_size, pentanomial):
+    rng = random.Random(42)
+    size = 5 if pentanomial else 3
+    weights = [1, 2, 4, 2, 1] if pentanomial else [1, 1, 2]
+    results = [0] * size
+    # Start from a run which is already under way.
+    for i in rng.choices(range(size), weights=weights, k=50000):
+        results[i] += 1
+    updates = []
+    for _ in range(count):
+        for i in rng.choices(range(size), weights=weights, k=batch_size):
+            results[i] += 1
+        updates.append(list(results))
+    return updates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the SPRT LLR computation")
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    for pentanomial in (True, False):
+        updates = make_updates(args.updates, args.batch_size, pentanomial)
+        for model, elo0, elo1 in (("normalized", 0, 2), ("logistic", -1.75, 0.25)):
+            reference = getattr(LLRcalc, f"LLR_{model}")
+            fast = getattr(LLRcalc_fast, f"LLR_{model}")
+            warm_start = {}
+            timings = {}
+            max_error = 0.0
+            for name, function in (
+                ("LLRcalc", reference),
+                ("fast", fast),
+                ("fast+warm", lambda e0, e1, r: fast(e0, e1, r, warm_start)),
+            ):
+                start = time.perf_counter()
+                llrs = [function(elo0, elo1, results) for results in updates]
+                timings[name] = (time.perf_counter() - start) / len(updates)
+                if name == "LLRcalc":
+                    reference_llrs = llrs
+                else:
+                    max_error = max(
+                        max_error,
+                        *(abs(x - y) for x, y in zip(llrs, reference_llrs)),
+                    )
+            kind = "pentanomial" if pentanomial else "trinomial"
+            print(
+                f"{kind:>11} {model:>10}: "
+                + "  ".join(
+                    f"{name} {1e6 * value:7.1f} us" for name, value in timings.items()
+                )
+                + f"  max |dLLR| {max_error:.1e}"
+            )
+
+
+if __name__ == "__main__":
+    main()
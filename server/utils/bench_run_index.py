@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# bench_run_index.py - compare the scheduling index used by
+# RunDb.sync_request_task with the sort-and-scan it replaced
+#
+
+import argparse
+import random
+import time
+
+from bson.objectid import ObjectId
+
+from fishtest.run_index import RunIndex
+from fishtest.util import get_hash
+
+
+def make_runs(count, rng):
+    runs = []
+    for _ in range(count):
+        threads = rng.choice([1, 1, 1, 1, 2, 8])
+        run = {
+            "_id": ObjectId(),
+            "finished": False,
+            "approved": rng.random() < 0.95,
+            "cores": rng.choice([0, 0, 8, 64, 512, 2048]),
+            "committed_games": 0,
+            "args": {
+                "priority": rng.choice([-1, 0, 0, 0, 0, 1]),
+                "itp": rng.uniform(10.0, 400.0),
+                "threads": threads,
+                "num_games": 0 if rng.random() < 0.1 else 60000,
+                "new_options": f"Hash={16 * threads}",
+                "base_options": f"Hash={16 * threads}",
+                "compiler": rng.choice(["", "", "", "clang++"]),
+            },
+        }
+        runs.append(run)
+    return runs
+
+
+def fits(threads, hash, compiler, max_threads, max_memory, worker_compiler):
+    if threads > max_threads:
+        return False
+    need_tt = hash * (max_threads // threads)
+    need_base = 444 + 2 * (max_threads // threads) * (151 + 31 * threads)
+    if need_base + need_tt > max_memory:
+        return False
+    return compiler in ("", worker_compiler)
+
+
+def needs_games(run):
+    if run["finished"] or not run["approved"]:
+        return False
+    return run["args"]["num_games"] - run["committed_games"] > 0
+
+
+def sort_and_scan(runs, max_threads, max_memory, compiler, last_run_id):
+    def priority(run):
+        adjusted_cores = run["cores"] + (
+            max_threads if str(run["_id"]) == last_run_id else 0
+        )
+        return (
+            -run["args"]["priority"],
+            adjusted_cores > 0,
+            (adjusted_cores + max_threads / 2) / run["args"]["itp"],
+        )
+
+    for run in sorted(runs, key=priority):
+        args = run["args"]
+        hash = get_hash(args["new_options"]) + get_hash(args["base_options"])
+        if needs_games(run) and fits(
+            args["threads"],
+            hash,
+            args.get("compiler", ""),
+            max_threads,
+            max_memory,
+            compiler,
+        ):
+            return str(run["_id"])
+    return None
+
+
+def index_find(index, runs_by_id, max_threads, max_memory, compiler, last_run_id):
+    def suitable(entry):
+        return fits(
+            entry.threads,
+            entry.hash,
+            entry.compiler,
+            max_threads,
+            max_memory,
+            compiler,
+        ) and needs_games(runs_by_id[entry.run_id])
+
+    return index.find(suitable, max_threads, last_run_id=last_run_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=300)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    runs = make_runs(args.runs, rng)
+    runs_by_id = {str(run["_id"]): run for run in runs}
+    workers = [
+        (
+            rng.choice([1, 4, 8, 16, 64, 255]),
+            rng.choice([4000, 16000, 64000]),
+            rng.choice(["g++", "clang++"]),
+            rng.choice([None, str(rng.choice(runs)["_id"])]),
+        )
+        for _ in range(args.requests)
+    ]
+
+    start = time.perf_counter()
+    index = RunIndex()
+    for run in runs:
+        index.update(run)
+    build = time.perf_counter() - start
+
+    # Both schedulers must pick the same runs, the core counts are
+    # updated in between to mimic the assignment of tasks.
+    legacy_time = index_time = 0.0
+    for max_threads, max_memory, compiler, last_run_id in workers:
+        start = time.perf_counter()
+        expected = sort_and_scan(runs, max_threads, max_memory, compiler, last_run_id)
+        legacy_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        found = index_find(
+            index, runs_by_id, max_threads, max_memory, compiler, last_run_id
+        )
+        index_time += time.perf_counter() - start
+
+        if found != expected:
+            raise SystemExit(f"Mismatch: index found {found}, expected {expected}")
+        if found is not None:
+            run = runs_by_id[found]
+            run["cores"] += max_threads
+            index.update(run)
+
+    print(f"{args.runs} runs, {args.requests} requests")
+    print(f"index build:   {1e3 * build:8.3f} ms")
+    print(f"sort-and-scan: {1e6 * legacy_time / args.requests:8.2f} us/request")
+    print(f"run index:     {1e6 * index_time / args.requests:8.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
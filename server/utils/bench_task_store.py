@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+# bench_task_store.py - compare the memory use and the speed of the hot
+# loops over run["tasks"] for a list of dicts and for a TaskList
+#
+# The tasks are synthetic but have the shape of the tasks created by
+# RunDb.request_task(). No database is needed.
+#
+
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from datetime import UTC, datetime, timedelta
+
+from fishtest.schemas import compute_cores, compute_results
+from fishtest.task_store import TaskList, active_tasks
+
+
+def make_worker_info(i):
+    return {
+        "uname": "Linux 6.8.0-45-generic",
+        "architecture": ["64bit", "ELF"],
+        "concurrency": 1 + i % 16,
+        "max_memory": 64000,
+        "min_threads": 1,
+        "username": f"user{i % 50}",
+        "version": 999,
+        "python_version": [3, 12, 3],
+        "gcc_version": [13, 2, 0],
+        "compiler": "g++",
+        "unique_key": f"{i:08x}-6f1e-4d7a-9d5e-6b0c1a2b3c4d",
+        "modified": False,
+        "worker_arch": "x86-64-avx2",
+        "ARCH": "x86-64-avx2 ... ",
+        "nps": 1000000.0 + i,
+        "near_github_api_limit": False,
+        "remote_addr": f"10.0.{i // 256 % 256}.{i % 256}",
+        "country_code": "NL",
+    }
+
+
+def make_tasks(rng, count, workers, active_ratio):
+    now = datetime.now(UTC)
+    tasks = []
+    for i in range(count):
+        wins, losses = rng.randrange(60), rng.randrange(60)
+        tasks.append(
+            {
+                "num_games": 200,
+                "active": rng.random() < active_ratio,
+                "worker_info": make_worker_info(rng.randrange(workers)),
+                "last_updated": now - timedelta(seconds=rng.randrange(3600)),
+                "start": 200 * i,
+                "stats": {
+                    "wins": wins,
+                    "losses": losses,
+                    "draws": 200 - wins - losses,
+                    "crashes": 0,
+                    "time_losses": 0,
+                    "pentanomial": [rng.randrange(20) for _ in range(5)],
+                },
+            }
+        )
+    return tasks
+
+
+def measure_memory(build):
+    gc.collect()
+    tracemalloc.start()
+    value = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, size
+
+
+def timeit(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the columnar task store against lists of dicts"
+    )
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=5000, help="tasks per run")
+    parser.add_argument("--workers", type=int, default=500)
+    parser.add_argument("--active", type=float, default=0.05)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    cutoff = time.time() - 360
+
+    def build_dicts():
+        return [
+            make_tasks(random.Random(i), args.tasks, args.workers, args.active)
+            for i in range(args.runs)
+        ]
+
+    def build_columns():
+        return [
+            TaskList(
+                make_tasks(random.Random(i), args.tasks, args.workers, args.active)
+            )
+            for i in range(args.runs)
+        ]
+
+    def scavenge(tasks):
+        return [
+            task_id
+            for task_id, task in active_tasks(tasks)
+            if task["last_updated"].timestamp() < cutoff
+        ]
+
+    def scavenge_dicts(tasks):
+        # The loop of RunDb.scavenge_dead_tasks() before task_store.py.
+        return [
+            task_id
+            for task_id, task in enumerate(tasks)
+            if task["active"] and task["last_updated"].timestamp() < cutoff
+        ]
+
+    def update(tasks):
+        for task_id in range(0, len(tasks), 7):
+            task = tasks[task_id]
+            task["last_updated"] = datetime.now(UTC)
+            task["stats"]["wins"] += 1
+
+    print(f"{args.runs} runs of {args.tasks} tasks, {args.workers} workers")
+    for name, build, scavenge_ in (
+        ("dicts", build_dicts, scavenge_dicts),
+        ("columns", build_columns, scavenge),
+    ):
+        # Only one layout is alive at a time, for the gc.collect() timing.
+        runs, size = measure_memory(build)
+        gc_time = timeit(gc.collect, args.repeat)
+        scan = timeit(lambda: [scavenge_(tasks) for tasks in runs], args.repeat)
+        cores = timeit(
+            lambda: [compute_cores({"tasks": tasks}) for tasks in runs], args.repeat
+        )
+        results = timeit(
+            lambda: [compute_results({"tasks": tasks}) for tasks in runs], 1
+        )
+        updates = timeit(lambda: [update(tasks) for tasks in runs], 1)
+        print(f"{name}:")
+        print(f"  memory:          {size / 2**20:10.1f} MiB")
+        print(f"  gc.collect():    {1000 * gc_time:10.1f} ms")
+        print(f"  dead task scan:  {1000 * scan:10.1f} ms")
+        print(f"  compute_cores:   {1000 * cores:10.1f} ms")
+        print(f"  compute_results: {1000 * results:10.1f} ms")
+        print(f"  task updates:    {1000 * updates:10.1f} ms")
+        runs = None
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# bench_worker_http.py - time the worker's send_api_post_request() with a
+# new connection per request (bare requests.post, as the worker used to
+# do) and with the worker's keep-alive session, with and without gzip
+# compressed payloads
+#
+# By default the requests go to a minimal local API server; use --url to
+# point the benchmark to a real fishtest instance instead (e.g.
+# --url https://tests.stockfishchess.org/api/request_version, where the
+# TLS handshakes make the difference much larger).
+#
+
+import argparse
+import gzip
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2] / "worker"))
+
+import games  # noqa: E402
+from games import requests, send_api_post_request  # noqa: E402
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately: avoid the delayed ACK stall.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        start = time.perf_counter()
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        json.loads(body)
+        reply = json.dumps({"duration": time.perf_counter() - start}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+def make_payload(size):
+    # Something like an update_task payload, padded to the requested size.
+    payload = {
+        "password": "secret",
+        "run_id": "0123456789abcdef01234567",
+        "task_id": 42,
+        "stats": {"wins": 1000, "losses": 990, "draws": 4010, "crashes": 0},
+        "worker_info": {"username": "bench", "concurrency": 8, "version": 0},
+    }
+    payload["spsa"] = [{"name": f"param{i}", "value": i} for i in range(size // 32)]
+    return payload
+
+
+def bench(url, payload, count, compress):
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        send_api_post_request(url, payload, quiet=True, compress=compress)
+        timings.append(1000 * (time.perf_counter() - start))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the worker's API requests with and without keep-alive"
+    )
+    parser.add_argument("--url", help="API url (default: a local test server)")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument(
+        "--payload-size", type=int, default=20000, help="approximate bytes"
+    )
+    args = parser.parse_args()
+
+    # Do not write the timings to the worker's api.log.
+    games.log = lambda s: None
+
+    server = None
+    url = args.url
+    if url is None:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), ApiHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/api/update_task"
+
+    payload = make_payload(args.payload_size)
+    size = len(json.dumps(payload))
+    print(f"{args.requests} requests to {url}, payload of {size} bytes")
+    http_session = games.http_session
+    for name, session, compress in (
+        ("requests.post", lambda: requests, False),
+        ("session", http_session, False),
+        ("session+gzip", http_session, True),
+    ):
+        games.http_session = session
+        bench(url, payload, 5, compress)  # warm up
+        timings = bench(url, payload, args.requests, compress)
+        print(
+            f"{name:>13}: mean {statistics.mean(timings):6.2f} ms"
+            f"  median {statistics.median(timings):6.2f} ms"
+            f"  p95 {statistics.quantiles(timings, n=20)[-1]:6.2f} ms"
+        )
+    games.http_session = http_session
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -89,6 +89,11 @@ def create_runs_indexes():
 def create_pgns_indexes():
     print("Creating indexes on pgns collection")
     db["pgns"].create_index([("run_id", DESCENDING)])
+    db["pgns"].create_index(
+        [("run_oid", ASCENDING), ("task_id", ASCENDING)],
+        name="run_oid_task_id",
+        partialFilterExpression={"run_oid": {"$exists": True}},
+    )
 
 
 def create_nns_indexes():
@@ -279,7 +279,10 @@ def update_collection(
     """Replace all documents in a collection and create a unique index."""
     collection.delete_many({})
     if documents:
-        collection.insert_many(documents)
+        # Fresh ids let the web server notice the update, see views_contributors.py.
+        collection.insert_many(
+            [{k: v for k, v in doc.items() if k != "_id"} for doc in documents]
+        )
         collection.create_index("username", unique=True)
         logger.info(
             "Successfully updated %s documents in '%s'",
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+
+# load_request_task.py - simulate a reconnection storm against
+# RunDb.request_task and report the number of tasks assigned per second
+#
+# Requires a local MongoDB. The runs are created in a scratch database
+# which is dropped afterwards. Use --serial to emulate the former global
+# request_task lock, for comparison.
+#
+
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime
+
+from fishtest.run_cache import Prio
+from fishtest.rundb import RunDb
+
+USERNAME = "LoadTestUser"
+
+
+def create_runs(rundb, count, num_games):
+    for i in range(count):
+        run_id = rundb.new_run(
+            "master",
+            "master",
+            num_games,
+            "10+0.1",
+            "10+0.1",
+            "UHO_Lichess_4852_v1.epd",
+            "10",
+            1 + (i % 2),
+            "Hash=16",
+            "Hash=16",
+            info=f"Load test run {i}",
+            resolved_base="347d613b0e2c47f90cbf1c5a5affe97303f1ac3d",
+            resolved_new="347d613b0e2c47f90cbf1c5a5affe97303f1ac3d",
+            msg_base="Base",
+            msg_new="New",
+            base_signature="123456",
+            new_signature="654321",
+            base_nets=["nn-0000000000a0.nnue"],
+            new_nets=["nn-0000000000a0.nnue"],
+            tests_repo="https://github.com/official-stockfish/Stockfish",
+            username=USERNAME,
+            start_time=datetime.now(UTC),
+            throughput=100 + 10 * i,
+        )
+        run = rundb.get_run(run_id)
+        run["approved"] = True
+        rundb.buffer(run, priority=Prio.SAVE_NOW)
+
+
+def make_worker_info(i, concurrency):
+    return {
+        "uname": "Linux",
+        "architecture": ["64bit", "ELF"],
+        "concurrency": concurrency,
+        "max_memory": 64000,
+        "min_threads": 1,
+        "username": USERNAME,
+        "version": 999,
+        "python_version": [3, 12, 0],
+        "gcc_version": [13, 2, 0],
+        "compiler": "g++",
+        # The first component distinguishes the short worker names.
+        "unique_key": f"{i:08x}-load-test",
+        "modified": False,
+        "near_github_api_limit": False,
+        "ARCH": "?",
+        "nps": 0.0,
+        "worker_arch": "x86-64-avx2",
+        "remote_addr": f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Drive RunDb.request_task from many threads"
+    )
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--db-name", default="fishtest_load_test")
+    parser.add_argument(
+        "--serial", action="store_true", help="serialize all calls on one lock"
+    )
+    args = parser.parse_args()
+
+    rundb = RunDb(db_name=args.db_name)
+    # Leftovers of an interrupted run.
+    rundb.runs.delete_many({})
+    try:
+        create_runs(rundb, args.runs, num_games=1000000)
+
+        lock = threading.Lock() if args.serial else None
+        results = {"tasks": 0, "busy": 0, "no_task": 0, "errors": 0}
+        results_lock = threading.Lock()
+
+        def request(i):
+            worker_info = make_worker_info(i, args.concurrency)
+            # The semaphore only rejects calls, so we retry as a worker would.
+            while True:
+                if lock is not None:
+                    with lock:
+                        ret = rundb.request_task(worker_info)
+                else:
+                    ret = rundb.request_task(worker_info)
+                if ret.get("info", "").endswith("too busy..."):
+                    with results_lock:
+                        results["busy"] += 1
+                    time.sleep(0.001)
+                    continue
+                break
+            with results_lock:
+                if "task_id" in ret:
+                    results["tasks"] += 1
+                elif "error" in ret:
+                    results["errors"] += 1
+                else:
+                    results["no_task"] += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            list(executor.map(request, range(args.workers)))
+        elapsed = time.perf_counter() - start
+
+        mode = "serial" if args.serial else "parallel"
+        print(
+            f"{mode}: {args.workers} workers, {args.runs} runs, {args.threads} threads"
+        )
+        print(f"elapsed:         {elapsed:8.2f} s")
+        print(f"tasks assigned:  {results['tasks']:8d}")
+        print(f"tasks/s:         {results['tasks'] / elapsed:8.1f}")
+        print(f"busy retries:    {results['busy']:8d}")
+        print(f"no task:         {results['no_task']:8d}")
+        print(f"errors:          {results['errors']:8d}")
+
+        # Sanity check of the bookkeeping.
+        assigned = sum(
+            len(rundb.get_run(run_id)["tasks"]) for run_id in rundb.unfinished_runs
+        )
+        connections = sum(rundb.connections_counter.values())
+        if assigned != results["tasks"] or connections != results["tasks"]:
+            print(
+                f"Mismatch: {assigned} tasks in the runs, {connections} connections",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+    finally:
+        rundb.conn.drop_database(args.db_name)
+        rundb.conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -40,6 +40,7 @@ def purge_pgns(rundb, finished, deleted, days, days_ltc=60):
             kept_pgns += pgns_count
         else:
             rundb.pgndb.delete_many(pgns_query)
+            rundb.pgn_sizes.delete_one({"_id": run["_id"]})
             purged_tasks += tasks_count
             purged_pgns += pgns_count
 
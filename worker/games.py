@@ -1,10 +1,12 @@
 import base64
 import copy
 import ctypes
+import gzip
 import hashlib
 import io
 import json
 import math
+import mmap
 import multiprocessing
 import os
 import platform
@@ -38,13 +40,77 @@ IS_MACOS = "darwin" in platform.system().lower()
 LOGFILE = "api.log"
 
 LOG_LOCK = threading.Lock()
+HASH_CHUNK_SIZE = 1 << 20
 
 
 def text_hash(file):
     # text mode to have newline translation!
-    return base64.b64encode(
-        hashlib.sha384(file.read_text().encode("utf8")).digest()
-    ).decode("utf8")
+    # Read in chunks, books can be several hundred MB large.
+    h = hashlib.sha384()
+    with open(file, "r") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), ""):
+            h.update(chunk.encode("utf8"))
+    return base64.b64encode(h.digest()).decode("utf8")
+
+
+def file_sha256(file):
+    with open(file, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return hashlib.sha256(m).hexdigest()
+
+
+# Verified hashes of the nets and books are remembered in a json file next
+# to them, and a file is hashed again only if its size, mtime or inode has
+# changed since.
+HASH_CACHE_FILE = "hashes.json"
+HASH_CACHE_LOCK = threading.Lock()
+
+
+def read_hash_cache(cache_file):
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except Exception:
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+
+def cached_hash(file, hash_function):
+    """Return hash_function(file), from the hash cache if the file is unchanged"""
+    stat = os.stat(file)
+    signature = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+    key = f"{hash_function.__name__}:{file.name}"
+    cache_file = file.parent / HASH_CACHE_FILE
+    with HASH_CACHE_LOCK:
+        entry = read_hash_cache(cache_file).get(key)
+    if isinstance(entry, list) and entry[:3] == signature:
+        return entry[3]
+
+    digest = hash_function(file)
+
+    with HASH_CACHE_LOCK:
+        # Drop the entries of deleted files.
+        cache = {
+            k: v
+            for k, v in read_hash_cache(cache_file).items()
+            if (file.parent / k.partition(":")[2]).exists()
+        }
+        cache[key] = signature + [digest]
+        temp_file = None
+        try:
+            temp_file = tempfile.NamedTemporaryFile(
+                mode="w", dir=file.parent, delete=False
+            )
+            with temp_file:
+                json.dump(cache, temp_file)
+            Path(temp_file.name).replace(cache_file)
+        except Exception as e:
+            if temp_file is not None:
+                Path(temp_file.name).unlink(missing_ok=True)
+            print(f"Failed to write {cache_file}:\n{e}", file=sys.stderr)
+    return digest
 
 
 class WorkerException(Exception):
@@ -83,6 +149,8 @@ def is_64bit():
 
 HTTP_TIMEOUT = 30.0
 FASTCHESS_KILL_TIMEOUT = 15.0
+# Check this often if fastchess has exited, or if the task was stopped.
+FASTCHESS_READ_TIMEOUT = 1.0
 UPDATE_RETRY_TIME = 15.0
 
 RAWCONTENT_HOST = "https://raw.githubusercontent.com"
@@ -170,6 +238,7 @@ def trim_files(testing_dir, source_dir=None):
     backup_pattern = (
         # (pattern, num_backups, expiration_in_days, only_update)
         ("fastchess" + EXE_SUFFIX, 1, math.inf, False),
+        (HASH_CACHE_FILE, 1, math.inf, False),
         ("stockfish-*-old" + EXE_SUFFIX, 0, -1, True),
         ("stockfish-*" + EXE_SUFFIX, 50, 30, False),
         ("nn-*.nnue", 10, 30, False),
@@ -255,17 +324,145 @@ def cache_remove(cache, name):
         return
 
 
+# Compiled engines are shared through the global cache, so that the worker
+# instances of a host build each engine only once. The binaries are stored
+# by content as engine-<sha256>, and a small index file named after the
+# build (sha, compiler, arch, environment) holds the sha256 of its binary.
+# Both are published with cache_write(), the binary first.
+ENGINE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+
+def engine_cache_key(sha, compiler_ver, arch, env_hash, compiler):
+    if arch == "native":
+        # A native build is only valid on cpus with the same features.
+        props = gcc_props() if compiler == "g++" else clang_props()
+        cpu = str((props["arch"], sorted(props["flags"])))
+        arch = "native_" + hashlib.sha256(cpu.encode()).hexdigest()[0:10]
+    return "-".join(["stockfish", sha, compiler_ver, arch, env_hash]) + ".sha256"
+
+
+def engine_cache_read(cache, key, engine_path):
+    """Copy an engine from the global cache to engine_path, False if not available"""
+    if cache == "":
+        return False
+
+    digest = cache_read(cache, key)
+    if digest is None:
+        return False
+    digest = digest.decode(errors="replace").strip()
+    blob_name = "engine-" + digest
+    blob = cache_read(cache, blob_name)
+    if blob is None or hashlib.sha256(blob).hexdigest() != digest:
+        print(f"Removing invalid engine {key} from global cache.")
+        cache_remove(cache, key)
+        cache_remove(cache, blob_name)
+        return False
+
+    try:
+        temp_path = engine_path.with_name(engine_path.name + ".tmp")
+        temp_path.write_bytes(blob)
+        temp_path.chmod(0o755)
+        temp_path.replace(engine_path)
+    except Exception as e:
+        print(f"Failed to copy the engine {key} from global cache:\n{e}")
+        return False
+
+    if not engine_is_healthy(engine_path):
+        print(f"Removing invalid engine {key} from global cache.")
+        engine_path.unlink()
+        cache_remove(cache, key)
+        cache_remove(cache, blob_name)
+        return False
+
+    update_atime(Path(cache) / blob_name)
+    print(f"Using {engine_path.name} from global cache.")
+    return True
+
+
+def engine_cache_write(cache, key, engine_path):
+    """Publish a compiled engine in the global cache, skip if not available"""
+    if cache == "":
+        return
+
+    try:
+        blob = engine_path.read_bytes()
+    except Exception:
+        return
+    digest = hashlib.sha256(blob).hexdigest()
+    cache_write(cache, "engine-" + digest, blob)
+    cache_write(cache, key, digest.encode())
+    engine_cache_evict(cache)
+
+
+def engine_cache_evict(cache, max_bytes=ENGINE_CACHE_MAX_BYTES):
+    """Remove the least recently used engines until the cached engines fit in max_bytes"""
+    try:
+        engines = []
+        for path in Path(cache).glob("engine-*"):
+            stat = path.stat()
+            engines.append((stat.st_atime, stat.st_size, path))
+    except Exception:
+        return
+
+    total = sum(size for _, size, _ in engines)
+    # Index files of evicted engines are removed by engine_cache_read().
+    for _, size, path in sorted(engines):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except Exception:
+            continue
+        total -= size
+
+
 # For background see:
 # https://stackoverflow.com/questions/16511337/correct-way-to-try-except-using-python-requests-module
 # It may be useful to introduce more refined http exception handling in the future.
 
 
+# All the http requests of the worker go through one requests.Session, so
+# that the connections to the server (and to github) are kept alive and
+# reused instead of paying for a new TCP and TLS handshake per request.
+# Failed connection attempts are retried with a backoff. Other failures
+# are not: the request may have reached the server, and e.g. request_task
+# must not be replayed.
+HTTP_CONNECT_RETRIES = 3
+HTTP_BACKOFF_FACTOR = 0.5
+# API payloads at least this large are sent gzip compressed.
+API_GZIP_MIN_BYTES = 4096
+
+SESSION_LOCK = threading.Lock()
+_session = None
+
+
+def http_session():
+    global _session
+    with SESSION_LOCK:
+        if _session is None:
+            retries = requests.adapters.Retry(
+                total=HTTP_CONNECT_RETRIES,
+                connect=HTTP_CONNECT_RETRIES,
+                read=0,
+                status=0,
+                other=0,
+                allowed_methods=None,
+                backoff_factor=HTTP_BACKOFF_FACTOR,
+            )
+            adapter = requests.adapters.HTTPAdapter(max_retries=retries)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
 def requests_get(remote, *args, **kw):
     # A lightweight wrapper around requests.get()
     try:
         if "timeout" not in kw:
             kw["timeout"] = HTTP_TIMEOUT
-        result = requests.get(remote, *args, **kw)
+        result = http_session().get(remote, *args, **kw)
         result.raise_for_status()  # also catch return codes >= 400
     except Exception as e:
         print(f"Exception in requests.get():\n{e}", file=sys.stderr)
@@ -279,7 +476,7 @@ def requests_post(remote, *args, **kw):
     try:
         if "timeout" not in kw:
             kw["timeout"] = HTTP_TIMEOUT
-        result = requests.post(remote, *args, **kw)
+        result = http_session().post(remote, *args, **kw)
     except Exception as e:
         print(f"Exception in requests.post():\n{e}", file=sys.stderr)
         raise WorkerException(f"Post request to {remote} failed.", e=e)
@@ -287,13 +484,33 @@ def requests_post(remote, *args, **kw):
     return result
 
 
-def send_api_post_request(api_url, payload, quiet=False):
+def send_api_post_request(api_url, payload, quiet=False, compress=None):
+    # compress=None: compress the payload if it is large.
     t0 = datetime.now(timezone.utc)
-    response = requests_post(
-        api_url,
-        data=json.dumps(payload),
-        headers={"Content-Type": "application/json"},
-    )
+    data = json.dumps(payload).encode()
+    headers = {"Content-Type": "application/json"}
+    if compress is None:
+        compress = len(data) >= API_GZIP_MIN_BYTES
+    if compress:
+        data = gzip.compress(data, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    response = requests_post(api_url, data=data, headers=headers)
+    return parse_api_reply(api_url, response, t0, quiet)
+
+
+def send_api_stream_request(api_url, payload, chunks, quiet=False):
+    # Post a gzip stream, sent in chunks as they are produced. The payload
+    # (credentials, run and task ids) goes in the X-Fishtest-Request header.
+    t0 = datetime.now(timezone.utc)
+    headers = {
+        "Content-Type": "application/gzip",
+        "X-Fishtest-Request": base64.b64encode(json.dumps(payload).encode()).decode(),
+    }
+    response = requests_post(api_url, data=chunks, headers=headers)
+    return parse_api_reply(api_url, response, t0, quiet)
+
+
+def parse_api_reply(api_url, response, t0, quiet):
     valid_response = True
     try:
         response = response.json()
@@ -373,12 +590,12 @@ def required_nets(engine):
     return nets
 
 
-def required_nets_from_source():
+def required_nets_from_source(src_dir=Path(".")):
     """Parse evaluate.h and ucioption.cpp to find default nets"""
     nets = []
     pattern = re.compile("nn-[a-f0-9]{12}.nnue")
     # NNUE code after binary embedding (Aug 2020)
-    with open("evaluate.h", "r") as srcfile:
+    with open(src_dir / "evaluate.h", "r") as srcfile:
         for line in srcfile:
             if "EvalFileDefaultName" in line and "define" in line:
                 m = pattern.search(line)
@@ -388,7 +605,7 @@ def required_nets_from_source():
         return nets
 
     # NNUE code before binary embedding (Aug 2020)
-    with open("ucioption.cpp", "r") as srcfile:
+    with open(src_dir / "ucioption.cpp", "r") as srcfile:
         for line in srcfile:
             if "EvalFile" in line and "Option" in line:
                 m = pattern.search(line)
@@ -415,7 +632,16 @@ def fetch_validated_net(remote, testing_dir, net, global_cache):
             return False
         print(f"Using {net} from global cache.")
 
-    (testing_dir / net).write_bytes(content)
+    # The engines of a task are set up concurrently, and may need the same
+    # net: never expose a partially written file.
+    temp_file = tempfile.NamedTemporaryFile(dir=testing_dir, delete=False)
+    try:
+        with temp_file:
+            temp_file.write(content)
+        Path(temp_file.name).replace(testing_dir / net)
+    except BaseException:
+        Path(temp_file.name).unlink(missing_ok=True)
+        raise
     return True
 
 
@@ -425,8 +651,8 @@ def is_valid_net(content, net):
 
 
 def validate_net(testing_dir, net):
-    content = (testing_dir / net).read_bytes()
-    return is_valid_net(content, net)
+    net_hash = cached_hash(testing_dir / net, file_sha256)
+    return net_hash[:12] == net[3:15]
 
 
 def establish_validated_net(remote, testing_dir, net, global_cache):
@@ -621,13 +847,10 @@ def download_from_github(
 
 
 def unzip(blob, save_dir):
-    cd = Path.cwd()
-    os.chdir(save_dir)
     zipball = io.BytesIO(blob)
     with ZipFile(zipball) as zip_file:
-        zip_file.extractall()
+        zip_file.extractall(save_dir)
         file_list = zip_file.infolist()
-    os.chdir(cd)
     return file_list
 
 
@@ -689,11 +912,12 @@ def gcc_props():
     return {"flags": flags, "arch": arch}
 
 
-def make_targets():
+def make_targets(cwd=None):
     """Parse the output of make help and extract the available targets"""
     try:
         with subprocess.Popen(
             ["make", "help"],
+            cwd=cwd,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             universal_newlines=True,
@@ -727,9 +951,9 @@ def make_targets():
     return targets
 
 
-def find_arch(compiler):
+def find_arch(compiler, cwd=None):
     """Find the best arch string based on the cpu/g++ capabilities and Makefile targets"""
-    targets = make_targets()
+    targets = make_targets(cwd)
 
     # recent SF support a native target
     if "native" in targets:
@@ -838,22 +1062,18 @@ def engine_is_healthy(path: Path, timeout_s: float = 5.0):
         return False
 
 
-def setup_engine(
-    testing_dir,
-    remote,
-    sha,
-    repo_url,
-    concurrency,
-    compiler,
-    version,
-    global_cache,
-):
+def engine_paths(testing_dir, sha, compiler, version):
     compiler_ver = compiler + "_" + str("_".join([str(s) for s in version]))
     env, env_hash = create_environment()
     engine_name = "-".join(["stockfish", sha, compiler_ver, env_hash])
     engine_path = (testing_dir / (engine_name + "-old")).with_suffix(EXE_SUFFIX)
     engine_path_native = (testing_dir / engine_name).with_suffix(EXE_SUFFIX)
-    for path in (engine_path_native, engine_path):
+    return engine_path, engine_path_native
+
+
+def cached_engine(testing_dir, sha, compiler, version):
+    """Return the path of a healthy engine built earlier, None if not available"""
+    for path in reversed(engine_paths(testing_dir, sha, compiler, version)):
         if not path.exists():
             continue
 
@@ -867,7 +1087,30 @@ def setup_engine(
         except Exception as e:
             raise WorkerException(f"Failed to remove cached engine {path}:\n{e}")
 
+    return None
+
+
+def setup_engine(
+    testing_dir,
+    remote,
+    sha,
+    repo_url,
+    concurrency,
+    compiler,
+    version,
+    global_cache,
+):
+    path = cached_engine(testing_dir, sha, compiler, version)
+    if path is not None:
+        return path
+
+    compiler_ver = compiler + "_" + str("_".join([str(s) for s in version]))
+    env, env_hash = create_environment()
+    engine_path, engine_path_native = engine_paths(testing_dir, sha, compiler, version)
+
     """Download and build sources in a temporary directory then move exe as engine_path"""
+    # The working directory is left alone: the engines of a task are set up
+    # concurrently.
     worker_dir = testing_dir.parent
     tmp_dir = Path(tempfile.mkdtemp(dir=worker_dir))
 
@@ -891,18 +1134,20 @@ def setup_engine(
         build_dir = (
             tmp_dir / os.path.commonprefix([n.filename for n in file_list]) / "src"
         )
-        os.chdir(build_dir)
-
-        for net in required_nets_from_source():
-            print(f"Build uses default net: {net}")
-            establish_validated_net(remote, testing_dir, net, global_cache)
-            shutil.copyfile(testing_dir / net, net)
-
-        arch = find_arch(compiler)
+        arch = find_arch(compiler, cwd=build_dir)
 
         if arch == "native":
             engine_path = engine_path_native
 
+        cache_key = engine_cache_key(sha, compiler_ver, arch, env_hash, compiler)
+        if engine_cache_read(global_cache, cache_key, engine_path):
+            return engine_path
+
+        for net in required_nets_from_source(build_dir):
+            print(f"Build uses default net: {net}")
+            establish_validated_net(remote, testing_dir, net, global_cache)
+            shutil.copyfile(testing_dir / net, build_dir / net)
+
         if compiler == "g++":
             comp = "mingw" if IS_WINDOWS else "gcc"
         elif compiler == "clang++":
@@ -921,6 +1166,7 @@ def setup_engine(
 
         with subprocess.Popen(
             cmd,
+            cwd=build_dir,
             env=env,
             start_new_session=False if IS_WINDOWS else True,
             stderr=subprocess.PIPE,
@@ -944,6 +1190,7 @@ def setup_engine(
         try:
             p = subprocess.run(
                 cmd,
+                cwd=build_dir,
                 stderr=subprocess.PIPE,
                 check=False,
             )
@@ -963,8 +1210,8 @@ def setup_engine(
             raise FatalException("Another worker is running in the same directory!")
         else:
             (build_dir / "stockfish").with_suffix(EXE_SUFFIX).replace(engine_path)
+        engine_cache_write(global_cache, cache_key, engine_path)
     finally:
-        os.chdir(worker_dir)
         shutil.rmtree(tmp_dir)
 
     return engine_path
@@ -1025,9 +1272,200 @@ def adjust_tc(tc, factor):
     return scaled_tc, tc_limit
 
 
+# fastchess messages which make us stop the run (unless they come from an
+# official release).
+FASTCHESS_ERRORS = (
+    # E.g. "Warning; New-SHA doesn't have option ThreatBySafePawn"
+    r"Warning;.*doesn't have option",
+    # E.g. "Warning; Invalid value for option P: -354"
+    r"Warning; Invalid value for option",
+    r"Warning; Failed to set.*option",
+    r"Warning; No info line available to extract score from engine",
+    # E.g. "Warning; Illegal move <none> played by New-SHA"
+    r"Warning; Illegal move",
+    r"Warning; Could not extract score from engine",
+    r"Warning; Illegal PV move",
+    r"Warning; Move does not match uci move format",
+    r"Warning; PV continues after checkmate",
+    r"Warning; PV continues after stalemate",
+    r"Warning; PV continues after threefold",
+    r"Warning; PV continues after fifty-move rule",
+    r"Warning; Incomplete mating PV",
+    r"Warning; Too long mating PV",
+    r"Warning; Mating PV does not end with checkmate",
+    r"Warning; Bestmove does not match beginning of last PV",
+    # E.g. "Warning; Sign mismatch in mate scores 3 and 1 from New-SHA (Black) and Base-SHA (White)"
+    r"Warning; Sign mismatch in mate scores",
+)
+# fastchess messages which we post to the event log. These warnings may
+# indicate an engine crash, which may be hw related.
+FASTCHESS_WARNINGS = (
+    r"Warning; Engine .* is not responsive",
+    r"Warning; Engine .* didn't respond",
+    r"Warning; No output from",
+    r"Warning; No bestmove found from",
+)
+
+OFFICIAL_RELEASE_SHAS = (
+    "e0bfc4b69bbe928d6f474a46560bcc3b3f6709aa",  # sf_17
+    "03e27488f3d21d8ff4dbf3065603afa21dbd0ef3",  # sf_17.1
+    "cb3d4ee9b47d0c5aae855b12379378ea1439675c",  # sf_18
+    "43a2be018606176d91f612e48a753bd6c8ed6cf7",  # used for SF18 PTs
+)
+
+
+class FastchessOutputParser:
+    # Parses the output of fastchess one line at a time.
+    #
+    # fastchess prints thousands of lines per second on big workers with
+    # short TCs, nearly all of them "Started game" or "Finished game"
+    # lines, so the checks are dispatched on literal substrings: the
+    # regular expressions only run on the few lines which can match them.
+    # All the error patterns (resp. warning patterns) are combined in a
+    # single alternation.
+
+    # patterns used to obtain fastchess WLD and ptnml results from the following block of info:
+    # --------------------------------------------------
+    # Results of New-e443b2459e vs Base-e443b2459e (0.601+0.006, 1t, 16MB, UHO_Lichess_4852_v1.epd):
+    # Elo: -9.20 +/- 20.93, nElo: -11.50 +/- 26.11
+    # LOS: 19.41 %, DrawRatio: 42.35 %, PairsRatio: 0.88
+    # Games: 680, Wins: 248, Losses: 266, Draws: 166, Points: 331.0 (48.68 %)
+    # Ptnml(0-2): [43, 61, 144, 55, 37], WL/DD Ratio: 4.76
+    # --------------------------------------------------
+    pattern_WLD = re.compile(
+        r"Games: ([0-9]+), Wins: ([0-9]+), Losses: ([0-9]+), Draws: ([0-9]+), Points: ([0-9.]+) \("
+    )
+    pattern_ptnml = re.compile(
+        r"Ptnml\(0-2\): \[([0-9]+), ([0-9]+), ([0-9]+), ([0-9]+), ([0-9]+)\]"
+    )
+    # Keep the first 10 hex digits of the engine names, e.g. New-e443b2459e.
+    hash_pattern = re.compile(r"((?:Base|New)-[a-f0-9]{1,10})[a-f0-9]*")
+    error_pattern = re.compile("|".join(FASTCHESS_ERRORS))
+    warning_pattern = re.compile("|".join(FASTCHESS_WARNINGS))
+    warning_patterns = tuple(re.compile(pattern) for pattern in FASTCHESS_WARNINGS)
+
+    def __init__(self, new_name_long, base_name_long, stats, post_warning):
+        # stats: the crashes and time losses are counted in this dict.
+        # post_warning(message): posts a message to the event log.
+        self.base_name = self.shorten_hashes(base_name_long)
+        self.new_name = self.shorten_hashes(new_name_long)
+        self.release_names = frozenset(
+            self.shorten_hashes(name)
+            for name in (base_name_long, new_name_long)
+            if any(sha in name for sha in OFFICIAL_RELEASE_SHAS)
+        )
+        self.stats = stats
+        self.post_warning = post_warning
+        self.count_warnings = {}
+        self.crc = None
+        self.finished_match = False
+        self.WLD_results = None
+        self.ptnml_results = None
+
+    def shorten_hashes(self, line):
+        if "Base-" in line or "New-" in line:
+            return self.hash_pattern.sub(r"\1", line)
+        return line
+
+    def parse_line(self, line):
+        # Returns the line with shortened engine names, and the WLD and
+        # ptnml results if the line completes a block of results (else None).
+        # self.crc and self.finished_match are about this line only.
+        line = self.shorten_hashes(line)
+
+        # Do we have a pgn crc?
+        self.crc = line.split()[-1] if "has CRC32:" in line else None
+
+        self.finished_match = "Finished match" in line
+
+        if "Warning;" in line:
+            self.check_warning(line)
+
+        # Parse line like this:
+        # Finished game 1 (stockfish vs base): 0-1 {White disconnects}
+        if "disconnect" in line or "stall" in line:
+            self.stats["crashes"] += 1
+
+        if "on time" in line or "timeout" in line:
+            self.stats["time_losses"] += 1
+
+        # fastchess WLD and pentanomial output parsing.
+        if "Games: " in line:
+            m = self.pattern_WLD.search(line)
+            if m:
+                try:
+                    self.WLD_results = {
+                        "games": int(m.group(1)),
+                        "wins": int(m.group(2)),
+                        "losses": int(m.group(3)),
+                        "draws": int(m.group(4)),
+                        "points": float(m.group(5)),
+                    }
+                except Exception as e:
+                    raise WorkerException(
+                        f"Failed to parse WLD line: {line} leading to:\n{e}"
+                    )
+
+        if "Ptnml(0-2)" in line:
+            m = self.pattern_ptnml.search(line)
+            if m:
+                try:
+                    self.ptnml_results = [int(m.group(i)) for i in range(1, 6)]
+                except Exception as e:
+                    raise WorkerException(
+                        f"Failed to parse ptnml line: {line} leading to:\n{e}"
+                    )
+
+        # Have we parsed the block?
+        if self.WLD_results is None or self.ptnml_results is None:
+            return line, None
+        results = self.WLD_results, self.ptnml_results
+        self.WLD_results = None
+        self.ptnml_results = None
+        return line, results
+
+    def check_warning(self, line):
+        engine_names = frozenset(
+            name for name in (self.base_name, self.new_name) if name in line
+        )
+        if engine_names & self.release_names:
+            return
+
+        # Check line for fastchess errors.
+        if self.error_pattern.search(line):
+            message = f"fastchess says: '{line}'"
+            raise RunException(message)
+
+        # Post warnings to the event log: only the first warning per pattern
+        # and engine, followed by an exponential count.
+        if not self.warning_pattern.search(line):
+            return
+        for pattern in self.warning_patterns:
+            if not pattern.search(line):
+                continue
+
+            count, exponential = self.count_warnings.get(
+                (pattern, engine_names), (0, 1)
+            )
+            count += 1
+
+            if count == exponential:
+                message = (
+                    f"fastchess says: '{line}'"
+                    if count == 1
+                    else f"fastchess has so far said {count} times: '{pattern.pattern}' for {('+'.join(sorted(engine_names)) or 'None')}"
+                )
+                self.post_warning(message)
+                exponential *= 2
+
+            self.count_warnings[(pattern, engine_names)] = (count, exponential)
+
+
 def enqueue_output(stream, queue):
     for line in iter(stream.readline, ""):
         queue.put(line)
+    # Signal the end of the stream.
+    queue.put(None)
 
 
 def parse_fastchess_output(
@@ -1051,76 +1489,20 @@ def parse_fastchess_output(
         "The server told us that no more games are needed for the current task."
     )
 
-    official_release_shas = (
-        "e0bfc4b69bbe928d6f474a46560bcc3b3f6709aa",  # sf_17
-        "03e27488f3d21d8ff4dbf3065603afa21dbd0ef3",  # sf_17.1
-        "cb3d4ee9b47d0c5aae855b12379378ea1439675c",  # sf_18
-        "43a2be018606176d91f612e48a753bd6c8ed6cf7",  # used for SF18 PTs
-    )
-
-    def is_official_release(name):
-        return any(sha in name for sha in official_release_shas)
-
-    def shorten_hash(match):
-        word = match.group(0).split("-")
-        return "-".join([word[0], word[1][:10]])
-
-    hash_pattern = re.compile(r"(Base|New)-[a-f0-9]+")
-    base_name = hash_pattern.sub(shorten_hash, base_name_long)
-    new_name = hash_pattern.sub(shorten_hash, new_name_long)
-    release_names = frozenset(
-        hash_pattern.sub(shorten_hash, name)
-        for name in (base_name_long, new_name_long)
-        if is_official_release(name)
-    )
-
     saved_stats = copy.deepcopy(result["stats"])
 
-    # patterns used to obtain fastchess WLD and ptnml results from the following block of info:
-    # --------------------------------------------------
-    # Results of New-e443b2459e vs Base-e443b2459e (0.601+0.006, 1t, 16MB, UHO_Lichess_4852_v1.epd):
-    # Elo: -9.20 +/- 20.93, nElo: -11.50 +/- 26.11
-    # LOS: 19.41 %, DrawRatio: 42.35 %, PairsRatio: 0.88
-    # Games: 680, Wins: 248, Losses: 266, Draws: 166, Points: 331.0 (48.68 %)
-    # Ptnml(0-2): [43, 61, 144, 55, 37], WL/DD Ratio: 4.76
-    # --------------------------------------------------
-    pattern_WLD = re.compile(
-        r"Games: ([0-9]+), Wins: ([0-9]+), Losses: ([0-9]+), Draws: ([0-9]+), Points: ([0-9.]+) \("
-    )
-    pattern_ptnml = re.compile(
-        r"Ptnml\(0-2\): \[([0-9]+), ([0-9]+), ([0-9]+), ([0-9]+), ([0-9]+)\]"
-    )
-    fastchess_WLD_results = None
-    fastchess_ptnml_results = None
-    patterns_fastchess_error = (
-        # E.g. "Warning; New-SHA doesn't have option ThreatBySafePawn"
-        re.compile(r"Warning;.*doesn't have option"),
-        # E.g. "Warning; Invalid value for option P: -354"
-        re.compile(r"Warning; Invalid value for option"),
-        re.compile(r"Warning; Failed to set.*option"),
-        re.compile(r"Warning; No info line available to extract score from engine"),
-        # E.g. "Warning; Illegal move <none> played by New-SHA"
-        re.compile(r"Warning; Illegal move"),
-        re.compile(r"Warning; Could not extract score from engine"),
-        re.compile(r"Warning; Illegal PV move"),
-        re.compile(r"Warning; Move does not match uci move format"),
-        re.compile(r"Warning; PV continues after checkmate"),
-        re.compile(r"Warning; PV continues after stalemate"),
-        re.compile(r"Warning; PV continues after threefold"),
-        re.compile(r"Warning; PV continues after fifty-move rule"),
-        re.compile(r"Warning; Incomplete mating PV"),
-        re.compile(r"Warning; Too long mating PV"),
-        re.compile(r"Warning; Mating PV does not end with checkmate"),
-        re.compile(r"Warning; Bestmove does not match beginning of last PV"),
-        # E.g. "Warning; Sign mismatch in mate scores 3 and 1 from New-SHA (Black) and Base-SHA (White)"
-        re.compile(r"Warning; Sign mismatch in mate scores"),
-    )
-    patterns_fastchess_warning = (
-        # These warnings may indicate an engine crash, which may be hw related.
-        re.compile(r"Warning; Engine .* is not responsive"),
-        re.compile(r"Warning; Engine .* didn't respond"),
-        re.compile(r"Warning; No output from"),
-        re.compile(r"Warning; No bestmove found from"),
+    def post_warning(message):
+        post_to_worker_log(
+            worker_info,
+            password,
+            remote,
+            message,
+            run_id=run_id,
+            task_id=task_id,
+        )
+
+    parser = FastchessOutputParser(
+        new_name_long, base_name_long, result["stats"], post_warning
     )
 
     q = Queue()
@@ -1128,20 +1510,33 @@ def parse_fastchess_output(
     t_output.start()
     t_error = threading.Thread(target=enqueue_output, args=(p.stderr, q), daemon=True)
     t_error.start()
+    open_streams = 2
 
     end_time = datetime.now(timezone.utc) + timedelta(seconds=tc_limit)
     print(f"TC limit {tc_limit} End time: {end_time}")
 
     num_games_updated = 0
-    count_fastchess_warnings = {}
     while datetime.now(timezone.utc) < end_time:
         if current_state["task_id"] is None:
             # This task is no longer necessary.
             # Error message has already been printed.
             return False
         try:
-            line = q.get_nowait().strip()
+            line = q.get(timeout=FASTCHESS_READ_TIMEOUT)
         except Empty:
+            line = ""
+        if line is None:
+            open_streams -= 1
+            if open_streams > 0:
+                continue
+        if not line:
+            # Either fastchess has closed its output, or it has been silent
+            # for a while: check if it has exited.
+            if open_streams == 0:
+                try:
+                    p.wait(timeout=FASTCHESS_READ_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    pass
             returncode = p.poll()
             if returncode is not None:
                 if returncode != 0:
@@ -1150,18 +1545,16 @@ def parse_fastchess_output(
                         f"{format_returncode(returncode)}"
                     )
                 break
-            time.sleep(0.1)
             continue
 
-        line = hash_pattern.sub(shorten_hash, line)
+        line, block_results = parser.parse_line(line.strip())
         print(line, flush=True)
 
-        # Do we have a pgn crc?
-        if "has CRC32:" in line:
-            pgn_file["CRC"] = line.split()[-1]
+        if parser.crc is not None:
+            pgn_file["CRC"] = parser.crc
 
         # Have we reached the end of the match? Then just exit.
-        if "Finished match" in line:
+        if parser.finished_match:
             if num_games_updated == games_to_play:
                 print("Finished match cleanly.")
             else:
@@ -1169,83 +1562,9 @@ def parse_fastchess_output(
                     f"Finished match uncleanly {num_games_updated} vs. required {games_to_play}."
                 )
 
-        engine_names = frozenset(name for name in (base_name, new_name) if name in line)
-
-        # Check line for fastchess errors, exempting official releases.
-        if (
-            any(pattern.search(line) for pattern in patterns_fastchess_error)
-            and not engine_names & release_names
-        ):
-            message = f"fastchess says: '{line}'"
-            raise RunException(message)
-
-        # Check line for fastchess warnings, and post warnings that do not come
-        # from official releases to the event log.
-        # Post only the first warning per pattern and engine, followed by an exponential count.
-        for pattern in patterns_fastchess_warning:
-            if not pattern.search(line) or engine_names & release_names:
-                continue
-
-            count, exponential = count_fastchess_warnings.get(
-                (pattern, engine_names), (0, 1)
-            )
-            count += 1
-
-            if count == exponential:
-                message = (
-                    f"fastchess says: '{line}'"
-                    if count == 1
-                    else f"fastchess has so far said {count} times: '{pattern.pattern}' for {('+'.join(sorted(engine_names)) or 'None')}"
-                )
-                post_to_worker_log(
-                    worker_info,
-                    password,
-                    remote,
-                    message,
-                    run_id=run_id,
-                    task_id=task_id,
-                )
-                exponential *= 2
-
-            count_fastchess_warnings[(pattern, engine_names)] = (count, exponential)
-
-        # Parse line like this:
-        # Finished game 1 (stockfish vs base): 0-1 {White disconnects}
-        if "disconnect" in line or "stall" in line:
-            result["stats"]["crashes"] += 1
-
-        if "on time" in line or "timeout" in line:
-            result["stats"]["time_losses"] += 1
-
-        # fastchess WLD and pentanomial output parsing.
-        m = pattern_WLD.search(line)
-        if m:
-            try:
-                fastchess_WLD_results = {
-                    "games": int(m.group(1)),
-                    "wins": int(m.group(2)),
-                    "losses": int(m.group(3)),
-                    "draws": int(m.group(4)),
-                    "points": float(m.group(5)),
-                }
-            except Exception as e:
-                raise WorkerException(
-                    f"Failed to parse WLD line: {line} leading to:\n{e}"
-                )
-
-        m = pattern_ptnml.search(line)
-        if m:
-            try:
-                fastchess_ptnml_results = [int(m.group(i)) for i in range(1, 6)]
-            except Exception as e:
-                raise WorkerException(
-                    f"Failed to parse ptnml line: {line} leading to:\n{e}"
-                )
-
         # If we have parsed the block properly let's update results.
-        if (fastchess_ptnml_results is not None) and (
-            fastchess_WLD_results is not None
-        ):
+        if block_results is not None:
+            fastchess_WLD_results, fastchess_ptnml_results = block_results
             result["stats"]["pentanomial"] = [
                 fastchess_ptnml_results[i] + saved_stats["pentanomial"][i]
                 for i in range(5)
@@ -1279,9 +1598,6 @@ def parse_fastchess_output(
             assert num_games_finished <= num_games_updated + batch_size
             assert num_games_finished <= games_to_play
 
-            fastchess_ptnml_results = None
-            fastchess_WLD_results = None
-
             # Send an update_task request after a batch is full or if we have played all games.
             if (num_games_finished == num_games_updated + batch_size) or (
                 num_games_finished == games_to_play
@@ -1541,7 +1857,7 @@ def run_games(
     def book_is_healthy(book, book_sri):
         if book.exists():
             try:
-                sri = text_hash(book)
+                sri = cached_hash(book, text_hash)
                 if sri != book_sri:
                     print(
                         f"Book {book} has sri {sri} whereas "
@@ -1556,15 +1872,16 @@ def run_games(
         print(f"Book {book} does not exist...")
         return False
 
-    if not book_is_healthy(testing_dir / book, book_sri):
-        zipball = book + ".zip"
-        blob = download_from_github(zipball)
-        unzip(blob, testing_dir)
+    def establish_book():
         if not book_is_healthy(testing_dir / book, book_sri):
-            raise WorkerException(f"Failed to match sri for book {book}.")
+            zipball = book + ".zip"
+            blob = download_from_github(zipball)
+            unzip(blob, testing_dir)
+            if not book_is_healthy(testing_dir / book, book_sri):
+                raise WorkerException(f"Failed to match sri for book {book}.")
 
-    print(f"Using book {testing_dir / book}...")
-    update_atime(testing_dir / book)
+        print(f"Using book {testing_dir / book}...")
+        update_atime(testing_dir / book)
 
     def format_fastchess_options(options):
         return [
@@ -1576,76 +1893,113 @@ def run_games(
     new_options = format_fastchess_options(new_options)
     base_options = format_fastchess_options(base_options)
 
-    # Build new and base engines from sources as needed.
+    # The task is prepared by a pipeline: the book and, for each engine, the
+    # build, the networks and the signature check run concurrently, so that
+    # downloads overlap with compilation. The engines which have to be
+    # compiled share the make jobs. The nps benches need an otherwise idle
+    # machine, so they run only once both engines are ready.
     concurrency = worker_info["concurrency"]
     compiler = worker_info["compiler"]
     version = worker_info["gcc_version"]
 
-    new_engine = setup_engine(
-        testing_dir,
-        remote,
-        run["args"]["resolved_new"],
-        repo_url,
-        concurrency,
-        compiler,
-        version,
-        global_cache,
-    )
-    base_engine = setup_engine(
-        testing_dir,
-        remote,
-        run["args"]["resolved_base"],
-        repo_url,
-        concurrency,
-        compiler,
-        version,
-        global_cache,
+    preparation_start = time.monotonic()
+    roles = {}
+    for role in ("base", "new"):
+        roles.setdefault(run["args"][f"resolved_{role}"], []).append(role)
+    num_builds = sum(
+        cached_engine(testing_dir, sha, compiler, version) is None for sha in roles
     )
+    jobs = max(1, concurrency // max(1, num_builds))
 
-    # Ensure we are back in the testing directory
-    os.chdir(testing_dir)
+    timings = {}
+
+    def timed(phase, function, *args):
+        start = time.monotonic()
+        try:
+            return function(*args)
+        finally:
+            timings[phase] = time.monotonic() - start
 
-    # Add EvalFile* with full path to fastchess options, and download the networks if missing.
-    for option, net in required_nets(base_engine).items():
+    def establish_nets(engine):
+        nets = required_nets(engine)
+        for net in nets.values():
+            establish_validated_net(remote, testing_dir, net, global_cache)
+        return nets
+
+    def verify_signatures(engine, engine_roles):
+        errors = []
+        for signature in dict.fromkeys(
+            run["args"][f"{role}_signature"] for role in engine_roles
+        ):
+            try:
+                verify_signature(engine, signature)
+            except RunException as e:
+                errors.append(str(e))
+        return errors
+
+    def prepare_engine(sha, engine_roles):
+        label = "+".join(engine_roles)
+        engine = timed(
+            f"{label} build",
+            setup_engine,
+            testing_dir,
+            remote,
+            sha,
+            repo_url,
+            jobs,
+            compiler,
+            version,
+            global_cache,
+        )
+        nets = timed(f"{label} nets", establish_nets, engine)
+        cpu_features = get_cpu_features(engine)
+        errors = timed(f"{label} verify", verify_signatures, engine, engine_roles)
+        return engine, nets, cpu_features, errors
+
+    with ThreadPoolExecutor(max_workers=1 + len(roles)) as executor:
+        book_future = executor.submit(timed, "book", establish_book)
+        futures = {
+            sha: executor.submit(prepare_engine, sha, engine_roles)
+            for sha, engine_roles in roles.items()
+        }
+        book_future.result()
+        prepared = {sha: future.result() for sha, future in futures.items()}
+
+    base_engine, base_nets, cpu_features, base_errors = prepared[
+        run["args"]["resolved_base"]
+    ]
+    new_engine, new_nets, _, new_errors = prepared[run["args"]["resolved_new"]]
+
+    # Add EvalFile* with full path to fastchess options.
+    for option, net in base_nets.items():
         base_options.append(f"option.{option}={net}")
-        establish_validated_net(remote, testing_dir, net, global_cache)
 
-    for option, net in required_nets(new_engine).items():
+    for option, net in new_nets.items():
         new_options.append(f"option.{option}={net}")
-        establish_validated_net(remote, testing_dir, net, global_cache)
 
     # PGN files output setup.
     pgn_name = f"results-{run['_id']}-{task_id}.pgn"
     pgn_file["name"] = testing_dir / pgn_name
     pgn_file["CRC"] = None
 
-    # Verify that the signatures are correct.
-    run_errors = []
-    try:
-        cpu_features = get_cpu_features(base_engine)
-        verify_signature(base_engine, run["args"]["base_signature"])
-        base_nps = get_bench_nps(base_engine, games_concurrency, threads, base_hash)
-    except RunException as e:
-        run_errors.append(str(e))
-    except WorkerException as e:
-        raise e
+    # Handle wrong signatures if any.
+    run_errors = base_errors if new_engine == base_engine else base_errors + new_errors
+    if run_errors:
+        raise RunException("\n".join(run_errors))
 
+    start = time.monotonic()
+    base_nps = get_bench_nps(base_engine, games_concurrency, threads, base_hash)
     if not (
         run["args"]["base_signature"] == run["args"]["new_signature"]
         and new_engine == base_engine
     ):
-        try:
-            _ = get_cpu_features(new_engine)
-            verify_signature(new_engine, run["args"]["new_signature"])
-            _ = get_bench_nps(new_engine, games_concurrency, threads, new_hash)
-        except RunException as e:
-            run_errors.append(str(e))
-        except WorkerException as e:
-            raise e
-
-    # Handle exceptions if any.
-    if run_errors:
-        raise RunException("\n".join(run_errors))
+        _ = get_bench_nps(new_engine, games_concurrency, threads, new_hash)
+    timings["benches"] = time.monotonic() - start
+
+    print(
+        f"Task prepared in {time.monotonic() - preparation_start:.1f}s: "
+        + ", ".join(f"{phase} {seconds:.1f}s" for phase, seconds in timings.items())
+    )
 
     # Fishtest with Stockfish 11 used 1.6 Mnps as the reference and 0.7 Mnps
     # as the slow-worker threshold. The new reference (628000 nps) and
@@ -1,13 +1,17 @@
 """Test worker setup, downloads, and command-line behavior."""
 
+import gzip
 import os
 import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import unittest
+import zlib
 from configparser import ConfigParser
 from pathlib import Path
+from unittest import mock
 
 import games
 import updater
@@ -112,6 +116,120 @@ class WorkerTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             conc("999")
 
+    def test_cached_hash(self):
+        book = self.tempdir / "testing" / "book.epd"
+        book.write_bytes(b"8/8/8/8/8/8/8/8 w - -\r\n" * 1000)
+        sri = games.text_hash(book)
+        self.assertEqual(games.cached_hash(book, games.text_hash), sri)
+
+        # The cached hash is used as long as the file is unchanged.
+        calls = []
+
+        def counting_hash(file):
+            calls.append(file)
+            return games.file_sha256(file)
+
+        digest = games.cached_hash(book, counting_hash)
+        self.assertEqual(games.cached_hash(book, counting_hash), digest)
+        self.assertEqual(len(calls), 1)
+        book.write_bytes(b"8/8/8/8/8/8/8/8 b - -\n")
+        self.assertNotEqual(games.cached_hash(book, counting_hash), digest)
+        self.assertEqual(len(calls), 2)
+
+    @unittest.skipIf(os.name == "nt", "uses a shell script as engine")
+    def test_engine_cache(self):
+        cache = self.tempdir / "cache"
+        cache.mkdir()
+        engine = self.tempdir / "stockfish"
+        engine.write_text("#!/bin/sh\nexit 0\n")
+        engine.chmod(0o755)
+        key = games.engine_cache_key("abc", "g++_13_2_0", "x86-64-avx2", "0123", "g++")
+        games.engine_cache_write(str(cache), key, engine)
+
+        copy = self.tempdir / "testing" / "stockfish-copy"
+        self.assertTrue(games.engine_cache_read(str(cache), key, copy))
+        self.assertEqual(copy.read_bytes(), engine.read_bytes())
+
+        # A corrupted binary is removed from the cache.
+        (blob,) = cache.glob("engine-*")
+        blob.write_text("#!/bin/sh\nexit 1\n")
+        self.assertFalse(games.engine_cache_read(str(cache), key, copy))
+        self.assertEqual(list(cache.iterdir()), [])
+
+        games.engine_cache_write(str(cache), key, engine)
+        games.engine_cache_evict(str(cache), max_bytes=0)
+        self.assertFalse(games.engine_cache_read(str(cache), key, copy))
+
+    def test_background_pgn_upload(self):
+        pgn = self.tempdir / "testing" / "results-run-0.pgn"
+        pgn.write_bytes(b'[Event "?"]\n\n1. e4 e5 *\n' * 1000)
+        crc = hex(zlib.crc32(pgn.read_bytes()))
+        uploads = []
+
+        def send_api_stream_request(api_url, payload, chunks, quiet=False):
+            uploads.append((api_url, payload, gzip.decompress(b"".join(chunks))))
+
+        current_state = {"pgn_upload": None}
+        with mock.patch.object(
+            worker, "send_api_stream_request", send_api_stream_request
+        ):
+            for crc_expected in (crc, "0x0"):
+                upload_thread = threading.Thread(
+                    target=worker.upload_pgn,
+                    args=(pgn, crc_expected, "remote", {"run_id": "run"}),
+                )
+                upload_thread.start()
+                current_state["pgn_upload"] = upload_thread
+                worker.wait_for_pgn_upload(current_state)
+                self.assertIsNone(current_state["pgn_upload"])
+
+        # The upload with a bad checksum is skipped.
+        self.assertEqual(
+            uploads,
+            [("remote/api/upload_pgn_stream", {"run_id": "run"}, pgn.read_bytes())],
+        )
+
+    def test_fastchess_output_parser(self):
+        new = "New-e443b2459e5a3d2c5f7e38c1b0a2d4e5f6a7b8c9"
+        base = "Base-e0bfc4b69bbe928d6f474a46560bcc3b3f6709aa"  # sf_17
+        stats = {"crashes": 0, "time_losses": 0}
+        warnings = []
+        parser = games.FastchessOutputParser(new, base, stats, warnings.append)
+
+        line, results = parser.parse_line(
+            f"Finished game 1 ({new} vs {base}): 0-1 {{White loses on time}}"
+        )
+        self.assertIn("New-e443b2459e vs Base-e0bfc4b69b", line)
+        self.assertIsNone(results)
+        self.assertEqual(stats["time_losses"], 1)
+
+        # The end of the match and the pgn crc are reported on their line only.
+        parser.parse_line("Finished match")
+        self.assertTrue(parser.finished_match)
+        parser.parse_line("File results.pgn has CRC32: 0x1234abcd")
+        self.assertEqual(parser.crc, "0x1234abcd")
+        self.assertFalse(parser.finished_match)
+        parser.parse_line("Saved results.")
+        self.assertIsNone(parser.crc)
+        self.assertFalse(parser.finished_match)
+
+        _, results = parser.parse_line(
+            "Games: 2, Wins: 1, Losses: 0, Draws: 1, Points: 1.5 (75.00 %)"
+        )
+        self.assertIsNone(results)
+        _, results = parser.parse_line("Ptnml(0-2): [0, 0, 0, 1, 0], WL/DD Ratio: 0")
+        self.assertEqual(results[1], [0, 0, 0, 1, 0])
+        self.assertEqual(results[0]["points"], 1.5)
+
+        for _ in range(3):
+            parser.parse_line(f"Warning; Engine {new} is not responsive")
+        self.assertEqual(len(warnings), 2)
+
+        # Official releases are exempt from errors, other engines are not.
+        parser.parse_line(f"Warning; Illegal move e2e5 played by {base}")
+        with self.assertRaises(games.RunException):
+            parser.parse_line(f"Warning; Illegal move e2e5 played by {new}")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,10 +1,8 @@
 #!/usr/bin/env python3
-import base64
+import codecs
 import getpass
-import gzip
 import hashlib
 import importlib
-import io
 import json
 import multiprocessing
 import os
@@ -56,6 +54,7 @@ from games import (
     requests_get,
     run_games,
     send_api_post_request,
+    send_api_stream_request,
     str_signal,
     text_hash,
     trim_files,
@@ -74,12 +73,20 @@ MIN_CLANG_MINOR = 0
 
 FASTCHESS_SHA = "58072f231dc1ae33204254f867afd0a195f21a2e"
 
-WORKER_VERSION = 325
+WORKER_VERSION = 332
 FILE_LIST = ["updater.py", "worker.py", "games.py"]
 HTTP_TIMEOUT = 30.0
+PGN_CHUNK_SIZE = 1024 * 1024
 INITIAL_RETRY_TIME = 15.0
 THREAD_JOIN_TIMEOUT = 15.0
+PGN_UPLOAD_JOIN_TIMEOUT = 300.0
 MAX_RETRY_TIME = 900.0  # 15 minutes
+# Between two tasks the worker checks its version and trims the testing
+# directory at most once per HOUSEKEEPING_INTERVAL (and after a failure).
+# The remaining GitHub api calls are probed in the background.
+HOUSEKEEPING_INTERVAL = 600.0  # 10 minutes
+GITHUB_QUOTA_INTERVAL = 60.0
+NEAR_GITHUB_API_LIMIT = 10
 
 # We do not import "google.colab" directly since it is not used
 # and there are subtleties involved in deleting it after import
@@ -124,8 +131,9 @@ Apis used by the worker
 
 Heartbeat           <fishtest>/api/beat                                         POST
 
-Setup task          <github>/rate_limit                                         GET
-                    <fishtest>/api/request_version                              POST
+GitHub quota probe  <github>/rate_limit                                         GET
+
+Setup task          <fishtest>/api/request_version                              POST
                     <fishtest>/api/request_task                                 POST
                     <fishtest>/api/nn/<nnue>                                    GET
                     <github-books>/git/trees/master                             GET
@@ -138,11 +146,18 @@ Main loop           <fishtest>/api/update_task
 
 Finish task         <fishtest>/api/failed_task                                  POST
                     <fishtest>/api/stop_run                                     POST
-                    <fishtest>/api/upload_pgn                                   POST
+                    <fishtest>/api/upload_pgn_stream             [background]   POST
+
+The version check (request_version) is skipped if it was done less than
+HOUSEKEEPING_INTERVAL ago, the GitHub quota probe runs in its own thread and
+the PGN of a task is uploaded in the background while the next task is
+fetched and set up.
 
 
-The POST requests are json encoded. For the shape of a valid request, consult
-"api.py" in the Fishtest source.
+The POST requests are json encoded, except for upload_pgn_stream whose body is
+the gzip compressed pgn, with the json request in the X-Fishtest-Request header
+(base64 encoded). For the shape of a valid request, consult "api.py" in the
+Fishtest source.
 
 The POST requests return a json encoded dictionary. It may contain a key "error".
 In that case the corresponding value is an error message.
@@ -1236,6 +1251,73 @@ def heartbeat(worker_info, password, remote, current_state):
         print("Heartbeat stopped.")
 
 
+def github_quota(current_state):
+    # Probe the remaining GitHub api calls in the background, so that
+    # fetch_and_handle_task() does not wait for the GitHub api.
+    print("Start GitHub quota probe.")
+    last_probe = time.monotonic()
+    while current_state["alive"]:
+        time.sleep(1)
+        if time.monotonic() - last_probe < GITHUB_QUOTA_INTERVAL:
+            continue
+        last_probe = time.monotonic()
+        current_state["remaining_github_api_calls"] = get_remaining_github_api_calls()
+    else:
+        print("GitHub quota probe stopped.")
+
+
+def file_chunks(path):
+    with open(path, "rb") as f:
+        yield from iter(lambda: f.read(PGN_CHUNK_SIZE), b"")
+
+
+def gzip_pgn_chunks(path, sizes):
+    # Stream the gzip of the file, dropping non UTF-8 characters.
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    for chunk in file_chunks(path):
+        data = compressor.compress(decoder.decode(chunk).encode())
+        sizes.append(len(data))
+        if data:
+            yield data
+    data = compressor.compress(decoder.decode(b"", final=True).encode())
+    data += compressor.flush()
+    sizes.append(len(data))
+    yield data
+
+
+def upload_pgn(pgn_file, crc_expected, remote, payload):
+    try:
+        crc = 0
+        for chunk in file_chunks(pgn_file):
+            crc = zlib.crc32(chunk, crc)
+        crc_actual = hex(crc)
+
+        # Check that the file is not corrupted
+        if crc_actual != crc_expected:
+            print(
+                f"Checksum of file ({crc_actual}) does not match expected value ({crc_expected}).\nSkipping upload."
+            )
+            return
+        sizes = []
+        send_api_stream_request(
+            remote + "/api/upload_pgn_stream",
+            payload,
+            gzip_pgn_chunks(pgn_file, sizes),
+        )
+        print(f"Uploaded compressed PGN of {sum(sizes)} bytes.")
+    except Exception as e:
+        print(f"\nException uploading PGN file:\n{e}", file=sys.stderr)
+
+
+def wait_for_pgn_upload(current_state, timeout=None):
+    upload_thread = current_state["pgn_upload"]
+    if upload_thread is not None and upload_thread.is_alive():
+        print("Waiting for the PGN upload to finish...")
+        upload_thread.join(timeout)
+    current_state["pgn_upload"] = None
+
+
 def utcoffset():
     dst = time.localtime().tm_isdst == 1 and time.daylight != 0
     utcoffset = -time.altzone if dst else -time.timezone
@@ -1294,20 +1376,31 @@ def fetch_and_handle_task(
         f"Current time is {datetime.now(timezone.utc)} UTC (local offset: {utcoffset()})."
     )
 
-    # Check the worker version and upgrade if necessary
-    ret = verify_worker_version(remote, worker_info["username"], password, worker_lock)
-    if ret is False:
-        current_state["alive"] = False
-    if not ret:
-        return False
+    last_housekeeping = current_state["last_housekeeping"]
+    if (
+        last_housekeeping is None
+        or time.monotonic() - last_housekeeping >= HOUSEKEEPING_INTERVAL
+    ):
+        # An update restarts the worker.
+        wait_for_pgn_upload(current_state)
+
+        # Check the worker version and upgrade if necessary
+        ret = verify_worker_version(
+            remote, worker_info["username"], password, worker_lock
+        )
+        if ret is False:
+            current_state["alive"] = False
+        if not ret:
+            return False
 
-    # Clean up old files:
-    trim_files(worker_dir / "testing")
+        # Clean up old files:
+        trim_files(worker_dir / "testing")
+        current_state["last_housekeeping"] = time.monotonic()
 
     # Verify if we still have enough GitHub api calls
-    remaining = get_remaining_github_api_calls()
+    remaining = current_state["remaining_github_api_calls"]
     print(f"Remaining number of GitHub api calls = {remaining}.")
-    near_github_api_limit = remaining <= 10
+    near_github_api_limit = remaining <= NEAR_GITHUB_API_LIMIT
     if near_github_api_limit:
         print(
             """
@@ -1412,19 +1505,6 @@ def fetch_and_handle_task(
         except Exception as e:
             print(f"Exception posting failed_task:\n{e}", file=sys.stderr)
 
-    def upload_pgn_data(pgn_data, run_id, task_id, remote, payload):
-        with io.BytesIO() as gz_buffer:
-            with gzip.GzipFile(
-                filename=f"{str(run_id)}-{task_id}.pgn.gz",
-                mode="wb",
-                fileobj=gz_buffer,
-            ) as gz:
-                gz.write(pgn_data.encode())
-            payload["pgn"] = base64.b64encode(gz_buffer.getvalue()).decode()
-
-        print(f"Uploading compressed PGN of {len(payload['pgn'])} bytes.")
-        send_api_post_request(remote + "/api/upload_pgn", payload)
-
     if (
         not pgn_file["name"]
         or not pgn_file["name"].exists()
@@ -1433,27 +1513,21 @@ def fetch_and_handle_task(
         print("Task exited")
         return success
 
-    crc_expected = pgn_file["CRC"]
-    pgn_file = pgn_file["name"]
-
-    # Upload PGN file.
+    # Upload the PGN file in the background, while the next task is fetched.
     if "spsa" not in run["args"]:
-        try:
-            file_content = pgn_file.read_bytes()
-
-            crc_actual = hex(zlib.crc32(file_content))
-
-            # Check that the file is not corrupted
-            if crc_actual != crc_expected:
-                print(
-                    f"Checksum of file ({crc_actual}) does not match expected value ({crc_expected}).\nSkipping upload."
-                )
-            else:
-                # Decode bytes to text, ignoring non UTF-8 characters
-                data = file_content.decode("utf-8", errors="ignore")
-                upload_pgn_data(data, run["_id"], task_id, remote, payload)
-        except Exception as e:
-            print(f"\nException uploading PGN file:\n{e}", file=sys.stderr)
+        wait_for_pgn_upload(current_state)
+        upload_thread = threading.Thread(
+            target=upload_pgn,
+            args=(
+                pgn_file["name"],
+                pgn_file["CRC"],
+                remote,
+                dict(payload, worker_info=dict(worker_info)),
+            ),
+            daemon=True,
+        )
+        upload_thread.start()
+        current_state["pgn_upload"] = upload_thread
 
     print("Task exited.")
     return success
@@ -1493,6 +1567,9 @@ def worker():
         "last_updated": datetime.now(
             timezone.utc
         ),  # tracks the last update to the server
+        "last_housekeeping": None,  # see HOUSEKEEPING_INTERVAL
+        "remaining_github_api_calls": 0,  # updated by the GitHub quota probe
+        "pgn_upload": None,  # the thread uploading the last PGN
     }
 
     # Install signal handlers.
@@ -1597,6 +1674,14 @@ def worker():
     )
     heartbeat_thread.start()
 
+    # Probe the GitHub api calls once before the first task, then in the
+    # background.
+    current_state["remaining_github_api_calls"] = get_remaining_github_api_calls()
+    github_quota_thread = threading.Thread(
+        target=github_quota, args=(current_state,), daemon=True
+    )
+    github_quota_thread.start()
+
     # If fleet==True then the worker will quit if it is unable to obtain
     # or execute a task. If fleet==False then the worker will go to the
     # next iteration of the main loop.
@@ -1626,6 +1711,8 @@ def worker():
         elif not current_state["alive"]:  # the user may have pressed Ctrl-C...
             break
         elif not success:
+            # Check the version again before the next attempt.
+            current_state["last_housekeeping"] = None
             if options.fleet:
                 current_state["alive"] = False
                 print("Exiting the worker since fleet==True and an error occurred.")
@@ -1641,12 +1728,17 @@ def worker():
         print("Removing fish.exit file.")
         (worker_dir / "fish.exit").unlink()
 
+    wait_for_pgn_upload(current_state, timeout=PGN_UPLOAD_JOIN_TIMEOUT)
+
     print("Releasing the worker lock.")
     worker_lock.release()
 
     print("Waiting for the heartbeat thread to finish...")
     heartbeat_thread.join(THREAD_JOIN_TIMEOUT)
 
+    print("Waiting for the GitHub quota probe to finish...")
+    github_quota_thread.join(THREAD_JOIN_TIMEOUT)
+
     return 0 if fish_exit else 1
 
 